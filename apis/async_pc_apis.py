@@ -0,0 +1,712 @@
+# encoding: utf-8
+import asyncio
+import contextlib
+import os
+import time
+import urllib
+import aiohttp
+from loguru import logger
+from apis.pc_apis import XHS_Apis
+from xhs_utils.circuit_breaker import get_circuit_breaker
+from xhs_utils.deadline import DeadlineExceeded, remaining_time
+from xhs_utils.proxy_pool import get_proxy_pool
+from xhs_utils.rate_limiter import get_rate_limiter, is_throttled
+from xhs_utils.request_executor import RETRY_STATUS_CODES, RetryPolicy, classify_failure
+from xhs_utils.xhs_util import splice_str, generate_request_params, generate_request_params_batch, generate_x_b3_traceid
+
+"""
+    小红书api的asyncio版本，接口与 XHS_Apis 相同，所有方法都是协程
+    async with AsyncXHS_Apis() as xhs_apis:
+        success, msg, user_info = await xhs_apis.get_user_info(user_id, cookies_str)
+"""
+class AsyncXHS_Apis():
+    def __init__(self, proxies: dict = None, concurrency: int = None, per_account: int = None, pool_maxsize: int = None):
+        """
+            :param proxies: 所有接口默认使用的代理，单次调用传入的proxies会覆盖
+            :param concurrency: 同时进行的请求数上限，默认从环境变量XHS_ASYNC_CONCURRENCY读取，默认32
+            :param per_account: 同一个账号同时进行的请求数上限，默认从环境变量XHS_ASYNC_PER_ACCOUNT读取，默认4
+            :param pool_maxsize: 每个主机保持的最大连接数，默认从环境变量HTTP_POOL_MAXSIZE读取
+        """
+        self.base_url = "https://edith.xiaohongshu.com"
+        self.proxies = proxies
+        self.concurrency = concurrency if concurrency is not None else int(os.getenv('XHS_ASYNC_CONCURRENCY', '32'))
+        self.per_account = per_account if per_account is not None else int(os.getenv('XHS_ASYNC_PER_ACCOUNT', '4'))
+        self.pool_maxsize = pool_maxsize if pool_maxsize is not None else int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+        self.request_count = 0
+        self.retry_count = 0
+        self.retry_policy = RetryPolicy()
+        # 连接池和信号量必须在事件循环中创建，第一次请求时初始化
+        self.session = None
+        self._semaphore = None
+        self._account_semaphores = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.pool_maxsize)
+            # cookies由每次请求显式传入，不保存响应中的Set-Cookie
+            self.session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._account_semaphores = {}
+        return self.session
+
+    def _account_semaphore(self, cookies: dict):
+        account = cookies.get('a1', '')
+        if account not in self._account_semaphores:
+            self._account_semaphores[account] = asyncio.Semaphore(self.per_account)
+        return self._account_semaphores[account]
+
+    def _proxy(self, proxies):
+        proxies = proxies or self.proxies
+        if not proxies:
+            return None
+        return proxies.get('https') or proxies.get('http')
+
+    @staticmethod
+    def _lease_proxy(proxy_pool):
+        """
+            从代理池中占用一个代理，不使用代理池时返回空的上下文
+        """
+        if proxy_pool is None:
+            return contextlib.nullcontext()
+        return proxy_pool.alease()
+
+    async def _send(self, method, api, headers, cookies, data, proxies):
+        """
+            发送已签名的请求，受全局和账号并发数限制，幂等接口遇到网络错误或5xx时重试；
+            调用方和实例都没有指定代理时，每次请求从代理池中选择代理
+            返回(success, msg, res_json)
+        """
+        res_json = None
+        try:
+            session = self._ensure_session()
+            headers = dict(headers)
+            headers['cookie'] = '; '.join(f'{key}={value}' for key, value in cookies.items())
+            if isinstance(data, str):
+                data = data.encode('utf-8')
+            endpoint = api.split('?')[0]
+            attempts = self.retry_policy.attempts(method, endpoint)
+            # 与同步接口共用限速器、熔断器和代理池
+            limiter = get_rate_limiter()
+            circuit_breaker = get_circuit_breaker()
+            proxy_pool = get_proxy_pool()
+            proxy = self._proxy(proxies)
+            if proxy is not None or len(proxy_pool) == 0:
+                proxy_pool = None
+            for attempt in range(attempts):
+                probe = circuit_breaker.check()
+                try:
+                    # 在占用并发名额前等待令牌
+                    wait = limiter.reserve(endpoint, cookies.get('a1'))
+                    if wait > 0:
+                        remaining = remaining_time()
+                        if remaining is not None and wait >= remaining:
+                            raise DeadlineExceeded(f'等待限速 {wait:.1f} 秒会超过本轮剩余时间')
+                        await asyncio.sleep(wait)
+                    connect_timeout, read_timeout = self.retry_policy.timeout()
+                    remaining = remaining_time()
+                    timeout = aiohttp.ClientTimeout(total=remaining, sock_connect=connect_timeout, sock_read=read_timeout)
+                    retry_reason = None
+                    status = None
+                    # 先占用账号名额再占用全局名额，同一账号排队的请求不会占满全局名额而阻塞其他账号
+                    async with self._account_semaphore(cookies), self._semaphore, self._lease_proxy(proxy_pool) as lease:
+                        self.request_count += 1
+                        start_time = time.monotonic()
+                        try:
+                            async with session.request(method, self.base_url + api, headers=headers, data=data or None,
+                                                       proxy=lease.endpoint.url if lease is not None else proxy,
+                                                       timeout=timeout) as response:
+                                status = response.status
+                                try:
+                                    res_json = await response.json(content_type=None)
+                                except ValueError:
+                                    res_json = None
+                        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                            limiter.observe(time.monotonic() - start_time, throttled=True)
+                            if lease is not None:
+                                lease.record(failed=True)
+                            if probe:
+                                # 网络错误不计入熔断，但试探请求出错同样视为试探失败
+                                circuit_breaker.record(True, f'试探请求出错: {e!r}', probe=True)
+                            if attempt + 1 >= attempts:
+                                raise
+                            retry_reason = repr(e)
+                        except Exception:
+                            limiter.observe(time.monotonic() - start_time, throttled=True)
+                            raise
+                        else:
+                            latency = time.monotonic() - start_time
+                            throttled = is_throttled(status, res_json)
+                            limiter.observe(latency, throttled)
+                            circuit_breaker.record(*classify_failure(status, res_json, throttled), probe=probe)
+                            if lease is not None:
+                                # 被限流通常是出口IP的请求过多，同样计入代理的失败率
+                                lease.record(latency, failed=throttled or status in RETRY_STATUS_CODES)
+                            if status in RETRY_STATUS_CODES and attempt + 1 < attempts:
+                                retry_reason = f'HTTP {status}'
+                except BaseException as e:
+                    # 试探请求出错或被取消时记为试探失败，熔断器不会一直等待试探结果
+                    if probe:
+                        circuit_breaker.record(True, f'试探请求出错: {e!r}', probe=True)
+                    raise
+                if retry_reason is None:
+                    break
+                # 退避等待时不占用并发名额和代理
+                delay = self.retry_policy.wait_before_retry(attempt)
+                if delay is None:
+                    # 剩余时间不够重试：网络错误直接失败，5xx响应按原样返回
+                    if status is None:
+                        raise Exception(retry_reason)
+                    break
+                self.retry_count += 1
+                logger.warning(f'请求 {endpoint} 失败: {retry_reason}，{delay:.1f} 秒后第 {attempt + 1} 次重试')
+                await asyncio.sleep(delay)
+            if res_json is None:
+                raise Exception(f'接口返回的不是JSON (HTTP {status})')
+            success, msg = res_json["success"], res_json["msg"]
+        except Exception as e:
+            success = False
+            msg = str(e)
+        return success, msg, res_json
+
+    async def _get(self, api, cookies_str, proxies=None):
+        try:
+            # 签名会等待签名进程返回，放到线程中执行避免阻塞事件循环
+            headers, cookies, data = await asyncio.to_thread(generate_request_params, cookies_str, api)
+        except Exception as e:
+            return False, str(e), None
+        return await self._send('GET', api, headers, cookies, None, proxies)
+
+    async def _post(self, api, data, cookies_str, proxies=None):
+        try:
+            headers, cookies, data = await asyncio.to_thread(generate_request_params, cookies_str, api, data)
+        except Exception as e:
+            return False, str(e), None
+        return await self._send('POST', api, headers, cookies, data, proxies)
+
+    @staticmethod
+    def _parse_user_url(user_url: str, default_source: str):
+        urlParse = urllib.parse.urlparse(user_url)
+        user_id = urlParse.path.split("/")[-1]
+        kvs = urlParse.query.split('&')
+        kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
+        xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
+        xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else default_source
+        return user_id, xsec_token, xsec_source
+
+    async def get_homefeed_all_channel(self, cookies_str: str, proxies: dict = None):
+        """
+            获取主页的所有频道
+        """
+        return await self._get("/api/sns/web/v1/homefeed/category", cookies_str, proxies)
+
+    async def get_homefeed_recommend(self, category, cursor_score, refresh_type, note_index, cookies_str: str, proxies: dict = None):
+        """
+            获取主页推荐的笔记
+        """
+        data = {
+            "cursor_score": cursor_score,
+            "num": 20,
+            "refresh_type": refresh_type,
+            "note_index": note_index,
+            "unread_begin_note_id": "",
+            "unread_end_note_id": "",
+            "unread_note_count": 0,
+            "category": category,
+            "search_key": "",
+            "need_num": 10,
+            "image_formats": [
+                "jpg",
+                "webp",
+                "avif"
+            ],
+            "need_filter_image": False
+        }
+        return await self._post("/api/sns/web/v1/homefeed", data, cookies_str, proxies)
+
+    async def get_homefeed_recommend_by_num(self, category, require_num, cookies_str: str, proxies: dict = None):
+        """
+            根据数量获取主页推荐的笔记
+        """
+        cursor_score, refresh_type, note_index = "", 1, 0
+        note_list = []
+        try:
+            while True:
+                success, msg, res_json = await self.get_homefeed_recommend(category, cursor_score, refresh_type, note_index, cookies_str, proxies)
+                if not success:
+                    raise Exception(msg)
+                if "items" not in res_json["data"]:
+                    break
+                notes = res_json["data"]["items"]
+                note_list.extend(notes)
+                cursor_score = res_json["data"]["cursor_score"]
+                refresh_type = 3
+                note_index += 20
+                if len(note_list) > require_num:
+                    break
+        except Exception as e:
+            success = False
+            msg = str(e)
+        if len(note_list) > require_num:
+            note_list = note_list[:require_num]
+        return success, msg, note_list
+
+    async def get_user_info(self, user_id: str, cookies_str: str, proxies: dict = None):
+        """
+            获取用户的信息
+        """
+        splice_api = splice_str("/api/sns/web/v1/user/otherinfo", {"target_user_id": user_id})
+        return await self._get(splice_api, cookies_str, proxies)
+
+    async def get_user_self_info(self, cookies_str: str, proxies: dict = None):
+        """
+            获取用户自己的信息1
+        """
+        return await self._get("/api/sns/web/v1/user/selfinfo", cookies_str, proxies)
+
+    async def get_user_self_info2(self, cookies_str: str, proxies: dict = None):
+        """
+            获取用户自己的信息2
+        """
+        return await self._get("/api/sns/web/v2/user/me", cookies_str, proxies)
+
+    async def _get_user_note_page(self, api, user_id, cursor, cookies_str, xsec_token, xsec_source, proxies):
+        params = {
+            "num": "30",
+            "cursor": cursor,
+            "user_id": user_id,
+            "image_formats": "jpg,webp,avif",
+            "xsec_token": xsec_token,
+            "xsec_source": xsec_source,
+        }
+        return await self._get(splice_str(api, params), cookies_str, proxies)
+
+    @staticmethod
+    async def _iter_pages(fetch_page, items_key, cursor='', stop_on_empty=False):
+        """
+            逐页请求分页接口，每取到一页就返回 (本页数据列表, 下一页的cursor)，请求失败时抛出异常
+        """
+        while True:
+            success, msg, res_json = await fetch_page(cursor)
+            if not success:
+                raise Exception(msg)
+            items = res_json["data"][items_key]
+            if 'cursor' not in res_json["data"]:
+                return
+            cursor = str(res_json["data"]["cursor"])
+            yield items, cursor
+            if (stop_on_empty and len(items) == 0) or not res_json["data"]["has_more"]:
+                return
+
+    @staticmethod
+    async def _collect_pages(pages):
+        item_list = []
+        try:
+            async for items, _ in pages:
+                item_list.extend(items)
+            success, msg = True, 'success'
+        except Exception as e:
+            success = False
+            msg = str(e)
+        return success, msg, item_list
+
+    async def _iter_user_note_pages(self, page_func, user_url, cookies_str, default_source, proxies, cursor):
+        user_id, xsec_token, xsec_source = self._parse_user_url(user_url, default_source)
+        fetch_page = lambda page_cursor: page_func(user_id, page_cursor, cookies_str, xsec_token, xsec_source, proxies)
+        async for page in self._iter_pages(fetch_page, "notes", cursor, stop_on_empty=True):
+            yield page
+
+    async def get_user_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
+        """
+            获取用户指定位置的笔记
+        """
+        return await self._get_user_note_page("/api/sns/web/v1/user_posted", user_id, cursor, cookies_str, xsec_token, xsec_source, proxies)
+
+    def iter_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取用户的笔记，返回异步生成器，每页为 (本页笔记列表, 下一页的cursor)
+        """
+        return self._iter_user_note_pages(self.get_user_note_info, user_url, cookies_str, "pc_search", proxies, cursor)
+
+    async def get_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取用户所有笔记
+        """
+        return await self._collect_pages(self.iter_user_all_notes(user_url, cookies_str, proxies))
+
+    async def get_user_like_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
+        """
+            获取用户指定位置喜欢的笔记
+        """
+        return await self._get_user_note_page("/api/sns/web/v1/note/like/page", user_id, cursor, cookies_str, xsec_token, xsec_source, proxies)
+
+    def iter_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取用户喜欢的笔记，返回异步生成器，每页为 (本页笔记列表, 下一页的cursor)
+        """
+        return self._iter_user_note_pages(self.get_user_like_note_info, user_url, cookies_str, "pc_user", proxies, cursor)
+
+    async def get_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取用户所有喜欢笔记
+        """
+        return await self._collect_pages(self.iter_user_all_like_note_info(user_url, cookies_str, proxies))
+
+    async def get_user_collect_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
+        """
+            获取用户指定位置收藏的笔记
+        """
+        return await self._get_user_note_page("/api/sns/web/v2/note/collect/page", user_id, cursor, cookies_str, xsec_token, xsec_source, proxies)
+
+    def iter_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取用户收藏的笔记，返回异步生成器，每页为 (本页笔记列表, 下一页的cursor)
+        """
+        return self._iter_user_note_pages(self.get_user_collect_note_info, user_url, cookies_str, "pc_search", proxies, cursor)
+
+    async def get_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取用户所有收藏笔记
+        """
+        return await self._collect_pages(self.iter_user_all_collect_note_info(user_url, cookies_str, proxies))
+
+    async def get_note_info(self, url: str, cookies_str: str, proxies: dict = None):
+        """
+            获取笔记的详细
+        """
+        try:
+            data = XHS_Apis._build_note_feed_data(url)
+        except Exception as e:
+            return False, str(e), None
+        return await self._post("/api/sns/web/v1/feed", data, cookies_str, proxies)
+
+    async def get_some_note_info(self, urls: list, cookies_str: str, proxies: dict = None, batch_size: int = 10):
+        """
+            并发获取多篇笔记的详细，每批笔记的签名在一次JS调用中生成
+            返回每篇笔记的(success, msg, res_json)，顺序与urls一致
+        """
+        api = "/api/sns/web/v1/feed"
+        results = [None] * len(urls)
+        tasks = []
+        for start in range(0, len(urls), batch_size):
+            batch = []
+            for index in range(start, min(start + batch_size, len(urls))):
+                try:
+                    batch.append((index, XHS_Apis._build_note_feed_data(urls[index])))
+                except Exception as e:
+                    results[index] = (False, str(e), None)
+            if not batch:
+                continue
+            try:
+                params_list = await asyncio.to_thread(generate_request_params_batch, cookies_str, [(api, data) for _, data in batch])
+            except Exception as e:
+                for index, _ in batch:
+                    results[index] = (False, str(e), None)
+                continue
+            for (index, _), (headers, cookies, data) in zip(batch, params_list):
+                tasks.append((index, self._send('POST', api, headers, cookies, data, proxies)))
+        responses = await asyncio.gather(*[task for _, task in tasks])
+        for (index, _), response in zip(tasks, responses):
+            results[index] = response
+        return results
+
+    async def get_search_keyword(self, word: str, cookies_str: str, proxies: dict = None):
+        """
+            获取搜索关键词
+        """
+        splice_api = splice_str("/api/sns/web/v1/search/recommend", {"keyword": urllib.parse.quote(word)})
+        return await self._get(splice_api, cookies_str, proxies)
+
+    async def search_note(self, query: str, cookies_str: str, page=1, sort="general", note_type=0, proxies: dict = None):
+        """
+            获取搜索笔记的结果
+            :param sort 排序方式 general:综合排序, time_descending:时间排序, popularity_descending:热度排序
+            :param note_type 笔记类型 0:全部, 1:视频, 2:图文
+        """
+        data = {
+            "keyword": query,
+            "page": page,
+            "page_size": 20,
+            "search_id": generate_x_b3_traceid(21),
+            "sort": sort,
+            "note_type": note_type,
+            "ext_flags": [],
+            "image_formats": [
+                "jpg",
+                "webp",
+                "avif"
+            ]
+        }
+        return await self._post("/api/sns/web/v1/search/notes", data, cookies_str, proxies)
+
+    async def iter_search_note(self, query: str, cookies_str: str, require_num: int, sort="general", note_type=0, proxies: dict = None, prefetch: bool = True):
+        """
+            逐页获取搜索笔记的结果，返回异步生成器，每页为 (本页结果列表, 页数)
+            开启预取时，取到一页后先创建下一页的请求任务再返回本页
+        """
+        pending = None
+        page = 1
+        count = 0
+        try:
+            while True:
+                if pending is not None:
+                    success, msg, res_json = await pending
+                else:
+                    success, msg, res_json = await self.search_note(query, cookies_str, page, sort, note_type, proxies)
+                pending = None
+                if not success:
+                    raise Exception(msg)
+                if "items" not in res_json["data"]:
+                    return
+                notes = res_json["data"]["items"][:require_num - count]
+                count += len(notes)
+                has_next = count < require_num and res_json["data"]["has_more"]
+                if has_next and prefetch:
+                    pending = asyncio.create_task(self.search_note(query, cookies_str, page + 1, sort, note_type, proxies))
+                yield notes, page
+                if not has_next:
+                    return
+                page += 1
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def search_some_note(self, query: str, require_num: int, cookies_str: str, sort="general", note_type=0, proxies: dict = None):
+        """
+            指定数量搜索笔记，设置排序方式和笔记类型和笔记数量
+        """
+        return await self._collect_pages(self.iter_search_note(query, cookies_str, require_num, sort, note_type, proxies))
+
+    async def search_user(self, query: str, cookies_str: str, page=1, proxies: dict = None):
+        """
+            获取搜索用户的结果
+        """
+        data = {
+            "search_user_request": {
+                "keyword": query,
+                "search_id": "2dn9they1jbjxwawlo4xd",
+                "page": page,
+                "page_size": 15,
+                "biz_type": "web_search_user",
+                "request_id": "22471139-1723999898524"
+            }
+        }
+        return await self._post("/api/sns/web/v1/search/usersearch", data, cookies_str, proxies)
+
+    async def search_some_user(self, query: str, require_num: int, cookies_str: str, proxies: dict = None):
+        """
+            指定数量搜索用户
+        """
+        page = 1
+        user_list = []
+        try:
+            while True:
+                success, msg, res_json = await self.search_user(query, cookies_str, page, proxies)
+                if not success:
+                    raise Exception(msg)
+                if "users" not in res_json["data"]:
+                    break
+                users = res_json["data"]["users"]
+                user_list.extend(users)
+                page += 1
+                if len(user_list) >= require_num or not res_json["data"]["has_more"]:
+                    break
+        except Exception as e:
+            success = False
+            msg = str(e)
+        if len(user_list) > require_num:
+            user_list = user_list[:require_num]
+        return success, msg, user_list
+
+    async def get_note_out_comment(self, note_id: str, cursor: str, xsec_token: str, cookies_str: str, proxies: dict = None):
+        """
+            获取指定位置的笔记一级评论
+        """
+        params = {
+            "note_id": note_id,
+            "cursor": cursor,
+            "top_comment_id": "",
+            "image_formats": "jpg,webp,avif",
+            "xsec_token": xsec_token
+        }
+        return await self._get(splice_str("/api/sns/web/v2/comment/page", params), cookies_str, proxies)
+
+    def iter_note_all_out_comment(self, note_id: str, xsec_token: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取笔记的一级评论，返回异步生成器，每页为 (本页评论列表, 下一页的cursor)
+        """
+        fetch_page = lambda page_cursor: self.get_note_out_comment(note_id, page_cursor, xsec_token, cookies_str, proxies)
+        return self._iter_pages(fetch_page, "comments", cursor, stop_on_empty=True)
+
+    async def get_note_all_out_comment(self, note_id: str, xsec_token: str, cookies_str: str, proxies: dict = None):
+        """
+            获取笔记的全部一级评论
+        """
+        return await self._collect_pages(self.iter_note_all_out_comment(note_id, xsec_token, cookies_str, proxies))
+
+    async def get_note_inner_comment(self, comment: dict, cursor: str, xsec_token: str, cookies_str: str, proxies: dict = None):
+        """
+            获取指定位置的笔记二级评论
+        """
+        params = {
+            "note_id": comment['note_id'],
+            "root_comment_id": comment['id'],
+            "num": "10",
+            "cursor": cursor,
+            "image_formats": "jpg,webp,avif",
+            "top_comment_id": '',
+            "xsec_token": xsec_token
+        }
+        return await self._get(splice_str("/api/sns/web/v2/comment/sub/page", params), cookies_str, proxies)
+
+    async def get_note_all_inner_comment(self, comment: dict, xsec_token: str, cookies_str: str, proxies: dict = None):
+        """
+            获取笔记的全部二级评论
+        """
+        try:
+            if not comment['sub_comment_has_more']:
+                return True, 'success', comment
+            cursor = comment['sub_comment_cursor']
+            inner_comment_list = []
+            while True:
+                success, msg, res_json = await self.get_note_inner_comment(comment, cursor, xsec_token, cookies_str, proxies)
+                if not success:
+                    raise Exception(msg)
+                comments = res_json["data"]["comments"]
+                if 'cursor' in res_json["data"]:
+                    cursor = str(res_json["data"]["cursor"])
+                else:
+                    break
+                inner_comment_list.extend(comments)
+                if not res_json["data"]["has_more"]:
+                    break
+            comment['sub_comments'].extend(inner_comment_list)
+        except Exception as e:
+            success = False
+            msg = str(e)
+        return success, msg, comment
+
+    async def get_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None, concurrency: int = None):
+        """
+            获取一篇文章的所有评论，各一级评论的二级评论并发获取
+            :param concurrency: 同时获取二级评论的评论数，为None时从环境变量COMMENT_CONCURRENCY读取，默认8
+        """
+        concurrency = concurrency if concurrency is not None else int(os.getenv('COMMENT_CONCURRENCY', '8'))
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        start_time = time.monotonic()
+
+        async def fetch_inner(comment, xsec_token):
+            async with semaphore:
+                return await self.get_note_all_inner_comment(comment, xsec_token, cookies_str, proxies)
+
+        out_comment_list = []
+        try:
+            urlParse = urllib.parse.urlparse(url)
+            note_id = urlParse.path.split("/")[-1]
+            kvs = urlParse.query.split('&')
+            kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
+            success, msg, out_comment_list = await self.get_note_all_out_comment(note_id, kvDist['xsec_token'], cookies_str, proxies)
+            if not success:
+                raise Exception(msg)
+            comments = [comment for comment in out_comment_list if comment['sub_comment_has_more']]
+            results = await asyncio.gather(*[fetch_inner(comment, kvDist['xsec_token']) for comment in comments])
+            for success, msg, _ in results:
+                if not success:
+                    raise Exception(msg)
+            logger.info(f'笔记 {note_id} 评论获取完成: 一级评论 {len(out_comment_list)} 条，'
+                        f'并发获取 {len(comments)} 条评论的二级评论，耗时 {time.monotonic() - start_time:.2f} 秒')
+        except Exception as e:
+            success = False
+            msg = str(e)
+        return success, msg, out_comment_list
+
+    async def get_unread_message(self, cookies_str: str, proxies: dict = None):
+        """
+            获取未读消息
+        """
+        return await self._get("/api/sns/web/unread_count", cookies_str, proxies)
+
+    async def _get_message_page(self, api, cursor, cookies_str, proxies):
+        params = {
+            "num": "20",
+            "cursor": cursor
+        }
+        return await self._get(splice_str(api, params), cookies_str, proxies)
+
+    def _iter_message_pages(self, page_func, cookies_str, proxies, cursor):
+        fetch_page = lambda page_cursor: page_func(page_cursor, cookies_str, proxies)
+        return self._iter_pages(fetch_page, "message_list", cursor)
+
+    async def get_metions(self, cursor: str, cookies_str: str, proxies: dict = None):
+        """
+            获取评论和@提醒
+        """
+        return await self._get_message_page("/api/sns/web/v1/you/mentions", cursor, cookies_str, proxies)
+
+    def iter_all_metions(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的评论和@提醒，返回异步生成器，每页为 (本页消息列表, 下一页的cursor)
+        """
+        return self._iter_message_pages(self.get_metions, cookies_str, proxies, cursor)
+
+    async def get_all_metions(self, cookies_str: str, proxies: dict = None):
+        """
+            获取全部的评论和@提醒
+        """
+        return await self._collect_pages(self.iter_all_metions(cookies_str, proxies))
+
+    async def get_likesAndcollects(self, cursor: str, cookies_str: str, proxies: dict = None):
+        """
+            获取赞和收藏
+        """
+        return await self._get_message_page("/api/sns/web/v1/you/likes", cursor, cookies_str, proxies)
+
+    def iter_all_likesAndcollects(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的赞和收藏，返回异步生成器，每页为 (本页消息列表, 下一页的cursor)
+        """
+        return self._iter_message_pages(self.get_likesAndcollects, cookies_str, proxies, cursor)
+
+    async def get_all_likesAndcollects(self, cookies_str: str, proxies: dict = None):
+        """
+            获取全部的赞和收藏
+        """
+        return await self._collect_pages(self.iter_all_likesAndcollects(cookies_str, proxies))
+
+    async def get_new_connections(self, cursor: str, cookies_str: str, proxies: dict = None):
+        """
+            获取新增关注
+        """
+        return await self._get_message_page("/api/sns/web/v1/you/connections", cursor, cookies_str, proxies)
+
+    def iter_all_new_connections(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的新增关注，返回异步生成器，每页为 (本页消息列表, 下一页的cursor)
+        """
+        return self._iter_message_pages(self.get_new_connections, cookies_str, proxies, cursor)
+
+    async def get_all_new_connections(self, cookies_str: str, proxies: dict = None):
+        """
+            获取全部的新增关注
+        """
+        return await self._collect_pages(self.iter_all_new_connections(cookies_str, proxies))
+
+    @staticmethod
+    async def get_note_no_water_video(note_id):
+        """
+            获取笔记无水印视频
+        """
+        return await asyncio.to_thread(XHS_Apis.get_note_no_water_video, note_id)
+
+    # 不发送请求的工具方法与同步版本相同
+    get_note_no_water_img = staticmethod(XHS_Apis.get_note_no_water_img)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+            logger.debug(f'异步接口会话已关闭，累计请求 {self.request_count} 次')
@@ -1,9 +1,17 @@
 # encoding: utf-8
+import contextvars
 import json
+import os
 import re
+import time
 import urllib
 import requests
-from xhs_utils.xhs_util import splice_str, generate_request_params, generate_x_b3_traceid, get_common_headers
+from concurrent.futures import ThreadPoolExecutor
+from xhs_utils.cookie_pool import get_cookie_pool, is_login_expired, pooled_cookies
+from xhs_utils.http_session import PooledSession
+from xhs_utils.request_executor import RequestExecutor
+from xhs_utils.single_flight import SingleFlight
+from xhs_utils.xhs_util import splice_str, generate_request_params, generate_request_params_batch, generate_x_b3_traceid, get_common_headers
 from loguru import logger
 
 """
@@ -11,9 +19,70 @@ from loguru import logger
     :param cookies_str: 你的cookies
 """
 class XHS_Apis():
-    def __init__(self):
+
+    def __init__(self, proxies: dict = None, pool_connections: int = None, pool_maxsize: int = None, cookie_pool=None):
+        """
+            :param proxies: 所有接口默认使用的代理，单次调用传入的proxies会覆盖
+            :param pool_connections: 缓存连接池的主机数量，默认从环境变量HTTP_POOL_CONNECTIONS读取
+            :param pool_maxsize: 每个主机保持的最大连接数，默认从环境变量HTTP_POOL_MAXSIZE读取
+            :param cookie_pool: 账号池，调用接口时cookies_str传None则从中选择负载最低的可用账号，默认使用全局账号池
+        """
         self.base_url = "https://edith.xiaohongshu.com"
+        # 所有接口共用一个长连接会话，避免每次请求都重新进行TCP和TLS握手
+        self.session = PooledSession(pool_connections, pool_maxsize, proxies)
+        # 所有接口请求经过同一个执行器，按接口和账号限速
+        self.executor = RequestExecutor(self.session)
+        # 同一篇笔记的并发详细请求合并为一次
+        self.note_flight = SingleFlight()
+        self.cookie_pool = cookie_pool if cookie_pool is not None else get_cookie_pool()
+
+    def session_stats(self):
+        """
+            返回连接复用统计 {'requests', 'connections', 'reused', 'hosts'}
+        """
+        return self.session.stats()
+
+    def note_flight_stats(self):
+        """
+            返回笔记详细请求的合并统计 {'requests', 'coalesced', 'executed', 'in_flight'}
+        """
+        return self.note_flight.stats()
+
+    def cookie_pool_stats(self):
+        """
+            返回账号池中每个账号的统计 [{'account', 'requests', 'in_flight', 'expired', 'quarantined'}]
+        """
+        return self.cookie_pool.stats()
+
+    def proxy_pool_stats(self):
+        """
+            返回代理池中每个代理的统计 [{'proxy', 'requests', 'in_flight', 'latency', 'failure_rate', 'ejected', 'ejections'}]
+        """
+        return self.executor.proxy_pool.stats()
 
+    def circuit_breaker_stats(self):
+        """
+            返回熔断器的统计 {'open', 'consecutive_failures', 'trips', 'rejected'}
+        """
+        return self.executor.circuit_breaker.stats()
+
+    def check_accounts(self, proxies: dict = None):
+        """
+            用获取自己信息的接口检查账号池中每个账号的登录状态，登录失效的账号被隔离
+            返回可用的账号数；熔断中或网络错误时不隔离账号，按可用计算
+        """
+        valid_count = 0
+        for identity in self.cookie_pool.snapshot():
+            success, msg, res_json = self.get_user_self_info(identity.cookies_str, proxies)
+            if not success and is_login_expired(msg, res_json):
+                self.cookie_pool.quarantine(identity)
+                continue
+            if not success:
+                logger.warning(f"检查账号 {identity.name} 登录状态失败: {msg}")
+            valid_count += 1
+        return valid_count
+
+    @pooled_cookies
     def get_homefeed_all_channel(self, cookies_str: str, proxies: dict = None):
         """
             获取主页的所有频道
@@ -23,7 +92,7 @@ class XHS_Apis():
         try:
             api = "/api/sns/web/v1/homefeed/category"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -31,6 +100,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def get_homefeed_recommend(self, category, cursor_score, refresh_type, note_index, cookies_str: str, proxies: dict = None):
         """
             获取主页推荐的笔记
@@ -63,7 +133,7 @@ class XHS_Apis():
                 "need_filter_image": False
             }
             headers, cookies, trans_data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=trans_data, cookies=cookies, proxies=proxies)
+            response = self.executor.post(self.base_url + api, headers=headers, data=trans_data, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -71,6 +141,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def get_homefeed_recommend_by_num(self, category, require_num, cookies_str: str, proxies: dict = None):
         """
             根据数量获取主页推荐的笔记
@@ -102,6 +173,7 @@ class XHS_Apis():
             note_list = note_list[:require_num]
         return success, msg, note_list
 
+    @pooled_cookies
     def get_user_info(self, user_id: str, cookies_str: str, proxies: dict = None):
         """
             获取用户的信息
@@ -117,7 +189,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -125,6 +197,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def get_user_self_info(self, cookies_str: str, proxies: dict = None):
         """
             获取用户自己的信息1
@@ -135,7 +208,7 @@ class XHS_Apis():
         try:
             api = f"/api/sns/web/v1/user/selfinfo"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -144,6 +217,7 @@ class XHS_Apis():
         return success, msg, res_json
 
 
+    @pooled_cookies
     def get_user_self_info2(self, cookies_str: str, proxies: dict = None):
         """
             获取用户自己的信息2
@@ -154,7 +228,7 @@ class XHS_Apis():
         try:
             api = f"/api/sns/web/v2/user/me"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -162,6 +236,53 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @staticmethod
+    def _parse_user_url(user_url: str, default_source: str):
+        urlParse = urllib.parse.urlparse(user_url)
+        user_id = urlParse.path.split("/")[-1]
+        kvs = urlParse.query.split('&')
+        kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
+        xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
+        xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else default_source
+        return user_id, xsec_token, xsec_source
+
+    @staticmethod
+    def _iter_pages(fetch_page, items_key: str, cursor: str = '', stop_on_empty: bool = False):
+        """
+            逐页请求分页接口，每取到一页就返回 (本页数据列表, 下一页的cursor)，请求失败时抛出异常
+            :param fetch_page: 接收cursor、返回(success, msg, res_json)的函数
+            :param items_key: res_json["data"]中数据列表的键
+            :param cursor: 起始cursor，传入之前返回的cursor可以从该位置继续翻页
+            :param stop_on_empty: 取到空页时停止翻页
+        """
+        while True:
+            success, msg, res_json = fetch_page(cursor)
+            if not success:
+                raise Exception(msg)
+            items = res_json["data"][items_key]
+            if 'cursor' not in res_json["data"]:
+                return
+            cursor = str(res_json["data"]["cursor"])
+            yield items, cursor
+            if (stop_on_empty and len(items) == 0) or not res_json["data"]["has_more"]:
+                return
+
+    @staticmethod
+    def _collect_pages(pages):
+        """
+            把分页生成器的所有页合并成一个列表，请求失败时返回失败前已取到的数据
+        """
+        item_list = []
+        try:
+            for items, _ in pages:
+                item_list.extend(items)
+            success, msg = True, 'success'
+        except Exception as e:
+            success = False
+            msg = str(e)
+        return success, msg, item_list
+
+    @pooled_cookies
     def get_user_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
         """
             获取用户指定位置的笔记
@@ -183,7 +304,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -192,39 +313,29 @@ class XHS_Apis():
         return success, msg, res_json
 
 
+    @pooled_cookies
+    def iter_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取用户的笔记，每取到一页就返回 (本页笔记列表, 下一页的cursor)，请求失败时抛出异常
+            :param user_url: 你想要获取的用户的主页url
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，默认从第一页开始
+        """
+        user_id, xsec_token, xsec_source = self._parse_user_url(user_url, "pc_search")
+        fetch_page = lambda page_cursor: self.get_user_note_info(user_id, page_cursor, cookies_str, xsec_token, xsec_source, proxies)
+        yield from self._iter_pages(fetch_page, "notes", cursor, stop_on_empty=True)
+
+    @pooled_cookies
     def get_user_all_notes(self, user_url: str, cookies_str: str, proxies: dict = None):
         """
-           获取用户所有笔记
-           :param user_id: 你想要获取的用户的id
-           :param cookies_str: 你的cookies
-           返回用户的所有笔记
+            获取用户所有笔记
+            :param user_url: 你想要获取的用户的主页url
+            :param cookies_str: 你的cookies
+            返回用户的所有笔记
         """
-        cursor = ''
-        note_list = []
-        try:
-            urlParse = urllib.parse.urlparse(user_url)
-            user_id = urlParse.path.split("/")[-1]
-            kvs = urlParse.query.split('&')
-            kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
-            xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
-            xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_search"
-            while True:
-                success, msg, res_json = self.get_user_note_info(user_id, cursor, cookies_str, xsec_token, xsec_source, proxies)
-                if not success:
-                    raise Exception(msg)
-                notes = res_json["data"]["notes"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_list.extend(notes)
-                if len(notes) == 0 or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, note_list
+        return self._collect_pages(self.iter_user_all_notes(user_url, cookies_str, proxies))
 
+    @pooled_cookies
     def get_user_like_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
         """
             获取用户指定位置喜欢的笔记
@@ -246,7 +357,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -254,40 +365,29 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def iter_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取用户喜欢的笔记，每取到一页就返回 (本页笔记列表, 下一页的cursor)，请求失败时抛出异常
+            :param user_url: 你想要获取的用户的主页url
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，默认从第一页开始
+        """
+        user_id, xsec_token, xsec_source = self._parse_user_url(user_url, "pc_user")
+        fetch_page = lambda page_cursor: self.get_user_like_note_info(user_id, page_cursor, cookies_str, xsec_token, xsec_source, proxies)
+        yield from self._iter_pages(fetch_page, "notes", cursor, stop_on_empty=True)
+
+    @pooled_cookies
     def get_user_all_like_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
         """
             获取用户所有喜欢笔记
-            :param user_id: 你想要获取的用户的id
+            :param user_url: 你想要获取的用户的主页url
             :param cookies_str: 你的cookies
             返回用户的所有喜欢笔记
         """
-        cursor = ''
-        note_list = []
-        try:
-            urlParse = urllib.parse.urlparse(user_url)
-            user_id = urlParse.path.split("/")[-1]
-            kvs = urlParse.query.split('&')
-            kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
-            xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
-            xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_user"
-            while True:
-                success, msg, res_json = self.get_user_like_note_info(user_id, cursor, cookies_str, xsec_token,
-                                                                      xsec_source, proxies)
-                if not success:
-                    raise Exception(msg)
-                notes = res_json["data"]["notes"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_list.extend(notes)
-                if len(notes) == 0 or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, note_list
+        return self._collect_pages(self.iter_user_all_like_note_info(user_url, cookies_str, proxies))
 
+    @pooled_cookies
     def get_user_collect_note_info(self, user_id: str, cursor: str, cookies_str: str, xsec_token='', xsec_source='', proxies: dict = None):
         """
             获取用户指定位置收藏的笔记
@@ -309,7 +409,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -317,70 +417,73 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def iter_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取用户收藏的笔记，每取到一页就返回 (本页笔记列表, 下一页的cursor)，请求失败时抛出异常
+            :param user_url: 你想要获取的用户的主页url
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，默认从第一页开始
+        """
+        user_id, xsec_token, xsec_source = self._parse_user_url(user_url, "pc_search")
+        fetch_page = lambda page_cursor: self.get_user_collect_note_info(user_id, page_cursor, cookies_str, xsec_token, xsec_source, proxies)
+        yield from self._iter_pages(fetch_page, "notes", cursor, stop_on_empty=True)
+
+    @pooled_cookies
     def get_user_all_collect_note_info(self, user_url: str, cookies_str: str, proxies: dict = None):
         """
             获取用户所有收藏笔记
-            :param user_id: 你想要获取的用户的id
+            :param user_url: 你想要获取的用户的主页url
             :param cookies_str: 你的cookies
             返回用户的所有收藏笔记
         """
-        cursor = ''
-        note_list = []
-        try:
-            urlParse = urllib.parse.urlparse(user_url)
-            user_id = urlParse.path.split("/")[-1]
-            kvs = urlParse.query.split('&')
-            kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
-            xsec_token = kvDist['xsec_token'] if 'xsec_token' in kvDist else ""
-            xsec_source = kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_search"
-            while True:
-                success, msg, res_json = self.get_user_collect_note_info(user_id, cursor, cookies_str, xsec_token,
-                                                                         xsec_source, proxies)
-                if not success:
-                    raise Exception(msg)
-                notes = res_json["data"]["notes"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_list.extend(notes)
-                if len(notes) == 0 or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, note_list
+        return self._collect_pages(self.iter_user_all_collect_note_info(user_url, cookies_str, proxies))
+
+    @staticmethod
+    def _build_note_feed_data(url: str):
+        """
+            根据笔记url构造笔记详细接口的请求体
+        """
+        urlParse = urllib.parse.urlparse(url)
+        note_id = urlParse.path.split("/")[-1]
+        kvs = urlParse.query.split('&')
+        kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
+        return {
+            "source_note_id": note_id,
+            "image_formats": [
+                "jpg",
+                "webp",
+                "avif"
+            ],
+            "extra": {
+                "need_body_topic": "1"
+            },
+            "xsec_source": kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_search",
+            "xsec_token": kvDist['xsec_token']
+        }
+
+    @staticmethod
+    def _note_flight_key(url: str):
+        return urllib.parse.urlparse(url).path.split("/")[-1]
 
+    @pooled_cookies
     def get_note_info(self, url: str, cookies_str: str, proxies: dict = None):
         """
-            获取笔记的详细
+            获取笔记的详细，同一篇笔记正在被其他线程获取时等待并共用它的结果
             :param url: 你想要获取的笔记的url
             :param cookies_str: 你的cookies
             :param xsec_source: 你的xsec_source 默认为pc_search pc_user pc_feed
             返回笔记的详细
         """
+        return self.note_flight.do(self._note_flight_key(url), self._fetch_note_info, url, cookies_str, proxies)
+
+    def _fetch_note_info(self, url: str, cookies_str: str, proxies: dict = None):
         res_json = None
         try:
-            urlParse = urllib.parse.urlparse(url)
-            note_id = urlParse.path.split("/")[-1]
-            kvs = urlParse.query.split('&')
-            kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
             api = f"/api/sns/web/v1/feed"
-            data = {
-                "source_note_id": note_id,
-                "image_formats": [
-                    "jpg",
-                    "webp",
-                    "avif"
-                ],
-                "extra": {
-                    "need_body_topic": "1"
-                },
-                "xsec_source": kvDist['xsec_source'] if 'xsec_source' in kvDist else "pc_search",
-                "xsec_token": kvDist['xsec_token']
-            }
+            data = self._build_note_feed_data(url)
             headers, cookies, data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=data, cookies=cookies, proxies=proxies)
+            response = self.executor.post(self.base_url + api, headers=headers, data=data, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -388,7 +491,76 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def get_some_note_info(self, urls: list, cookies_str: str, proxies: dict = None, batch_size: int = 10):
+        """
+            批量获取笔记的详细，每批笔记的签名在一次JS调用中生成
+            :param urls: 你想要获取的笔记的url列表
+            :param cookies_str: 你的cookies
+            :param batch_size: 每批签名的笔记数量，签名带有时间戳，不宜一次签太多
+            返回每篇笔记的(success, msg, res_json)，顺序与urls一致
+        """
+        results = [None] * len(urls)
+        for index, result in self.iter_some_note_info(urls, cookies_str, proxies, batch_size):
+            results[index] = result
+        return results
 
+    def iter_some_note_info(self, urls: list, cookies_str: str, proxies: dict = None, batch_size: int = 10):
+        """
+            批量获取笔记的详细，每篇笔记的请求完成后立即返回 (在urls中的索引, (success, msg, res_json))，
+            调用方可以在其余笔记还在请求时先处理已返回的笔记；每批笔记的签名在一次JS调用中生成
+            其他线程正在获取的笔记不重复请求，本批请求完成后等待并共用它的结果
+            :param urls: 你想要获取的笔记的url列表
+            :param cookies_str: 你的cookies
+            :param batch_size: 每批签名的笔记数量，签名带有时间戳，不宜一次签太多
+        """
+        api = f"/api/sns/web/v1/feed"
+        leading = []
+        waiting = []
+        failed = []
+        for index, url in enumerate(urls):
+            key = self._note_flight_key(url)
+            call, leader = self.note_flight.begin(key)
+            if not leader:
+                waiting.append((index, call))
+                continue
+            try:
+                leading.append((index, key, call, self._build_note_feed_data(url)))
+            except Exception as e:
+                failed.append((index, (False, str(e), None)))
+                self.note_flight.finish(key, call, failed[-1][1])
+        try:
+            yield from failed
+            for start in range(0, len(leading), batch_size):
+                batch = leading[start:start + batch_size]
+                try:
+                    params_list = generate_request_params_batch(cookies_str, [(api, data) for _, _, _, data in batch])
+                except Exception as e:
+                    for index, key, call, _ in batch:
+                        self.note_flight.finish(key, call, (False, str(e), None))
+                        yield index, (False, str(e), None)
+                    continue
+                for (index, key, call, _), (headers, cookies, data) in zip(batch, params_list):
+                    res_json = None
+                    try:
+                        response = self.executor.post(self.base_url + api, headers=headers, data=data, cookies=cookies, proxies=proxies)
+                        res_json = response.json()
+                        success, msg = res_json["success"], res_json["msg"]
+                    except Exception as e:
+                        success = False
+                        msg = str(e)
+                    self.note_flight.finish(key, call, (success, msg, res_json))
+                    yield index, (success, msg, res_json)
+        finally:
+            # 中途被中断或调用方不再迭代时也要唤醒等待这些笔记的调用
+            for index, key, call, _ in leading:
+                if not call.event.is_set():
+                    self.note_flight.finish(key, call, (False, '请求被中断', None))
+        for index, call in waiting:
+            yield index, call.wait()
+
+
+    @pooled_cookies
     def get_search_keyword(self, word: str, cookies_str: str, proxies: dict = None):
         """
             获取搜索关键词
@@ -404,7 +576,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -412,6 +584,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def search_note(self, query: str, cookies_str: str, page=1, sort="general", note_type=0, proxies: dict = None):
         """
             获取搜索笔记的结果
@@ -440,7 +613,7 @@ class XHS_Apis():
                 ]
             }
             headers, cookies, data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
+            response = self.executor.post(self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -448,37 +621,60 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
-    def search_some_note(self, query: str, require_num: int, cookies_str: str, sort="general", note_type=0, proxies: dict = None):
+    @pooled_cookies
+    def iter_search_note(self, query: str, cookies_str: str, require_num: int, sort="general", note_type=0, proxies: dict = None, prefetch: bool = True):
         """
-            指定数量搜索笔记，设置排序方式和笔记类型和笔记数量
+            逐页获取搜索笔记的结果，每取到一页就返回 (本页结果列表, 页数)，请求失败时抛出异常
+            开启预取时，取到一页后先在后台线程请求下一页再返回本页，调用方处理本页的同时下一页已经在请求中
             :param query 搜索的关键词
-            :param require_num 搜索的数量
             :param cookies_str 你的cookies
+            :param require_num 搜索的数量，返回的结果总数不超过该值
             :param sort 排序方式 general:综合排序, time_descending:时间排序, popularity_descending:热度排序
             :param note_type 笔记类型 0:全部, 1:视频, 2:图文
-            返回搜索的结果
+            :param prefetch 是否预取下一页
         """
+        fetch_page = lambda page: self.search_note(query, cookies_str, page, sort, note_type, proxies)
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        pending = None
         page = 1
-        note_list = []
+        count = 0
         try:
             while True:
-                success, msg, res_json = self.search_note(query, cookies_str, page, sort, note_type, proxies)
+                success, msg, res_json = pending.result() if pending is not None else fetch_page(page)
+                pending = None
                 if not success:
                     raise Exception(msg)
                 if "items" not in res_json["data"]:
-                    break
-                notes = res_json["data"]["items"]
-                note_list.extend(notes)
+                    return
+                notes = res_json["data"]["items"][:require_num - count]
+                count += len(notes)
+                has_next = count < require_num and res_json["data"]["has_more"]
+                if has_next and executor is not None:
+                    # 线程不会继承contextvars，复制当前上下文让请求沿用本轮的截止时间
+                    pending = executor.submit(contextvars.copy_context().run, fetch_page, page + 1)
+                yield notes, page
+                if not has_next:
+                    return
                 page += 1
-                if len(note_list) >= require_num or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        if len(note_list) > require_num:
-            note_list = note_list[:require_num]
-        return success, msg, note_list
+        finally:
+            # 调用方提前停止迭代时不再等待预取的请求
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
 
+    @pooled_cookies
+    def search_some_note(self, query: str, require_num: int, cookies_str: str, sort="general", note_type=0, proxies: dict = None):
+        """
+            指定数量搜索笔记，设置排序方式和笔记类型和笔记数量
+            :param query 搜索的关键词
+            :param require_num 搜索的数量
+            :param cookies_str 你的cookies
+            :param sort 排序方式 general:综合排序, time_descending:时间排序, popularity_descending:热度排序
+            :param note_type 笔记类型 0:全部, 1:视频, 2:图文
+            返回搜索的结果
+        """
+        return self._collect_pages(self.iter_search_note(query, cookies_str, require_num, sort, note_type, proxies))
+
+    @pooled_cookies
     def search_user(self, query: str, cookies_str: str, page=1, proxies: dict = None):
         """
             获取搜索用户的结果
@@ -501,7 +697,7 @@ class XHS_Apis():
                 }
             }
             headers, cookies, data = generate_request_params(cookies_str, api, data)
-            response = requests.post(self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
+            response = self.executor.post(self.base_url + api, headers=headers, data=data.encode('utf-8'), cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -509,6 +705,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def search_some_user(self, query: str, require_num: int, cookies_str: str, proxies: dict = None):
         """
             指定数量搜索用户
@@ -538,6 +735,7 @@ class XHS_Apis():
             user_list = user_list[:require_num]
         return success, msg, user_list
 
+    @pooled_cookies
     def get_note_out_comment(self, note_id: str, cursor: str, xsec_token: str, cookies_str: str, proxies: dict = None):
         """
             获取指定位置的笔记一级评论
@@ -558,7 +756,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -566,6 +764,18 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def iter_note_all_out_comment(self, note_id: str, xsec_token: str, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取笔记的一级评论，每取到一页就返回 (本页评论列表, 下一页的cursor)，请求失败时抛出异常
+            :param note_id 笔记的id
+            :param cookies_str 你的cookies
+            :param cursor 起始cursor，默认从第一页开始
+        """
+        fetch_page = lambda page_cursor: self.get_note_out_comment(note_id, page_cursor, xsec_token, cookies_str, proxies)
+        yield from self._iter_pages(fetch_page, "comments", cursor, stop_on_empty=True)
+
+    @pooled_cookies
     def get_note_all_out_comment(self, note_id: str, xsec_token: str, cookies_str: str, proxies: dict = None):
         """
             获取笔记的全部一级评论
@@ -573,26 +783,9 @@ class XHS_Apis():
             :param cookies_str 你的cookies
             返回笔记的全部一级评论
         """
-        cursor = ''
-        note_out_comment_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_note_out_comment(note_id, cursor, xsec_token, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                comments = res_json["data"]["comments"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                note_out_comment_list.extend(comments)
-                if len(note_out_comment_list) == 0 or not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, note_out_comment_list
+        return self._collect_pages(self.iter_note_all_out_comment(note_id, xsec_token, cookies_str, proxies))
 
+    @pooled_cookies
     def get_note_inner_comment(self, comment: dict, cursor: str, xsec_token: str, cookies_str: str, proxies: dict = None):
         """
             获取指定位置的笔记二级评论
@@ -615,7 +808,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -623,6 +816,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def get_note_all_inner_comment(self, comment: dict, xsec_token: str, cookies_str: str, proxies: dict = None):
         """
             获取笔记的全部二级评论
@@ -653,31 +847,49 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, comment
 
-    def get_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None):
+    @pooled_cookies
+    def get_note_all_comment(self, url: str, cookies_str: str, proxies: dict = None, concurrency: int = None):
         """
             获取一篇文章的所有评论
-            :param note_id: 你想要获取的笔记的id
+            一级评论逐页获取，每取到一页就把其中各条评论的二级评论交给线程池并发获取
+            :param url: 你想要获取的笔记的url
             :param cookies_str: 你的cookies
-            返回一篇文章的所有评论
+            :param concurrency: 同时获取二级评论的线程数，为None时从环境变量COMMENT_CONCURRENCY读取，默认8
+            返回一篇文章的所有评论，顺序与接口返回的顺序一致
         """
+        concurrency = concurrency if concurrency is not None else int(os.getenv('COMMENT_CONCURRENCY', '8'))
         out_comment_list = []
+        futures = []
+        start_time = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=max(concurrency, 1))
         try:
             urlParse = urllib.parse.urlparse(url)
             note_id = urlParse.path.split("/")[-1]
             kvs = urlParse.query.split('&')
             kvDist = {kv.split('=')[0]: kv.split('=')[1] for kv in kvs}
-            success, msg, out_comment_list = self.get_note_all_out_comment(note_id, kvDist['xsec_token'], cookies_str, proxies)
-            if not success:
-                raise Exception(msg)
-            for comment in out_comment_list:
-                success, msg, new_comment = self.get_note_all_inner_comment(comment, kvDist['xsec_token'], cookies_str, proxies)
+            for comments, _ in self.iter_note_all_out_comment(note_id, kvDist['xsec_token'], cookies_str, proxies):
+                out_comment_list.extend(comments)
+                for comment in comments:
+                    if comment['sub_comment_has_more']:
+                        # 线程不会继承contextvars，复制当前上下文让请求沿用本轮的截止时间
+                        futures.append(executor.submit(contextvars.copy_context().run, self.get_note_all_inner_comment,
+                                                       comment, kvDist['xsec_token'], cookies_str, proxies))
+            # 二级评论直接写回各自的一级评论，按提交顺序检查结果
+            for future in futures:
+                success, msg, _ = future.result()
                 if not success:
                     raise Exception(msg)
+            success, msg = True, 'success'
+            logger.info(f'笔记 {note_id} 评论获取完成: 一级评论 {len(out_comment_list)} 条，'
+                        f'并发获取 {len(futures)} 条评论的二级评论，耗时 {time.monotonic() - start_time:.2f} 秒')
         except Exception as e:
             success = False
             msg = str(e)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
         return success, msg, out_comment_list
 
+    @pooled_cookies
     def get_unread_message(self, cookies_str: str, proxies: dict = None):
         """
             获取未读消息
@@ -688,7 +900,7 @@ class XHS_Apis():
         try:
             api = "/api/sns/web/unread_count"
             headers, cookies, data = generate_request_params(cookies_str, api)
-            response = requests.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -696,6 +908,7 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
     def get_metions(self, cursor: str, cookies_str: str, proxies: dict = None):
         """
             获取评论和@提醒
@@ -712,7 +925,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -720,32 +933,26 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def iter_all_metions(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的评论和@提醒，每取到一页就返回 (本页消息列表, 下一页的cursor)，请求失败时抛出异常
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，默认从第一页开始
+        """
+        fetch_page = lambda page_cursor: self.get_metions(page_cursor, cookies_str, proxies)
+        yield from self._iter_pages(fetch_page, "message_list", cursor)
+
+    @pooled_cookies
     def get_all_metions(self, cookies_str: str, proxies: dict = None):
         """
             获取全部的评论和@提醒
             :param cookies_str: 你的cookies
             返回全部的评论和@提醒
         """
-        cursor = ''
-        metions_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_metions(cursor, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                metions = res_json["data"]["message_list"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                metions_list.extend(metions)
-                if not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, metions_list
+        return self._collect_pages(self.iter_all_metions(cookies_str, proxies))
 
+    @pooled_cookies
     def get_likesAndcollects(self, cursor: str, cookies_str: str, proxies: dict = None):
         """
             获取赞和收藏
@@ -762,7 +969,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -770,32 +977,26 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def iter_all_likesAndcollects(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的赞和收藏，每取到一页就返回 (本页消息列表, 下一页的cursor)，请求失败时抛出异常
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，默认从第一页开始
+        """
+        fetch_page = lambda page_cursor: self.get_likesAndcollects(page_cursor, cookies_str, proxies)
+        yield from self._iter_pages(fetch_page, "message_list", cursor)
+
+    @pooled_cookies
     def get_all_likesAndcollects(self, cookies_str: str, proxies: dict = None):
         """
             获取全部的赞和收藏
             :param cookies_str: 你的cookies
             返回全部的赞和收藏
         """
-        cursor = ''
-        likesAndcollects_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_likesAndcollects(cursor, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                likesAndcollects = res_json["data"]["message_list"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                likesAndcollects_list.extend(likesAndcollects)
-                if not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, likesAndcollects_list
+        return self._collect_pages(self.iter_all_likesAndcollects(cookies_str, proxies))
 
+    @pooled_cookies
     def get_new_connections(self, cursor: str, cookies_str: str, proxies: dict = None):
         """
             获取新增关注
@@ -812,7 +1013,7 @@ class XHS_Apis():
             }
             splice_api = splice_str(api, params)
             headers, cookies, data = generate_request_params(cookies_str, splice_api)
-            response = requests.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
+            response = self.executor.get(self.base_url + splice_api, headers=headers, cookies=cookies, proxies=proxies)
             res_json = response.json()
             success, msg = res_json["success"], res_json["msg"]
         except Exception as e:
@@ -820,31 +1021,24 @@ class XHS_Apis():
             msg = str(e)
         return success, msg, res_json
 
+    @pooled_cookies
+    def iter_all_new_connections(self, cookies_str: str, proxies: dict = None, cursor: str = ''):
+        """
+            逐页获取全部的新增关注，每取到一页就返回 (本页消息列表, 下一页的cursor)，请求失败时抛出异常
+            :param cookies_str: 你的cookies
+            :param cursor: 起始cursor，默认从第一页开始
+        """
+        fetch_page = lambda page_cursor: self.get_new_connections(page_cursor, cookies_str, proxies)
+        yield from self._iter_pages(fetch_page, "message_list", cursor)
+
+    @pooled_cookies
     def get_all_new_connections(self, cookies_str: str, proxies: dict = None):
         """
             获取全部的新增关注
             :param cookies_str: 你的cookies
             返回全部的新增关注
         """
-        cursor = ''
-        connections_list = []
-        try:
-            while True:
-                success, msg, res_json = self.get_new_connections(cursor, cookies_str, proxies)
-                if not success:
-                    raise Exception(msg)
-                connections = res_json["data"]["message_list"]
-                if 'cursor' in res_json["data"]:
-                    cursor = str(res_json["data"]["cursor"])
-                else:
-                    break
-                connections_list.extend(connections)
-                if not res_json["data"]["has_more"]:
-                    break
-        except Exception as e:
-            success = False
-            msg = str(e)
-        return success, msg, connections_list
+        return self._collect_pages(self.iter_all_new_connections(cookies_str, proxies))
 
     @staticmethod
     def get_note_no_water_video(note_id):
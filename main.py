@@ -1,16 +1,23 @@
 import os
 from loguru import logger
 from apis.pc_apis import XHS_Apis
-from xhs_utils.common_utils import init, load_env, load_user_urls
-from xhs_utils.data_util import handle_note_info, download_note, save_to_xlsx, create_note_record, norm_str, check_note_files_complete, update_download_status
+from xhs_utils.common_utils import init, load_env, load_user_urls, load_cookies_list
+from xhs_utils.data_util import handle_note_info, download_note, save_to_xlsx, create_note_record, check_note_files_complete, update_download_status, load_stored_note
 from xhs_utils.push_util import pusher
 from xhs_utils.schedule_utils import schedule_controller
+from xhs_utils.sign_worker import get_sign_pool
+from xhs_utils.rate_limiter import export_metrics
+from xhs_utils.deadline import request_deadline, deadline_exceeded, remaining_time
+from xhs_utils.sync_state import SyncState
+from xhs_utils.profile_cache import ProfileCache
+from xhs_utils.cookie_pool import get_cookie_pool
+from xhs_utils.circuit_breaker import get_circuit_breaker
+from xhs_utils.media_pipeline import get_media_pipeline
 import sys
 import csv
 import random
 import time
 from datetime import datetime, timedelta
-import json
 
 # 配置日志级别为INFO（默认值），后续会根据配置动态调整
 logger.remove()
@@ -35,18 +42,30 @@ def update_logger_level(log_level):
 class Data_Spider():
     def __init__(self):
         self.xhs_apis = XHS_Apis()
+        self.profile_caches = {}
 
-    def spider_note(self, note_url: str, cookies_str: str, proxies=None):
+    def get_profile_cache(self, csv_path: str):
+        """
+        获取保存在csv_path目录下的用户资料缓存，同一目录只读取一次
+        """
+        if csv_path not in self.profile_caches:
+            self.profile_caches[csv_path] = ProfileCache(os.path.join(csv_path, 'profile_cache.json'))
+        return self.profile_caches[csv_path]
+
+    def spider_note(self, note_url: str, cookies_str: str, proxies=None, note_response=None):
         """
         爬取一个笔记的信息
         :param note_url:
         :param cookies_str:
+        :param note_response: 已经批量请求到的笔记详细 (success, msg, res_json)，为None时单独请求
         :return:
         """
         note_info = None
         raw_data = None
         try:
-            success, msg, response_data = self.xhs_apis.get_note_info(note_url, cookies_str, proxies)
+            if note_response is None:
+                note_response = self.xhs_apis.get_note_info(note_url, cookies_str, proxies)
+            success, msg, response_data = note_response
             if success:
                 raw_data = response_data  # 保存原始数据
                 note_info = response_data['data']['items'][0]
@@ -77,12 +96,33 @@ class Data_Spider():
         except Exception as e:
             success = False
             msg = e
-            # 发送推送通知，爬取笔记失败
-            pusher.notify_error("爬取笔记失败", f"笔记URL: {note_url}\n错误信息: {msg}")
+            # 发送推送通知，爬取笔记失败；熔断中的失败只在熔断时通知一次
+            if not get_circuit_breaker().is_open():
+                pusher.notify_error("爬取笔记失败", f"笔记URL: {note_url}\n错误信息: {msg}")
         logger.info(f'爬取笔记信息 {note_url}: {success}, msg: {msg}')
         return success, msg, note_info, raw_data
 
-    def spider_some_note(self, notes: list, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None, user_name="未知", pre_fetched_notes=None):
+    def download_media(self, note_info, raw_data, base_path):
+        """
+        下载笔记的媒体文件，在媒体下载流水线的下载线程中执行
+        :return: 地址已过期的媒体URL列表
+        """
+        expired_urls = []
+        download_note(note_info, base_path['media'], raw_data, base_path.get('csv'), expired_urls)
+        return expired_urls
+
+    def submit_prefetched_download(self, note_url, note_info, raw_data, base_path, save_choice, media_futures):
+        """
+        获取到笔记详细后立即提交媒体下载，其余笔记的详细请求与下载同时进行；之后由spider_some_note等待下载结果
+        :param media_futures: 已提交下载的笔记字典 {note_url: Future}，提交后写入
+        """
+        if save_choice != 'all' and save_choice != 'media':
+            return
+        if check_note_files_complete(note_info['note_id'], base_path.get('csv'), base_path.get('media')):
+            return
+        media_futures[note_url] = get_media_pipeline().submit(self.download_media, note_info, raw_data, base_path)
+
+    def spider_some_note(self, notes: list, cookies_str: str, base_path: dict, save_choice: str, excel_name: str = '', proxies=None, user_name="未知", pre_fetched_notes=None, media_futures=None):
         """
         爬取一些笔记的信息
         :param notes: 笔记URL列表
@@ -93,6 +133,7 @@ class Data_Spider():
         :param proxies: 代理
         :param user_name: 用户名称或搜索关键词，用于结果通知
         :param pre_fetched_notes: 已经获取过详细信息的笔记字典，格式为 {note_url: (note_info, raw_data)}
+        :param media_futures: 获取详细后已提交下载的预获取笔记，格式为 {note_url: Future}，不再重复提交
         :return:
         """
         if (save_choice == 'all' or save_choice == 'excel') and excel_name == '':
@@ -103,6 +144,8 @@ class Data_Spider():
         
         # 初始化预获取笔记字典
         pre_fetched_notes = pre_fetched_notes or {}
+        media_futures = media_futures or {}
+        submitted_jobs = {}  # 已提交下载的预获取笔记 {在note_list中的索引: Future}
         
         # 开始下载前记录总笔记数
         total_notes = len(notes)
@@ -112,6 +155,7 @@ class Data_Spider():
             
         # 先检查本地文件完整性，只对不完整的笔记发起API请求
         needs_api_request = []  # 需要发起API请求的笔记
+        repair_note_urls = {}  # 使用本地info.json补全文件的笔记 {note_id: note_url}
         for note_url in notes:
             # 从URL中提取笔记ID
             note_id = note_url.split('/')[-1].split('?')[0]
@@ -122,6 +166,8 @@ class Data_Spider():
                 note_info, raw_data = pre_fetched_notes[note_url]
                 note_list.append(note_info)
                 raw_data_dict[note_info['note_id']] = raw_data
+                if note_url in media_futures:
+                    submitted_jobs[len(note_list) - 1] = media_futures[note_url]
                 continue
                 
             # 检查CSV记录和本地文件完整性
@@ -129,65 +175,72 @@ class Data_Spider():
             
             if is_complete:
                 logger.debug(f"笔记 {note_id} 本地文件完整，跳过API请求")
-                # 尝试从本地加载笔记信息
-                try:
-                    user_id = None
-                    # 查找对应的CSV文件
-                    csv_path = base_path.get('csv')
-                    if csv_path:
-                        import glob
-                        # 搜索可能包含此笔记的CSV文件
-                        for csv_file in glob.glob(os.path.join(csv_path, '*_download_record.csv')):
-                            try:
-                                with open(csv_file, 'r', encoding='utf-8') as f:
-                                    reader = csv.reader(f)
-                                    next(reader)  # 跳过表头
-                                    for row in reader:
-                                        if row and row[0] == note_id:
-                                            user_id = os.path.basename(csv_file).replace('_download_record.csv', '')
-                                            break
-                                    if user_id:
-                                        break
-                            except Exception as e:
-                                logger.warning(f"读取CSV文件错误 {csv_file}: {e}")
-                    
-                    if user_id:
-                        # 尝试加载info.json
-                        nickname = "未知用户"  # 默认昵称
-                        title = note_id  # 默认使用ID作为标题
-                        
-                        # 遍历用户文件夹寻找对应笔记
-                        media_path = base_path.get('media')
-                        if media_path and os.path.exists(media_path):
-                            for user_folder in os.listdir(media_path):
-                                if user_folder.endswith(f"_{user_id}"):
-                                    user_dir = os.path.join(media_path, user_folder)
-                                    # 查找包含note_id的文件夹
-                                    for note_folder in os.listdir(user_dir):
-                                        if note_id in note_folder and os.path.isdir(os.path.join(user_dir, note_folder)):
-                                            note_dir = os.path.join(user_dir, note_folder)
-                                            info_path = os.path.join(note_dir, 'info.json')
-                                            if os.path.exists(info_path):
-                                                with open(info_path, 'r', encoding='utf-8') as f:
-                                                    note_info = json.load(f)
-                                                    note_list.append(note_info)
-                                                    logger.debug(f"从本地加载笔记 {note_id} 详细信息")
-                                                    break
-                    
-                    # 如果未能从本地加载，仍需API请求
-                    if note_id not in [note.get('note_id') for note in note_list if note]:
-                        needs_api_request.append(note_url)
-                except Exception as e:
-                    logger.warning(f"尝试从本地加载笔记 {note_id} 信息失败: {e}")
+                # 从本地加载笔记信息，未能加载时仍需API请求
+                note_info, _ = load_stored_note(note_id, base_path.get('csv'), base_path.get('media'))
+                if note_info:
+                    note_list.append(note_info)
+                    logger.debug(f"从本地加载笔记 {note_id} 详细信息")
+                else:
                     needs_api_request.append(note_url)
             else:
-                # 文件不完整，需要API请求
-                needs_api_request.append(note_url)
+                # 文件不完整时先用本地info.json中的媒体地址补全缺失的文件，地址过期时再请求笔记详细
+                note_info, raw_data = load_stored_note(note_id, base_path.get('csv'), base_path.get('media'))
+                if note_info and (note_info.get('image_list') or note_info.get('video_addr')):
+                    note_list.append(note_info)
+                    raw_data_dict[note_id] = raw_data
+                    repair_note_urls[note_id] = note_url
+                else:
+                    needs_api_request.append(note_url)
         
-        # 对需要API请求的笔记进行爬取
+        if repair_note_urls:
+            logger.info(f"{len(repair_note_urls)} 个笔记文件不完整，使用本地保存的媒体地址补全")
+        
+        # 笔记详细就绪后立即提交到媒体下载流水线，获取下一个笔记详细的同时下载上一个笔记的媒体
         actually_downloaded_count = 0
         api_request_count = len(needs_api_request)
+        media_jobs = []  # 已提交下载的笔记 [(在note_list中的索引, Future)]
+        
+        def schedule_download(index):
+            """
+            检查笔记是否已完整下载，未完整时提交下载任务，下载队列已满时等待
+            """
+            nonlocal actually_downloaded_count
+            if index in submitted_jobs:
+                media_jobs.append((index, submitted_jobs[index]))
+                actually_downloaded_count += 1
+                return
+            note_info = note_list[index]
+            if not note_info or not note_info.get('note_id'):
+                return
+            if save_choice != 'all' and save_choice != 'media':
+                return
+            note_id = note_info['note_id']
+            
+            # 检查是否已存在且完整
+            is_complete = check_note_files_complete(note_id, base_path.get('csv'), base_path.get('media'))
+            
+            # 如果已完成，则记录跳过；否则提交下载并增加计数
+            if is_complete:
+                logger.debug(f"笔记 {note_id} 已完整下载，跳过")
+                
+                # 确保CSV记录中正确标记为完成
+                user_id = note_info.get('user_id')
+                if user_id and base_path.get('csv'):
+                    logger.debug(f"尝试更新CSV记录状态: 笔记ID={note_id}, 用户ID={user_id}, 状态=True")
+                    # 方法1: 使用update_download_status函数
+                    update_download_status(note_id, user_id, True, base_path.get('csv'))
+                    
+                    # 方法2: 尝试使用create_note_record强制更新记录状态
+                    create_note_record(note_info, base_path.get('csv'), update_record=True)
+            else:
+                media_jobs.append((index, get_media_pipeline().submit(self.download_media, note_info, raw_data_dict.get(note_id), base_path)))
+                actually_downloaded_count += 1
+        
+        # 已有详细信息的笔记先开始下载
+        for index in range(len(note_list)):
+            schedule_download(index)
         
+        # 对需要API请求的笔记进行爬取
         if api_request_count > 0:
             logger.info(f"总共 {total_notes} 个笔记，需要API请求的数量: {api_request_count}")
             
@@ -200,6 +253,7 @@ class Data_Spider():
                         note_list.append(note_info)
                         if raw_data:
                             raw_data_dict[note_info['note_id']] = raw_data
+                        schedule_download(len(note_list) - 1)
                     else:
                         # 记录下载失败的笔记
                         failed_note = {
@@ -214,37 +268,42 @@ class Data_Spider():
                         'error': str(e)
                     })
         
-        # 处理下载成功的笔记
-        for note_info in note_list:
-            if not note_info:
-                continue
-                
+        def download_failed(index, error):
+            note_info = note_list[index]
             note_id = note_info.get('note_id')
-            if not note_id:
+            logger.error(f"下载笔记 {note_id} 时发生异常: {error}")
+            failed_notes.append({
+                'note_url': repair_note_urls.get(note_id) or note_info.get('note_url')
+                            or f"https://www.xiaohongshu.com/explore/{note_id}",
+                'error': str(error)
+            })
+        
+        # 等待所有下载完成
+        repair_jobs = []  # 媒体地址过期后重新提交下载的笔记 [(在note_list中的索引, Future)]
+        for index, future in media_jobs:
+            try:
+                expired_urls = future.result()
+            except Exception as e:
+                download_failed(index, e)
                 continue
-                
-            if save_choice == 'all' or save_choice == 'media':
-                raw_data = raw_data_dict.get(note_id)
-                
-                # 检查是否已存在且完整
-                is_complete = check_note_files_complete(note_id, base_path.get('csv'), base_path.get('media'))
-                
-                # 如果已完成，则记录跳过；否则进行下载并增加计数
-                if is_complete:
-                    logger.debug(f"笔记 {note_id} 已完整下载，跳过")
-                    
-                    # 确保CSV记录中正确标记为完成
-                    user_id = note_info.get('user_id')
-                    if user_id and base_path.get('csv'):
-                        logger.debug(f"尝试更新CSV记录状态: 笔记ID={note_id}, 用户ID={user_id}, 状态=True")
-                        # 方法1: 使用update_download_status函数
-                        update_download_status(note_id, user_id, True, base_path.get('csv'))
-                        
-                        # 方法2: 尝试使用create_note_record强制更新记录状态
-                        create_note_record(note_info, base_path.get('csv'), update_record=True)
+            note_id = note_list[index]['note_id']
+            # 本地保存的媒体地址已过期，重新获取笔记详细后再提交下载
+            if expired_urls and note_id in repair_note_urls:
+                logger.info(f"笔记 {note_id} 有 {len(expired_urls)} 个媒体地址已过期，重新获取笔记详细")
+                success, msg, fresh_note_info, raw_data = self.spider_note(repair_note_urls[note_id], cookies_str, proxies)
+                if success and fresh_note_info:
+                    note_list[index] = fresh_note_info
+                    repair_jobs.append((index, get_media_pipeline().submit(self.download_media, fresh_note_info, raw_data, base_path)))
                 else:
-                    download_note(note_info, base_path['media'], raw_data, base_path.get('csv'))
-                    actually_downloaded_count += 1
+                    failed_notes.append({
+                        'note_url': repair_note_urls[note_id],
+                        'error': msg if isinstance(msg, str) else str(msg)
+                    })
+        for index, future in repair_jobs:
+            try:
+                future.result()
+            except Exception as e:
+                download_failed(index, e)
         
         # 保存到Excel
         if save_choice == 'all' or save_choice == 'excel':
@@ -280,41 +339,80 @@ class Data_Spider():
         try:
             # 从URL中提取用户ID
             user_id = user_url.split('/')[-1].split('?')[0]
+            csv_path = base_path.get('csv')
             
-            # 尝试获取用户信息
+            # 用户昵称优先使用缓存，缓存过期或没有缓存时才请求用户信息
+            profile_cache = self.get_profile_cache(csv_path) if csv_path else None
+            profile = profile_cache.get(user_id) if profile_cache else None
+            if profile:
+                nickname = profile['nickname'] or nickname
+            else:
+                try:
+                    success, msg, user_info = self.xhs_apis.get_user_info(user_id, cookies_str, proxies)
+                    if success and 'data' in user_info and 'basic_info' in user_info['data']:
+                        nickname = user_info['data']['basic_info'].get('nickname', "未知用户")
+                        if profile_cache:
+                            profile_cache.put(user_id, user_info['data']['basic_info'])
+                except Exception as e:
+                    logger.warning(f"获取用户信息失败: {e}")
+            
+            # 读取已下载记录
+            existing_notes = set()
+            existing_notes_info = {}  # 存储已下载笔记的信息
+            if csv_path and user_id:
+                csv_file = os.path.join(csv_path, f'{user_id}_download_record.csv')
+                if os.path.exists(csv_file):
+                    with open(csv_file, 'r', encoding='utf-8') as f:
+                        reader = csv.reader(f)
+                        next(reader)  # 跳过表头
+                        for row in reader:
+                            if row and len(row) > 0:
+                                note_id = row[0]
+                                existing_notes.add(note_id)  # 添加note_id
+                                # 存储笔记的标题、类型和描述等信息
+                                if len(row) >= 7:  # 确保行包含所有必要字段
+                                    existing_notes_info[note_id] = {
+                                        'title': row[3],  # title在第4列
+                                        'note_type': row[2],  # note_type在第3列
+                                        'desc': row[4],  # desc在第5列
+                                    }
+
+            # 增量同步：笔记按发布时间倒序返回，连续遇到足够多已记录的笔记后停止翻页；
+            # 每隔一段时间全量同步一次，补全更早笔记的下载和Excel
+            incremental_sync = os.getenv('INCREMENTAL_SYNC', 'true').lower() == 'true'
+            stop_after_known = int(os.getenv('INCREMENTAL_STOP_KNOWN', '10'))
+            full_sync_interval = float(os.getenv('FULL_SYNC_INTERVAL_HOURS', '24'))
+            sync_state = SyncState(os.path.join(csv_path, 'sync_state.json')) if csv_path else None
+            full_sync = (not incremental_sync or not existing_notes or sync_state is None
+                         or sync_state.needs_full_sync(user_id, full_sync_interval))
+
+            # 逐页获取笔记列表
+            all_note_info = []
+            page_count = 0
+            known_run = 0  # 连续遇到的已记录笔记数量
             try:
-                success, msg, user_info = self.xhs_apis.get_user_info(user_id, cookies_str, proxies)
-                if success and 'data' in user_info and 'basic_info' in user_info['data']:
-                    nickname = user_info['data']['basic_info'].get('nickname', "未知用户")
+                for notes, _ in self.xhs_apis.iter_user_all_notes(user_url, cookies_str, proxies):
+                    page_count += 1
+                    all_note_info.extend(notes)
+                    for simple_note_info in notes:
+                        known_run = known_run + 1 if simple_note_info['note_id'] in existing_notes else 0
+                    if not full_sync and known_run >= stop_after_known:
+                        break
+                success, msg = True, 'success'
             except Exception as e:
-                logger.warning(f"获取用户信息失败: {e}")
-            
-            # 获取笔记列表
-            success, msg, all_note_info = self.xhs_apis.get_user_all_notes(user_url, cookies_str, proxies)
+                success, msg = False, str(e)
             if success:
-                logger.info(f'用户 {nickname}({user_id}) 作品数量: {len(all_note_info)}')
-                
-                # 读取已下载记录
-                csv_path = base_path.get('csv')
-                existing_notes = set()
-                existing_notes_info = {}  # 存储已下载笔记的信息
-                if csv_path and user_id:
-                    csv_file = os.path.join(csv_path, f'{user_id}_download_record.csv')
-                    if os.path.exists(csv_file):
-                        with open(csv_file, 'r', encoding='utf-8') as f:
-                            reader = csv.reader(f)
-                            next(reader)  # 跳过表头
-                            for row in reader:
-                                if row and len(row) > 0:
-                                    note_id = row[0]
-                                    existing_notes.add(note_id)  # 添加note_id
-                                    # 存储笔记的标题、类型和描述等信息
-                                    if len(row) >= 7:  # 确保行包含所有必要字段
-                                        existing_notes_info[note_id] = {
-                                            'title': row[3],  # title在第4列
-                                            'note_type': row[2],  # note_type在第3列
-                                            'desc': row[4],  # desc在第5列
-                                        }
+                # 笔记列表中带有作者昵称，昵称变化时更新缓存
+                if profile_cache and all_note_info:
+                    author = all_note_info[0].get('user') or {}
+                    if profile_cache.refresh(user_id, author.get('nickname'), author.get('avatar')):
+                        nickname = author['nickname']
+                if full_sync:
+                    logger.info(f'用户 {nickname}({user_id}) 作品数量: {len(all_note_info)}')
+                    if sync_state is not None:
+                        sync_state.mark_full_sync(user_id)
+                else:
+                    logger.info(f'用户 {nickname}({user_id}) 增量同步: 翻页 {page_count} 页，检查最近 {len(all_note_info)} 篇笔记')
                 
                 # 收集笔记和潜在的新笔记
                 potential_new_notes = []  # 潜在新笔记的ID和URL
@@ -334,19 +432,25 @@ class Data_Spider():
                 # 只对新笔记发起API请求
                 confirmed_new_notes = []
                 pre_fetched_notes = {}  # 保存已获取的笔记详细信息
+                media_futures = {}  # 获取详细后立即提交下载的笔记 {note_url: Future}
                 
                 if potential_new_notes:
                     logger.info(f"发现{len(potential_new_notes)}篇潜在新笔记，获取详细信息...")
-                    for new_note in potential_new_notes:
+                    # 批量签名并请求所有潜在新笔记的详细信息，每篇笔记返回后立即处理，不等待整批完成
+                    note_urls = [new_note['note_url'] for new_note in potential_new_notes]
+                    for index, note_response in self.xhs_apis.iter_some_note_info(note_urls, cookies_str, proxies):
+                        new_note = potential_new_notes[index]
                         note_id = new_note['note_id']
                         note_url = new_note['note_url']
                         
                         try:
                             # 获取完整的笔记信息
-                            success, msg, note_info, raw_data = self.spider_note(note_url, cookies_str, proxies)
+                            success, msg, note_info, raw_data = self.spider_note(note_url, cookies_str, proxies, note_response)
                             if success and note_info:
                                 # 缓存已获取的详细信息
                                 pre_fetched_notes[note_url] = (note_info, raw_data)
+                                if profile_cache and profile_cache.refresh(user_id, note_info.get('nickname'), note_info.get('avatar')):
+                                    nickname = note_info['nickname']
                                 
                                 # 使用详细信息创建CSV记录
                                 is_existing, _ = create_note_record(note_info, base_path.get('csv'))
@@ -354,6 +458,7 @@ class Data_Spider():
                                     # 添加到确认的新笔记列表
                                     confirmed_new_notes.append(note_info)
                                     logger.debug(f"确认新笔记: ID={note_id}, 标题='{note_info['title']}', 类型='{note_info['note_type']}', 描述='{note_info['desc']}'")
+                                self.submit_prefetched_download(note_url, note_info, raw_data, base_path, save_choice, media_futures)
                             else:
                                 logger.warning(f"获取笔记 {note_id} 详细信息失败: {msg}")
                         except Exception as e:
@@ -369,7 +474,14 @@ class Data_Spider():
                 # 下载所有笔记（包括旧笔记）
                 if save_choice == 'all' or save_choice == 'excel':
                     excel_name = user_url.split('/')[-1].split('?')[0]
-                self.spider_some_note(note_list, cookies_str, base_path, save_choice, excel_name, proxies, nickname, pre_fetched_notes)
+                    if not full_sync:
+                        # 增量同步只取到了最近的笔记，Excel留到全量同步时再整体更新
+                        save_choice = 'media' if save_choice == 'all' else None
+                if save_choice:
+                    self.spider_some_note(note_list, cookies_str, base_path, save_choice, excel_name, proxies, nickname, pre_fetched_notes, media_futures)
+            elif get_circuit_breaker().is_open():
+                # 熔断中的失败只在熔断时通知一次
+                logger.warning(f"用户 {nickname}({user_id}) 爬取失败，接口请求熔断中: {msg}")
             else:
                 # 推送错误通知
                 if "登录" in msg or "cookie" in str(msg).lower():
@@ -404,64 +516,69 @@ class Data_Spider():
         note_list = []
         new_note_list = []  # 新增笔记列表
         try:
-            success, msg, notes = self.xhs_apis.search_some_note(query, require_num, cookies_str, sort, note_type, proxies)
-            if success:
-                notes = list(filter(lambda x: x['model_type'] == "note", notes))
-                logger.info(f'搜索关键词 {query} 笔记数量: {len(notes)}')
-                
-                # 读取已下载记录
-                existing_notes = set()
-                existing_notes_info = {}  # 存储已下载笔记信息
-                csv_path = base_path.get('csv')
-                if csv_path:
-                    import glob
-                    import csv
-                    # 搜索可能涉及多个用户，需要检查所有CSV记录
-                    for csv_file in glob.glob(os.path.join(csv_path, '*_download_record.csv')):
-                        try:
-                            with open(csv_file, 'r', encoding='utf-8') as f:
-                                reader = csv.reader(f)
-                                next(reader)  # 跳过表头
-                                for row in reader:
-                                    if row and len(row) > 0:
-                                        note_id = row[0]
-                                        existing_notes.add(note_id)  # 添加note_id
-                                        if len(row) >= 7:  # 确保行包含所有必要字段
-                                            existing_notes_info[note_id] = {
-                                                'title': row[3],  # title在第4列
-                                                'note_type': row[2],  # note_type在第3列
-                                                'desc': row[4],  # desc在第5列
-                                            }
-                        except Exception as e:
-                            logger.warning(f"读取CSV文件错误 {csv_file}: {e}")
-                
-                # 收集潜在的新笔记
-                potential_new_notes = []  # 潜在新笔记的ID和URL
-                for note in notes:
-                    note_id = note['id']
-                    note_url = f"https://www.xiaohongshu.com/explore/{note_id}?xsec_token={note['xsec_token']}"
-                    note_list.append(note_url)
-                    
-                    # 检查是否为新笔记
-                    if note_id not in existing_notes:
-                        potential_new_notes.append({
-                            'note_id': note_id,
-                            'note_url': note_url
-                        })
-                
-                # 只对新笔记发起API请求
-                confirmed_new_notes = []
-                pre_fetched_notes = {}  # 保存已获取的笔记详细信息
-                
-                if potential_new_notes:
-                    logger.info(f"发现{len(potential_new_notes)}篇潜在搜索结果笔记，获取详细信息...")
-                    for new_note in potential_new_notes:
+            # 读取已下载记录
+            existing_notes = set()
+            existing_notes_info = {}  # 存储已下载笔记信息
+            csv_path = base_path.get('csv')
+            if csv_path:
+                import glob
+                import csv
+                # 搜索可能涉及多个用户，需要检查所有CSV记录
+                for csv_file in glob.glob(os.path.join(csv_path, '*_download_record.csv')):
+                    try:
+                        with open(csv_file, 'r', encoding='utf-8') as f:
+                            reader = csv.reader(f)
+                            next(reader)  # 跳过表头
+                            for row in reader:
+                                if row and len(row) > 0:
+                                    note_id = row[0]
+                                    existing_notes.add(note_id)  # 添加note_id
+                                    if len(row) >= 7:  # 确保行包含所有必要字段
+                                        existing_notes_info[note_id] = {
+                                            'title': row[3],  # title在第4列
+                                            'note_type': row[2],  # note_type在第3列
+                                            'desc': row[4],  # desc在第5列
+                                        }
+                    except Exception as e:
+                        logger.warning(f"读取CSV文件错误 {csv_file}: {e}")
+
+            confirmed_new_notes = []
+            pre_fetched_notes = {}  # 保存已获取的笔记详细信息
+            media_futures = {}  # 获取详细后立即提交下载的笔记 {note_url: Future}
+
+            # 逐页获取搜索结果，下一页在后台预取，同时获取本页新笔记的详细信息
+            try:
+                for notes, page in self.xhs_apis.iter_search_note(query, cookies_str, require_num, sort, note_type, proxies):
+                    notes = list(filter(lambda x: x['model_type'] == "note", notes))
+
+                    # 收集潜在的新笔记
+                    potential_new_notes = []  # 潜在新笔记的ID和URL
+                    for note in notes:
+                        note_id = note['id']
+                        note_url = f"https://www.xiaohongshu.com/explore/{note_id}?xsec_token={note['xsec_token']}"
+                        note_list.append(note_url)
+
+                        # 检查是否为新笔记
+                        if note_id not in existing_notes:
+                            potential_new_notes.append({
+                                'note_id': note_id,
+                                'note_url': note_url
+                            })
+
+                    # 只对新笔记发起API请求
+                    if not potential_new_notes:
+                        continue
+                    logger.info(f"搜索结果第{page}页发现{len(potential_new_notes)}篇潜在新笔记，获取详细信息...")
+                    # 批量签名并请求本页潜在新笔记的详细信息，每篇笔记返回后立即处理，不等待整批完成
+                    note_urls = [new_note['note_url'] for new_note in potential_new_notes]
+                    for index, note_response in self.xhs_apis.iter_some_note_info(note_urls, cookies_str, proxies):
+                        new_note = potential_new_notes[index]
                         note_id = new_note['note_id']
                         note_url = new_note['note_url']
                         
                         try:
                             # 获取完整的笔记信息
-                            success, msg, note_info, raw_data = self.spider_note(note_url, cookies_str, proxies)
+                            success, msg, note_info, raw_data = self.spider_note(note_url, cookies_str, proxies, note_response)
                             if success and note_info:
                                 # 缓存已获取的详细信息
                                 pre_fetched_notes[note_url] = (note_info, raw_data)
@@ -472,22 +589,32 @@ class Data_Spider():
                                     # 添加到确认的新笔记列表
                                     confirmed_new_notes.append(note_info)
                                     logger.debug(f"确认搜索笔记: ID={note_id}, 标题='{note_info['title']}', 类型='{note_info['note_type']}', 描述='{note_info['desc']}'")
+                                self.submit_prefetched_download(note_url, note_info, raw_data, base_path, save_choice, media_futures)
                             else:
                                 logger.warning(f"获取搜索笔记 {note_id} 详细信息失败: {msg}")
                         except Exception as e:
                             logger.warning(f"处理搜索笔记 {note_id} 时出错: {e}")
-                    
-                    # 推送新笔记通知
-                    if confirmed_new_notes:
-                        pusher.notify_new_notes(f"搜索: {query}", confirmed_new_notes)
-                        logger.info(f"搜索关键词'{query}'发现{len(confirmed_new_notes)}篇新笔记，已推送通知")
-                    else:
-                        logger.info(f"搜索关键词'{query}'没有发现新笔记，跳过推送通知")
+                success, msg = True, 'success'
+            except Exception as e:
+                success, msg = False, str(e)
+
+            if success:
+                logger.info(f'搜索关键词 {query} 笔记数量: {len(note_list)}')
+
+                # 推送新笔记通知
+                if confirmed_new_notes:
+                    pusher.notify_new_notes(f"搜索: {query}", confirmed_new_notes)
+                    logger.info(f"搜索关键词'{query}'发现{len(confirmed_new_notes)}篇新笔记，已推送通知")
+                else:
+                    logger.info(f"搜索关键词'{query}'没有发现新笔记，跳过推送通知")
                 
                 # 下载所有笔记（包括旧笔记）
                 if save_choice == 'all' or save_choice == 'excel':
                     excel_name = query
-                self.spider_some_note(note_list, cookies_str, base_path, save_choice, excel_name, proxies, f"搜索: {query}", pre_fetched_notes)
+                self.spider_some_note(note_list, cookies_str, base_path, save_choice, excel_name, proxies, f"搜索: {query}", pre_fetched_notes, media_futures)
+            elif get_circuit_breaker().is_open():
+                # 熔断中的失败只在熔断时通知一次
+                logger.warning(f"搜索关键词 {query} 失败，接口请求熔断中: {msg}")
             else:
                 # 推送错误通知
                 if "登录" in msg or "cookie" in str(msg).lower():
@@ -555,6 +682,17 @@ if __name__ == '__main__':
         logger.info(f"用户间隔时间配置: {min_wait_seconds}-{max_wait_seconds}秒")
             
         for i, user_url in enumerate(user_urls):
+            # 本轮时间预算用完时，剩余用户留到下一轮
+            if deadline_exceeded():
+                logger.warning(f"本轮时间预算已用完，剩余 {len(user_urls) - i} 个用户留到下一轮处理")
+                break
+            # 连续登录失效或被限流时熔断，剩余用户不再发起请求
+            circuit_breaker = get_circuit_breaker()
+            if circuit_breaker.is_open():
+                logger.warning(f"接口请求熔断中，剩余 {len(user_urls) - i} 个用户留到下一轮处理")
+                pusher.notify_error("请求熔断", f"连续多次请求登录失效或被限流，暂停所有接口请求 {circuit_breaker.remaining() / 60:.0f} 分钟\n"
+                                               f"剩余 {len(user_urls) - i} 个用户留到下一轮处理，请检查cookies或降低请求频率")
+                break
             # 提取用户ID用于日志
             user_id = user_url.split('/')[-1].split('?')[0]
             logger.info(f"开始处理用户 {i+1}/{len(user_urls)}: {user_id}")
@@ -570,9 +708,13 @@ if __name__ == '__main__':
                     logger.warning(f"用户 {user_id} 爬取出现问题: {msg}")
                 
                 # 如果不是最后一个用户，等待随机时间
-                if i < len(user_urls) - 1:
+                # 接口请求已由限速器控制频率，USER_INTERVAL_MAX 设为0时不再额外等待
+                if i < len(user_urls) - 1 and max_wait_seconds > 0:
                     # 随机等待时间（使用配置的范围）
                     wait_seconds = random.randint(min_wait_seconds, max_wait_seconds)
+                    remaining = remaining_time()
+                    if remaining is not None:
+                        wait_seconds = max(0, min(wait_seconds, int(remaining)))
                     logger.info(f"等待 {wait_seconds} 秒后继续下一个用户")
                     time.sleep(wait_seconds)
                     logger.info("等待结束，开始下一个用户")
@@ -581,7 +723,7 @@ if __name__ == '__main__':
                 pusher.notify_error("爬虫错误", f"处理用户 {user_id} 时出错: {e}")
                 
                 # 即使出错，也等待一段时间再继续
-                if i < len(user_urls) - 1:
+                if i < len(user_urls) - 1 and max_wait_seconds > 0:
                     wait_seconds = random.randint(min_wait_seconds // 2, max_wait_seconds // 2)  # 出错后等待稍短一些
                     logger.info(f"出错后等待 {wait_seconds} 秒后继续")
                     time.sleep(wait_seconds)
@@ -599,12 +741,15 @@ if __name__ == '__main__':
         :param base_path: 保存路径
         """
         cycle_count = 0  # 周期计数
+        login_alert_sent = False  # 账号全部失效的通知只发送一次，恢复后重置
         
         while True:
             try:
                 # 每轮循环开始时重新读取环境变量，获取最新的cookies、日志级别和用户URL列表
                 current_cookies, current_log_level = load_env()
                 current_user_urls = load_user_urls()
+                # 账号池使用最新的cookies，更换过cookies的账号重新可用
+                get_cookie_pool().update(load_cookies_list())
                 
                 # 更新日志级别
                 update_logger_level(current_log_level)
@@ -630,6 +775,29 @@ if __name__ == '__main__':
                     else:
                         logger.warning("无法确定下一个允许爬取的时间，将继续按计划执行")
                 
+                # 熔断中时等待熔断结束再开始本轮
+                circuit_breaker = get_circuit_breaker()
+                if circuit_breaker.is_open():
+                    # 试探请求进行中时剩余时间为0，至少等待1分钟
+                    wait_seconds = max(circuit_breaker.remaining(), 60)
+                    logger.warning(f"接口请求熔断中，等待 {wait_seconds / 60:.1f} 分钟后再开始爬取")
+                    time.sleep(wait_seconds)
+                    continue
+                
+                # 登录预检：逐个账号请求一次自己的信息，登录失效的账号被隔离，全部失效时跳过本轮
+                if os.environ.get('LOGIN_PREFLIGHT', 'true').lower() == 'true':
+                    valid_accounts = data_spider.xhs_apis.check_accounts()
+                    if valid_accounts == 0:
+                        logger.error("所有账号登录失效，本轮跳过，请更新.env中的cookies")
+                        if not login_alert_sent:
+                            pusher.notify_error("Cookies失效", "所有账号登录失效，爬取已暂停，请更新.env中的cookies，更新后下一轮自动恢复")
+                            login_alert_sent = True
+                        wait_minutes = 30
+                        logger.info(f"等待 {wait_minutes} 分钟后重新检查登录状态...")
+                        time.sleep(wait_minutes * 60)
+                        continue
+                    login_alert_sent = False
+                
                 # 记录当前轮次开始时间
                 cycle_count += 1
                 cycle_start_time = datetime.now()
@@ -638,7 +806,11 @@ if __name__ == '__main__':
                 pusher.notify_info("开始新周期", f"开始第 {cycle_count} 轮爬取周期，时间: {cycle_start_time.strftime('%Y-%m-%d %H:%M:%S')}\n将爬取 {len(current_user_urls)} 个用户")
                 
                 # 处理所有用户，使用最新读取的cookies和用户列表
-                process_users_with_interval(current_user_urls, current_cookies, base_path)
+                # cookies传None，每次请求从账号池中选择负载最低的可用账号
+                # 本轮的时间预算传递到每个接口请求，请求超时不会超过剩余时间
+                cycle_deadline_minutes = float(os.environ.get('CYCLE_DEADLINE_MINUTES', '0'))
+                with request_deadline(cycle_deadline_minutes * 60):
+                    process_users_with_interval(current_user_urls, None, base_path)
                 
                 # 计算本轮用时
                 cycle_end_time = datetime.now()
@@ -662,6 +834,30 @@ if __name__ == '__main__':
                 
                 # 记录等待信息
                 logger.info(f"第 {cycle_count} 轮爬取完成，用时 {duration_minutes:.1f} 分钟")
+                sign_stats = get_sign_pool().stats()
+                logger.debug(f"签名进程池: 已启动 {sign_stats['started']}/{sign_stats['size']} 个进程，累计签名 {sign_stats['calls']} 次，失败 {sign_stats['errors']} 次，重启 {sign_stats['restarts']} 次")
+                http_stats = data_spider.xhs_apis.session_stats()
+                logger.debug(f"HTTP连接池: 累计请求 {http_stats['requests']} 次，新建连接 {http_stats['connections']} 个，复用连接 {http_stats['reused']} 次，"
+                             f"重试 {data_spider.xhs_apis.executor.retry_count} 次")
+                flight_stats = data_spider.xhs_apis.note_flight_stats()
+                logger.debug(f"笔记详细请求: 共 {flight_stats['requests']} 次，与并发的相同请求合并 {flight_stats['coalesced']} 次")
+                media_stats = get_media_pipeline().stats()
+                logger.debug(f"媒体下载流水线: {media_stats['workers']} 个下载线程，累计提交 {media_stats['submitted']} 个笔记，队列满等待 {media_stats['blocked']} 次")
+                account_stats = data_spider.xhs_apis.cookie_pool_stats()
+                logger.info(f"账号池: 可用 {sum(not account['quarantined'] for account in account_stats)}/{len(account_stats)} 个账号，"
+                            f"各账号请求数 {[account['requests'] for account in account_stats]}")
+                proxy_stats = data_spider.xhs_apis.proxy_pool_stats()
+                if proxy_stats:
+                    logger.info(f"代理池: 可用 {sum(not proxy['ejected'] for proxy in proxy_stats)}/{len(proxy_stats)} 个代理，"
+                                f"各代理请求数 {[proxy['requests'] for proxy in proxy_stats]}")
+                breaker_stats = data_spider.xhs_apis.circuit_breaker_stats()
+                if breaker_stats['trips']:
+                    logger.info(f"请求熔断: 本进程累计熔断 {breaker_stats['trips']} 次，熔断期间拒绝请求 {breaker_stats['rejected']} 次")
+                rate_stats = data_spider.xhs_apis.executor.limiter.stats()
+                adaptive_stats = rate_stats['adaptive']
+                logger.info(f"请求速度: 当前 {adaptive_stats['rate']} 次/秒，本进程累计降速 {adaptive_stats['decreases']} 次，"
+                            f"被限流 {adaptive_stats['throttled']} 次，限速等待 {rate_stats['waits']} 次共 {rate_stats['wait_seconds']} 秒")
+                export_metrics(data_spider.xhs_apis.executor.stats(), os.path.join(base_path['metrics'], 'request_metrics.jsonl'))
                 logger.info(f"等待 {wait_minutes} 分钟后开始第 {cycle_count + 1} 轮 (将在 {next_start_time.strftime('%Y-%m-%d %H:%M:%S')} 继续)")
                 
                 # 只有在第一轮或者每5轮发送一次休息通知，避免通知过多
@@ -685,7 +881,9 @@ if __name__ == '__main__':
         logger.info("启动一次性运行模式，将处理所有用户后退出")
         
         # 一次性运行模式不受时间段限制，直接处理
-        process_users_with_interval(user_urls, cookies_str, base_path)
+        # cookies传None，每次请求从账号池中选择负载最低的可用账号
+        with request_deadline(float(os.environ.get('CYCLE_DEADLINE_MINUTES', '0')) * 60):
+            process_users_with_interval(user_urls, None, base_path)
         logger.info("一次性运行模式完成，程序退出")
     else:
         # 持续监听模式（默认）
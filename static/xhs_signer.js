@@ -0,0 +1,84 @@
+// 常驻签名进程：启动时加载一次签名脚本，之后通过 stdin/stdout 按行收发 JSON 请求
+// 请求格式: {"id": 1, "method": "get_request_headers_params", "params": [api, data, a1]}
+// 响应格式: {"id": 1, "result": ...} 或 {"id": 1, "error": "..."}
+// 直接运行时加载全部脚本；也可以被 xhs_signer_snapshot.js 引用，在构建启动快照时预先加载
+const fs = require('fs');
+const path = require('path');
+
+// 签名脚本中有大量console.log调试输出，stdout是通信通道，必须屏蔽
+const silentConsole = {
+    log() {}, info() {}, warn() {}, error() {}, debug() {}, trace() {},
+};
+
+function loadScript(file, locals, exportsExpr, requireFn) {
+    const source = fs.readFileSync(path.join(__dirname, file), 'utf8');
+    const declare = locals ? `var ${locals};\n` : '';
+    const factory = new Function('require', 'console', `${declare}${source}\nreturn ${exportsExpr};`);
+    return factory(requireFn, silentConsole);
+}
+
+// xray脚本需要把 self/window 挂到全局，供 require 进来的 webpack 包使用
+function loadXray(requireFn) {
+    return loadScript('xhs_xray.js', '', '{traceId: traceId}', requireFn);
+}
+
+// xs脚本的 window/document 指向 jsdom，声明为局部变量，避免覆盖 xray 使用的全局 window
+function loadXs(requireFn) {
+    return loadScript('xhs_xs_xsc_56.js', 'window, document', '{get_xs: get_xs, get_request_headers_params: get_request_headers_params}', requireFn);
+}
+
+function createMethods(xray, xs) {
+    return {
+        get_request_headers_params: (api, data, a1) => xs.get_request_headers_params(api, data, a1),
+        get_xs: (api, data, a1) => xs.get_xs(api, data, a1),
+        traceId: () => xray.traceId(),
+        traceId_batch: (count) => Array.from({ length: count }, () => xray.traceId()),
+        // 批量签名：一次往返返回多个请求的 xs/xt/xs_common 以及 x-xray-traceid
+        sign_batch: (items) => items.map(([api, data, a1]) => Object.assign(
+            xs.get_request_headers_params(api, data, a1),
+            { trace_id: xray.traceId() },
+        )),
+        ping: () => 'pong',
+        // 常驻内存占用，供进程池判断是否需要回收
+        memory: () => process.memoryUsage().rss,
+    };
+}
+
+function reply(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+function serve(methods) {
+    const readline = require('readline');
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
+    rl.on('line', (line) => {
+        if (!line.trim()) {
+            return;
+        }
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (e) {
+            reply({ id: null, error: `invalid request: ${e.message}` });
+            return;
+        }
+        const handler = methods[request.method];
+        if (!handler) {
+            reply({ id: request.id, error: `unknown method: ${request.method}` });
+            return;
+        }
+        try {
+            reply({ id: request.id, result: handler(...(request.params || [])) });
+        } catch (e) {
+            reply({ id: request.id, error: String(e && e.stack || e) });
+        }
+    });
+    rl.on('close', () => process.exit(0));
+    reply({ id: 0, result: 'ready' });
+}
+
+module.exports = { loadXray, loadXs, createMethods, serve };
+
+if (require.main === module) {
+    serve(createMethods(loadXray(require), loadXs(require)));
+}
@@ -0,0 +1,36 @@
+// 签名进程的 V8 启动快照入口
+// 构建: node --snapshot-blob xhs_signer.blob --build-snapshot xhs_signer_snapshot.js
+// 启动: node --snapshot-blob xhs_signer.blob [static目录]
+// 构建时预先执行体积最大的 xray webpack 包，启动时直接从快照恢复；jsdom 等第三方模块不能放进快照，启动后再加载 xs 脚本
+const fs = require('fs');
+const path = require('path');
+const v8 = require('v8');
+
+// 快照构建阶段 require 只能加载内置模块，static 目录下的脚本用这个简易加载器读入
+function fileRequire(baseDir) {
+    return function (name) {
+        if (!name.startsWith('.')) {
+            return require(name);
+        }
+        const file = path.resolve(baseDir, name);
+        if (!fs.existsSync(file)) {
+            const error = new Error(`Cannot find module '${name}'`);
+            error.code = 'MODULE_NOT_FOUND';
+            throw error;
+        }
+        const module = { exports: {} };
+        const factory = new Function('module', 'exports', 'require', '__filename', '__dirname', fs.readFileSync(file, 'utf8'));
+        factory(module, module.exports, fileRequire(path.dirname(file)), file, path.dirname(file));
+        return module.exports;
+    };
+}
+
+const signer = fileRequire(__dirname)('./xhs_signer.js');
+const xray = signer.loadXray(fileRequire(__dirname));
+
+v8.startupSnapshot.setDeserializeMainFunction(() => {
+    const { createRequire } = require('module');
+    const staticDir = process.argv[1] || __dirname;
+    const xs = signer.loadXs(createRequire(path.join(staticDir, 'xhs_signer.js')));
+    signer.serve(signer.createMethods(xray, xs));
+});
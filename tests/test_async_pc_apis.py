@@ -0,0 +1,130 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+import apis.async_pc_apis as async_pc_apis
+from apis.async_pc_apis import AsyncXHS_Apis
+from xhs_utils.circuit_breaker import CircuitBreaker
+from xhs_utils.deadline import request_deadline
+from xhs_utils.proxy_pool import ProxyPool
+
+
+class _NoLimit:
+    def reserve(self, endpoint, account):
+        return 0
+
+    def observe(self, latency, throttled):
+        pass
+
+
+class _SlowLimit(_NoLimit):
+    def reserve(self, endpoint, account):
+        return 5
+
+
+class _Response:
+    status = 200
+
+    async def json(self, content_type=None):
+        return {'success': True, 'msg': '成功'}
+
+
+class _SlowSession:
+    """
+    每个请求耗时delay秒的假会话
+    """
+    closed = False
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.proxies = []
+
+    def request(self, *args, proxy=None, **kwargs):
+        session = self
+        self.proxies.append(proxy)
+
+        class _Context:
+            async def __aenter__(self):
+                await asyncio.sleep(session.delay)
+                return _Response()
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return _Context()
+
+
+class AsyncSendTest(unittest.TestCase):
+    def setUp(self):
+        self.proxy_pool = ProxyPool([])
+        patches = [
+            mock.patch.object(async_pc_apis, 'get_rate_limiter', return_value=_NoLimit()),
+            mock.patch.object(async_pc_apis, 'get_circuit_breaker', return_value=CircuitBreaker(threshold=0)),
+            mock.patch.object(async_pc_apis, 'get_proxy_pool', return_value=self.proxy_pool),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_queued_account_does_not_block_other_accounts(self):
+        async def run():
+            xhs_apis = AsyncXHS_Apis(concurrency=4, per_account=2)
+            xhs_apis.session = _SlowSession(0.3)
+            xhs_apis._semaphore = asyncio.Semaphore(xhs_apis.concurrency)
+
+            async def send(a1):
+                start = time.monotonic()
+                success, _, _ = await xhs_apis._send('GET', '/api/test', {}, {'a1': a1}, '', None)
+                self.assertTrue(success)
+                return time.monotonic() - start
+
+            # 账号A一次提交10个请求，超过账号和全局的并发上限
+            burst = [asyncio.ensure_future(send('account_a')) for _ in range(10)]
+            await asyncio.sleep(0.05)
+            latency_b = await send('account_b')
+            await asyncio.gather(*burst)
+            return latency_b
+
+        latency_b = asyncio.run(run())
+        # 账号B不需要等待账号A排队的请求，一个请求的耗时内完成
+        self.assertLess(latency_b, 0.45)
+
+    def test_requests_use_proxy_pool(self):
+        self.proxy_pool = ProxyPool(['http://127.0.0.1:1', 'http://127.0.0.1:2'], max_in_flight=1)
+        async_pc_apis.get_proxy_pool.return_value = self.proxy_pool
+
+        async def run():
+            xhs_apis = AsyncXHS_Apis(concurrency=4, per_account=4)
+            xhs_apis.session = _SlowSession(0.05)
+            xhs_apis._semaphore = asyncio.Semaphore(xhs_apis.concurrency)
+            await asyncio.gather(*[xhs_apis._send('GET', '/api/test', {}, {'a1': 'account_a'}, '', None) for _ in range(4)])
+            return xhs_apis.session.proxies
+
+        used = asyncio.run(run())
+        self.assertEqual(set(used), {'http://127.0.0.1:1', 'http://127.0.0.1:2'})
+        for endpoint in self.proxy_pool.stats():
+            # 每个代理记录了请求数和延迟，并发上限为1时请求平均分配
+            self.assertEqual(endpoint['requests'], 2)
+            self.assertIsNotNone(endpoint['latency'])
+            self.assertEqual(endpoint['in_flight'], 0)
+
+    def test_rate_limit_wait_respects_deadline(self):
+        async_pc_apis.get_rate_limiter.return_value = _SlowLimit()
+
+        async def run():
+            xhs_apis = AsyncXHS_Apis(concurrency=4, per_account=4)
+            xhs_apis.session = _SlowSession(0)
+            with request_deadline(1):
+                return await xhs_apis._send('GET', '/api/test', {}, {'a1': 'account_a'}, '', None)
+
+        start = time.monotonic()
+        success, msg, _ = asyncio.run(run())
+        # 限速等待超过剩余时间时直接失败，不睡满等待时间
+        self.assertFalse(success)
+        self.assertIn('等待限速', msg)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
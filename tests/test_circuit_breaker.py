@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+
+from xhs_utils.circuit_breaker import CircuitBreaker, CircuitOpen
+
+
+class CircuitBreakerProbeTest(unittest.TestCase):
+    def _tripped(self):
+        circuit_breaker = CircuitBreaker(threshold=1, cooldown_minutes=0.05 / 60)
+        circuit_breaker.record(True, 'HTTP 461')
+        self.assertRaises(CircuitOpen, circuit_breaker.check)
+        time.sleep(0.06)
+        return circuit_breaker
+
+    def test_single_probe_after_cooldown(self):
+        circuit_breaker = self._tripped()
+        results = []
+        barrier = threading.Barrier(8)
+
+        def check():
+            barrier.wait()
+            try:
+                results.append(circuit_breaker.check())
+            except CircuitOpen:
+                results.append(None)
+
+        threads = [threading.Thread(target=check) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 熔断到期后只放行一个试探请求，其他请求在试探结束前仍然拒绝
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(results.count(None), 7)
+        self.assertTrue(circuit_breaker.is_open())
+
+        circuit_breaker.record(False, probe=True)
+        self.assertFalse(circuit_breaker.check())
+        self.assertFalse(circuit_breaker.is_open())
+
+    def test_failed_probe_trips_again(self):
+        circuit_breaker = self._tripped()
+        self.assertTrue(circuit_breaker.check())
+        circuit_breaker.record(True, '试探请求出错: ConnectionError()', probe=True)
+        # 重复记录已结束的试探不生效
+        circuit_breaker.record(True, '试探请求出错: ConnectionError()', probe=True)
+        self.assertEqual(circuit_breaker.stats()['trips'], 2)
+        self.assertRaises(CircuitOpen, circuit_breaker.check)
+
+
+if __name__ == '__main__':
+    unittest.main()
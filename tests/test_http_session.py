@@ -0,0 +1,26 @@
+import unittest
+from unittest import mock
+
+from xhs_utils.http_session import PooledSession
+
+
+class PooledSessionStatsTest(unittest.TestCase):
+    def test_stats_counts_pools(self):
+        session = PooledSession()
+        session.adapter.poolmanager.connection_from_url('https://edith.xiaohongshu.com')
+        stats = session.stats()
+        self.assertEqual(stats['hosts'], 1)
+        self.assertEqual(stats['connections'], 0)
+        self.assertEqual(stats['reused'], 0)
+
+    def test_stats_degrades_when_pools_unreadable(self):
+        session = PooledSession()
+        with mock.patch.object(PooledSession, '_connection_pools', side_effect=RuntimeError('changed size during iteration')):
+            stats = session.stats()
+        self.assertEqual(stats['requests'], 0)
+        self.assertIsNone(stats['connections'])
+        self.assertIsNone(stats['hosts'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+
+import apis.pc_apis as pc_apis
+from apis.pc_apis import XHS_Apis
+
+
+class _Response:
+    def __init__(self, note_id):
+        self.note_id = note_id
+
+    def json(self):
+        return {'success': True, 'msg': '成功', 'data': {'items': [{'id': self.note_id}]}}
+
+
+class IterSomeNoteInfoTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(pc_apis, 'generate_request_params_batch',
+                                  side_effect=lambda cookies_str, items: [({}, {}, data) for _, data in items])
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.xhs_apis = XHS_Apis(cookie_pool=mock.Mock())
+        self.posted = []
+
+        def post(url, data=None, **kwargs):
+            note_id = data['source_note_id']
+            self.posted.append(note_id)
+            return _Response(note_id)
+
+        self.xhs_apis.executor = mock.Mock(post=post)
+        self.urls = [f'https://www.xiaohongshu.com/explore/note{i}?xsec_token=token' for i in range(3)]
+
+    def test_yields_each_note_before_next_request(self):
+        notes = self.xhs_apis.iter_some_note_info(self.urls, 'a1=account')
+        index, (success, _, res_json) = next(notes)
+        # 第一篇笔记返回时后面的笔记还没有请求
+        self.assertEqual((index, success), (0, True))
+        self.assertEqual(res_json['data']['items'][0]['id'], 'note0')
+        self.assertEqual(self.posted, ['note0'])
+        self.assertEqual([index for index, _ in notes], [1, 2])
+
+    def test_abandoned_iteration_releases_waiters(self):
+        notes = self.xhs_apis.iter_some_note_info(self.urls, 'a1=account')
+        next(notes)
+        notes.close()
+        self.assertEqual(self.xhs_apis.note_flight.stats()['in_flight'], 0)
+
+    def test_get_some_note_info_keeps_order(self):
+        results = self.xhs_apis.get_some_note_info(self.urls, 'a1=account', batch_size=2)
+        self.assertEqual([res_json['data']['items'][0]['id'] for _, _, res_json in results], ['note0', 'note1', 'note2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
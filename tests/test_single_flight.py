@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+
+from xhs_utils.single_flight import SingleFlight
+
+
+def _note():
+    return {'data': {'items': [{'id': 'note', 'note_card': {'title': 'title'}}]}}
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_leader_mutation_after_finish_does_not_reach_waiters(self):
+        flight = SingleFlight()
+        call, leader = flight.begin('note')
+        self.assertTrue(leader)
+        waiter_call, waiter_leader = flight.begin('note')
+        self.assertFalse(waiter_leader)
+
+        result = _note()
+        flight.finish('note', call, result)
+        result['url'] = 'https://www.xiaohongshu.com/explore/note'
+        result['data']['items'][0]['note_card']['title'] = 'changed'
+
+        self.assertEqual(waiter_call.wait(), _note())
+
+    def test_waiters_copy_while_leader_mutates(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        results = []
+        errors = []
+
+        def fetch():
+            started.set()
+            # 等待方在执行期间到达并合并到这次调用
+            time.sleep(0.1)
+            return _note()
+
+        def leader():
+            result = flight.do('note', fetch)
+            # 执行方拿到结果后原地修改，与等待方复制结果同时进行
+            for i in range(20000):
+                result[f'key_{i}'] = i
+                result['data']['items'][0]['note_card'][f'key_{i}'] = i
+
+        def waiter():
+            try:
+                results.append(flight.do('note', fetch))
+            except Exception as e:
+                errors.append(e)
+
+        leader_thread = threading.Thread(target=leader)
+        leader_thread.start()
+        started.wait()
+        waiters = [threading.Thread(target=waiter) for _ in range(8)]
+        for thread in waiters:
+            thread.start()
+        for thread in [leader_thread] + waiters:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(results, [_note()] * 8)
+        self.assertEqual(flight.stats()['executed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
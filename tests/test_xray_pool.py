@@ -0,0 +1,35 @@
+import unittest
+
+from xhs_utils.xray_pool import XrayTraceIdPool
+
+
+class XrayTraceIdPoolTest(unittest.TestCase):
+    def test_get_refills_when_empty(self):
+        pool = XrayTraceIdPool(lambda count: [f'trace-{i}' for i in range(count)], size=3, low_watermark=0)
+        self.assertEqual([pool.get() for _ in range(4)], ['trace-0', 'trace-1', 'trace-2', 'trace-0'])
+        self.assertEqual(pool.refill_count, 2)
+
+    def test_get_raises_when_generator_returns_nothing(self):
+        pool = XrayTraceIdPool(lambda count: [], size=3, low_watermark=0)
+        self.assertRaises(RuntimeError, pool.get)
+
+    def test_non_positive_size_is_clamped(self):
+        pool = XrayTraceIdPool(lambda count: ['trace'] * count, size=0, low_watermark=50)
+        self.assertEqual((pool.size, pool.low_watermark), (1, 1))
+        self.assertEqual(pool.get(), 'trace')
+
+    def test_get_retries_when_refill_is_taken(self):
+        class _RacedPool(XrayTraceIdPool):
+            def refill(self):
+                count = super().refill()
+                if self.refill_count == 1:
+                    # 模拟补充完成后、取用前被其他线程取空
+                    self._buffer.clear()
+                return count
+
+        pool = _RacedPool(lambda count: ['trace'] * count, size=2, low_watermark=0)
+        self.assertEqual(pool.get(), 'trace')
+        self.assertEqual(pool.refill_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
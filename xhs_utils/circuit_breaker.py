@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from loguru import logger
+
+
+class CircuitOpen(Exception):
+    """
+    熔断中，暂停所有接口请求
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    接口请求熔断器
+    连续多次请求都是登录失效或被限流时熔断，暂停所有接口请求一段时间；
+    到期后只放行一个请求试探，试探结束前其他请求仍然拒绝；试探响应正常则恢复，失败或出错则重新熔断
+    """
+    def __init__(self, threshold=None, cooldown_minutes=None):
+        """
+        :param threshold: 连续失败多少次后熔断，为None时从环境变量CIRCUIT_BREAKER_THRESHOLD读取，默认10，0表示不熔断
+        :param cooldown_minutes: 熔断持续时间（分钟），为None时从环境变量CIRCUIT_BREAKER_COOLDOWN_MINUTES读取，默认30
+        """
+        self.threshold = threshold if threshold is not None else int(os.getenv('CIRCUIT_BREAKER_THRESHOLD', '10'))
+        self.cooldown_seconds = (cooldown_minutes if cooldown_minutes is not None
+                                 else float(os.getenv('CIRCUIT_BREAKER_COOLDOWN_MINUTES', '30'))) * 60
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.trip_count = 0
+        self.rejected_count = 0
+        self.last_reason = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        """
+        请求前调用，熔断中或试探请求进行中抛出CircuitOpen
+        :return: 本次请求是否是熔断到期后的试探请求，是则必须以probe=True调用record结束试探
+        """
+        with self._lock:
+            if self.probing:
+                self.rejected_count += 1
+                raise CircuitOpen(f'熔断试探请求进行中，暂停请求 (最近一次: {self.last_reason})')
+            if not self.open_until:
+                return False
+            remaining = self.open_until - time.monotonic()
+            if remaining > 0:
+                self.rejected_count += 1
+                raise CircuitOpen(f'连续 {self.threshold} 次请求登录失效或被限流，暂停请求，'
+                                  f'{remaining / 60:.0f} 分钟后恢复 (最近一次: {self.last_reason})')
+            self.open_until = 0.0
+            self.probing = True
+        logger.info("熔断时间已到，放行一个请求试探是否恢复")
+        return True
+
+    def record(self, failed, reason=None, probe=False):
+        """
+        记录一次请求的结果
+        :param failed: 是否登录失效或被限流，试探请求出错也记为失败
+        :param reason: 失败原因，用于日志
+        :param probe: 是否是check返回的试探请求；试探已经结束时重复记录不生效
+        """
+        with self._lock:
+            if probe:
+                if not self.probing:
+                    return
+                self.probing = False
+            if failed:
+                self.consecutive_failures += 1
+                self.last_reason = reason
+                if self.threshold <= 0 or self.open_until or self.probing or \
+                        (not probe and self.consecutive_failures < self.threshold):
+                    return
+                self.open_until = time.monotonic() + self.cooldown_seconds
+                self.trip_count += 1
+            else:
+                self.consecutive_failures = 0
+                if not probe:
+                    return
+        if failed:
+            logger.error(f"连续 {self.consecutive_failures} 次请求登录失效或被限流 ({reason})，"
+                         f"暂停所有接口请求 {self.cooldown_seconds / 60:.0f} 分钟")
+        else:
+            logger.info("试探请求正常，恢复接口请求")
+
+    def is_open(self):
+        """
+        :return: 是否熔断中，试探请求进行中也算熔断中
+        """
+        with self._lock:
+            return self.probing or time.monotonic() < self.open_until
+
+    def remaining(self):
+        """
+        :return: 距熔断结束的秒数，未熔断时返回0
+        """
+        with self._lock:
+            return max(0.0, self.open_until - time.monotonic())
+
+    def stats(self):
+        """
+        :return: 是否熔断中、连续失败次数、熔断次数和熔断期间拒绝的请求数
+        """
+        with self._lock:
+            return {
+                'open': self.probing or time.monotonic() < self.open_until,
+                'consecutive_failures': self.consecutive_failures,
+                'trips': self.trip_count,
+                'rejected': self.rejected_count,
+            }
+
+
+_circuit_breaker = None
+_circuit_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """
+    获取全局熔断器，同步和异步接口共用
+    """
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        with _circuit_breaker_lock:
+            if _circuit_breaker is None:
+                _circuit_breaker = CircuitBreaker()
+    return _circuit_breaker
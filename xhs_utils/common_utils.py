@@ -1,7 +1,30 @@
 import os
+import threading
 from loguru import logger
 from dotenv import load_dotenv
 
+class LazyInstance:
+    """
+    全局实例的延迟创建代理，第一次访问属性时才创建实例
+    """
+    def __init__(self, factory):
+        """
+        :param factory: 创建实例的函数
+        """
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get_instance(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get_instance(), name)
+
 def load_env():
     """
     从环境变量中加载配置信息
@@ -12,6 +35,21 @@ def load_env():
     log_level = os.getenv('LOG_LEVEL', 'INFO')
     return cookies_str, log_level
 
+def load_cookies_list():
+    """
+    从环境变量中加载所有账号的cookies，COOKIES为第一个账号，COOKIES_2、COOKIES_3...为其他账号
+    :return: cookies字符串列表
+    """
+    load_dotenv()
+    cookies_list = []
+    if os.getenv('COOKIES'):
+        cookies_list.append(os.getenv('COOKIES').strip())
+    extra_keys = [key for key in os.environ if key.startswith('COOKIES_') and key[len('COOKIES_'):].isdigit()]
+    for key in sorted(extra_keys, key=lambda key: int(key[len('COOKIES_'):])):
+        if os.environ[key].strip():
+            cookies_list.append(os.environ[key].strip())
+    return cookies_list
+
 def load_user_urls():
     """
     从环境变量中加载用户URL列表
@@ -32,7 +70,8 @@ def init():
     media_base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/media_datas'))
     excel_base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/excel_datas'))
     csv_base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/csv_datas'))
-    for base_path in [media_base_path, excel_base_path, csv_base_path]:
+    metrics_base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/metrics_datas'))
+    for base_path in [media_base_path, excel_base_path, csv_base_path, metrics_base_path]:
         if not os.path.exists(base_path):
             os.makedirs(base_path)
             logger.info(f'创建目录 {base_path}')
@@ -41,5 +80,6 @@ def init():
         'media': media_base_path,
         'excel': excel_base_path,
         'csv': csv_base_path,
+        'metrics': metrics_base_path,
     }
     return cookies_str, log_level, base_path
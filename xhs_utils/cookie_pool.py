@@ -0,0 +1,203 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from loguru import logger
+from xhs_utils.common_utils import load_cookies_list
+from xhs_utils.cookie_util import trans_cookies
+
+# 表示登录失效的业务码：-100 登录已过期，-101 无登录信息
+LOGIN_EXPIRED_CODES = {-100, -101}
+LOGIN_EXPIRED_KEYWORDS = ('登录已过期', '未登录', '登录信息')
+
+
+def is_login_expired(msg, res_json=None):
+    """
+    根据接口返回判断账号是否登录失效
+    """
+    if isinstance(res_json, dict) and res_json.get('code') in LOGIN_EXPIRED_CODES:
+        return True
+    msg = str(msg or '')
+    return any(keyword in msg for keyword in LOGIN_EXPIRED_KEYWORDS)
+
+
+class CookieIdentity:
+    """
+    账号池中的一个账号，限速按a1单独计算
+    """
+    def __init__(self, cookies_str):
+        self.cookies_str = cookies_str
+        self.a1 = trans_cookies(cookies_str).get('a1', '')
+        self.in_flight = 0
+        self.request_count = 0
+        self.expired_count = 0
+        self.quarantined_until = 0.0
+
+    @property
+    def name(self):
+        # 日志中只显示a1的前几位
+        return f'a1={self.a1[:8]}...' if self.a1 else '未知账号'
+
+    def is_healthy(self, now):
+        return now >= self.quarantined_until
+
+
+class CookiePool:
+    """
+    多账号cookies池
+    每次请求选择进行中请求数最少的可用账号，响应表明登录失效的账号隔离一段时间，
+    隔离结束后重新参与选择；所有账号都被隔离时仍使用最早恢复的账号，由接口返回具体的失败原因
+    """
+    def __init__(self, cookies_list=None, quarantine_minutes=None):
+        """
+        :param cookies_list: cookies字符串列表，为None时从环境变量COOKIES、COOKIES_2、COOKIES_3...读取
+        :param quarantine_minutes: 登录失效账号的隔离时间（分钟），为None时从环境变量COOKIE_QUARANTINE_MINUTES读取，默认30
+        """
+        self.quarantine_seconds = (quarantine_minutes if quarantine_minutes is not None
+                                   else float(os.getenv('COOKIE_QUARANTINE_MINUTES', '30'))) * 60
+        self.identities = []
+        self._lock = threading.Lock()
+        self.update(cookies_list if cookies_list is not None else load_cookies_list())
+
+    def __len__(self):
+        return len(self.identities)
+
+    def update(self, cookies_list):
+        """
+        更新账号列表，未变化的账号保留负载和隔离状态，更换过的cookies作为新账号立即可用
+        """
+        with self._lock:
+            existing = {identity.cookies_str: identity for identity in self.identities}
+            self.identities = [existing.get(cookies_str) or CookieIdentity(cookies_str)
+                               for cookies_str in dict.fromkeys(cookies_list)]
+
+    def acquire(self):
+        """
+        选择负载最低的可用账号并占用
+        :return: CookieIdentity，账号池为空时返回None
+        """
+        with self._lock:
+            if not self.identities:
+                return None
+            now = time.monotonic()
+            healthy = [identity for identity in self.identities if identity.is_healthy(now)]
+            if healthy:
+                identity = min(healthy, key=lambda item: (item.in_flight, item.request_count))
+            else:
+                identity = min(self.identities, key=lambda item: item.quarantined_until)
+            identity.in_flight += 1
+            identity.request_count += 1
+            return identity
+
+    def release(self, identity, login_expired=False):
+        """
+        归还账号，登录失效时隔离该账号
+        """
+        with self._lock:
+            identity.in_flight -= 1
+        if login_expired:
+            self.quarantine(identity)
+
+    def quarantine(self, identity):
+        """
+        隔离登录失效的账号
+        """
+        with self._lock:
+            identity.expired_count += 1
+            identity.quarantined_until = time.monotonic() + self.quarantine_seconds
+        logger.warning(f"账号 {identity.name} 登录失效，隔离 {self.quarantine_seconds / 60:.0f} 分钟，请更新该账号的cookies")
+
+    def snapshot(self):
+        """
+        :return: 当前的账号列表
+        """
+        with self._lock:
+            return list(self.identities)
+
+    def stats(self):
+        """
+        :return: 每个账号的请求数、进行中请求数、登录失效次数和是否被隔离
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'account': identity.name,
+                'requests': identity.request_count,
+                'in_flight': identity.in_flight,
+                'expired': identity.expired_count,
+                'quarantined': not identity.is_healthy(now),
+            } for identity in self.identities]
+
+
+def _result_login_expired(result):
+    if isinstance(result, list):
+        return any(_result_login_expired(item) for item in result)
+    if isinstance(result, tuple) and len(result) == 3:
+        success, msg, res_json = result
+        return not success and is_login_expired(msg, res_json)
+    return False
+
+
+def pooled_cookies(func):
+    """
+    接口方法的装饰器
+    调用时cookies_str为空且接口对象配置了账号池，则从账号池中选择账号，调用结束后归还；
+    生成器方法在整个翻页过程中使用同一个账号
+    """
+    signature = inspect.signature(func)
+
+    def bind(self, args, kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        if bound.arguments.get('cookies_str') or self.cookie_pool is None:
+            return bound, None
+        identity = self.cookie_pool.acquire()
+        if identity is not None:
+            bound.arguments['cookies_str'] = identity.cookies_str
+        return bound, identity
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(self, *args, **kwargs):
+            bound, identity = bind(self, args, kwargs)
+            if identity is None:
+                yield from func(*bound.args, **bound.kwargs)
+                return
+            login_expired = False
+            try:
+                yield from func(*bound.args, **bound.kwargs)
+            except Exception as e:
+                login_expired = is_login_expired(str(e))
+                raise
+            finally:
+                self.cookie_pool.release(identity, login_expired)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        bound, identity = bind(self, args, kwargs)
+        if identity is None:
+            return func(*bound.args, **bound.kwargs)
+        result = None
+        try:
+            result = func(*bound.args, **bound.kwargs)
+            return result
+        finally:
+            self.cookie_pool.release(identity, _result_login_expired(result))
+    return wrapper
+
+
+_cookie_pool = None
+_cookie_pool_lock = threading.Lock()
+
+
+def get_cookie_pool():
+    """
+    获取全局账号池，首次调用时从环境变量读取
+    """
+    global _cookie_pool
+    if _cookie_pool is None:
+        with _cookie_pool_lock:
+            if _cookie_pool is None:
+                _cookie_pool = CookiePool()
+    return _cookie_pool
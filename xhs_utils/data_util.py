@@ -1,17 +1,37 @@
+import contextvars
+import functools
+import glob
 import json
 import os
 import re
+import threading
 import time
 import csv
-import openpyxl
 import requests
 from loguru import logger
 from retry import retry
 from collections import defaultdict
-from openpyxl import Workbook
 from urllib.parse import urlparse, unquote
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from xhs_utils.proxy_pool import get_proxy_pool
 
+# CDN返回这些状态码说明媒体地址已过期，需要重新获取笔记详细
+EXPIRED_URL_STATUS_CODES = {403, 404}
+
+# 下载记录CSV的读写锁，媒体下载线程和主线程会同时读写同一个用户的记录文件
+_record_lock = threading.RLock()
+
+
+def with_record_lock(func):
+    """
+    读写下载记录的函数在锁内执行，避免读到正在改写的文件或覆盖其他线程写入的记录
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _record_lock:
+            return func(*args, **kwargs)
+    return wrapper
 
 def norm_str(str):
     new_str = re.sub(r"|[\\/:*?\"<>| ]+", "", str).replace('\n', '').replace('\r', '')
@@ -29,6 +49,7 @@ def timestamp_to_str(timestamp):
     return dt
 
 # 检查下载记录CSV文件是否存在，不存在则创建
+@with_record_lock
 def check_or_create_download_record(csv_path, user_id):
     csv_file = os.path.join(csv_path, f'{user_id}_download_record.csv')
     if not os.path.exists(csv_file):
@@ -39,6 +60,7 @@ def check_or_create_download_record(csv_path, user_id):
     return csv_file
 
 # 检查笔记是否已下载并且下载是否完整
+@with_record_lock
 def check_download_status(note_info, media_path, csv_path):
     note_id = note_info['note_id']
     user_id = note_info['user_id']
@@ -142,6 +164,7 @@ def check_download_status(note_info, media_path, csv_path):
         return is_downloaded, False, csv_file
 
 # 更新下载记录
+@with_record_lock
 def update_download_record(csv_file, note_info, is_complete):
     note_id = note_info['note_id']
     user_id = note_info['user_id']
@@ -184,6 +207,7 @@ def update_download_record(csv_file, note_info, is_complete):
         writer.writerows(rows)
 
 # 添加新函数用于检查笔记文件是否完整
+@with_record_lock
 def check_note_files_complete(note_id, csv_path=None, media_path=None):
     """
     检查笔记文件是否完整
@@ -330,7 +354,55 @@ def check_note_files_complete(note_id, csv_path=None, media_path=None):
         
     return is_complete
 
+@with_record_lock
+def load_stored_note(note_id, csv_path=None, media_path=None):
+    """
+    从本地加载之前下载时保存的笔记信息，用于修复缺失的文件时复用其中的媒体地址
+    
+    :param note_id: 笔记ID
+    :param csv_path: CSV保存路径
+    :param media_path: 媒体文件保存路径
+    :return: (note_info, raw_data)，没有下载记录或找不到info.json时返回 (None, None)
+    """
+    if not csv_path or not media_path or not os.path.exists(media_path):
+        return None, None
+    try:
+        # 从下载记录中找到笔记所属的用户
+        user_id = None
+        for csv_file in glob.glob(os.path.join(csv_path, '*_download_record.csv')):
+            with open(csv_file, 'r', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader, None)  # 跳过表头
+                if any(row and row[0] == note_id for row in reader):
+                    user_id = os.path.basename(csv_file).replace('_download_record.csv', '')
+                    break
+        if not user_id:
+            return None, None
+        
+        # 在用户文件夹中查找笔记文件夹
+        for user_folder in os.listdir(media_path):
+            if not user_folder.endswith(f"_{user_id}"):
+                continue
+            user_dir = os.path.join(media_path, user_folder)
+            for note_folder in os.listdir(user_dir):
+                note_dir = os.path.join(user_dir, note_folder)
+                info_path = os.path.join(note_dir, 'info.json')
+                if note_id not in note_folder or not os.path.exists(info_path):
+                    continue
+                with open(info_path, 'r', encoding='utf-8') as f:
+                    note_info = json.load(f)
+                raw_data = None
+                raw_data_path = os.path.join(note_dir, 'raw_data.json')
+                if os.path.exists(raw_data_path):
+                    with open(raw_data_path, 'r', encoding='utf-8') as f:
+                        raw_data = json.load(f)
+                return note_info, raw_data
+    except Exception as e:
+        logger.warning(f"从本地加载笔记 {note_id} 信息失败: {e}")
+    return None, None
+
 # 修改create_note_record函数以扩展CSV记录
+@with_record_lock
 def create_note_record(note_info, csv_path=None, update_record=False):
     """
     创建笔记的CSV记录
@@ -681,6 +753,8 @@ def handle_comment_info(data):
         'pictures': pictures,
     }
 def save_to_xlsx(datas, file_path, type='note'):
+    # openpyxl导入较慢，只有保存excel时才需要
+    import openpyxl
     wb = openpyxl.Workbook()
     ws = wb.active
     if type == 'note':
@@ -766,29 +840,36 @@ def save_note_detail(note, path):
 
 
 @retry(tries=3, delay=1)
-def download_video(video_url, save_path, filename="video.mp4"):
+def download_video(video_url, save_path, filename="video.mp4", expired_urls=None):
     """
     下载视频文件
     
     :param video_url: 视频URL
     :param save_path: 保存路径
     :param filename: 文件名
+    :param expired_urls: 传入列表时，地址已过期(403/404)的URL追加到该列表
     :return: 是否成功
     """
     try:
-        resp = requests.get(video_url, stream=True, timeout=30)
-        if resp.status_code != 200:
-            logger.error(f"下载视频失败: {resp.status_code}")
-            return False
+        # 配置了代理池时从中选择代理，下载完成前一直占用
+        with get_proxy_pool().lease() as lease:
+            resp = requests.get(video_url, stream=True, timeout=30, proxies=lease.proxies if lease else None)
+            if lease is not None:
+                lease.record(failed=resp.status_code >= 500)
+            if resp.status_code != 200:
+                logger.error(f"下载视频失败: {resp.status_code}")
+                if expired_urls is not None and resp.status_code in EXPIRED_URL_STATUS_CODES:
+                    expired_urls.append(video_url)
+                return False
+                
+            # 确保目录存在
+            os.makedirs(save_path, exist_ok=True)
             
-        # 确保目录存在
-        os.makedirs(save_path, exist_ok=True)
-        
-        # 保存视频文件
-        file_path = os.path.join(save_path, filename)
-        with open(file_path, 'wb') as f:
-            for chunk in resp.iter_content(chunk_size=1024):
-                f.write(chunk)
+            # 保存视频文件
+            file_path = os.path.join(save_path, filename)
+            with open(file_path, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=1024):
+                    f.write(chunk)
         
         return True
         
@@ -797,29 +878,35 @@ def download_video(video_url, save_path, filename="video.mp4"):
         return False
 
 @retry(tries=3, delay=1)
-def download_file(url, file_path, file_type="image"):
+def download_file(url, file_path, file_type="image", expired_urls=None):
     """
     下载文件(图片或其他类型)
     
     :param url: 文件URL
     :param file_path: 保存路径(包含文件名)
     :param file_type: 文件类型
+    :param expired_urls: 传入列表时，地址已过期(403/404)的URL追加到该列表
     :return: 是否成功
     """
     try:
         # 创建目录
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         
-        # 下载文件
-        resp = requests.get(url, stream=True, timeout=30)
-        if resp.status_code != 200:
-            logger.error(f"下载{file_type}失败: {resp.status_code}")
-            return False
-            
-        # 保存文件
-        with open(file_path, 'wb') as f:
-            for chunk in resp.iter_content(chunk_size=1024):
-                f.write(chunk)
+        # 下载文件，配置了代理池时从中选择代理，下载完成前一直占用
+        with get_proxy_pool().lease() as lease:
+            resp = requests.get(url, stream=True, timeout=30, proxies=lease.proxies if lease else None)
+            if lease is not None:
+                lease.record(failed=resp.status_code >= 500)
+            if resp.status_code != 200:
+                logger.error(f"下载{file_type}失败: {resp.status_code}")
+                if expired_urls is not None and resp.status_code in EXPIRED_URL_STATUS_CODES:
+                    expired_urls.append(url)
+                return False
+                
+            # 保存文件
+            with open(file_path, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=1024):
+                    f.write(chunk)
                 
         return True
         
@@ -827,8 +914,49 @@ def download_file(url, file_path, file_type="image"):
         logger.error(f"下载{file_type}时出错: {e}")
         return False
 
+_download_semaphore = None
+_download_semaphore_lock = threading.Lock()
+
+
+def get_download_semaphore():
+    """
+    获取全局下载并发数限制，所有笔记同时进行的媒体下载合计不超过DOWNLOAD_CONCURRENCY，默认8
+    """
+    global _download_semaphore
+    if _download_semaphore is None:
+        with _download_semaphore_lock:
+            if _download_semaphore is None:
+                _download_semaphore = threading.BoundedSemaphore(max(1, int(os.getenv('DOWNLOAD_CONCURRENCY', '8'))))
+    return _download_semaphore
+
+def download_media_jobs(jobs, concurrency=None):
+    """
+    并发执行一个笔记的媒体下载，同一笔记最多concurrency个同时下载，并受全局下载并发数限制
+    
+    :param jobs: 下载任务列表 [(下载函数, 参数元组)]
+    :param concurrency: 同一笔记的下载并发数，为None时从环境变量DOWNLOAD_NOTE_CONCURRENCY读取，默认4
+    :return: 每个任务是否成功，顺序与jobs一致
+    """
+    if concurrency is None:
+        concurrency = int(os.getenv('DOWNLOAD_NOTE_CONCURRENCY', '4'))
+    semaphore = get_download_semaphore()
+
+    def run(func, args):
+        try:
+            with semaphore:
+                return func(*args)
+        except Exception as e:
+            logger.error(f"下载 {args[0]} 时出错: {e}")
+            return False
+
+    if len(jobs) <= 1 or concurrency <= 1:
+        return [run(func, args) for func, args in jobs]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(jobs)), thread_name_prefix='media-download') as executor:
+        futures = [executor.submit(contextvars.copy_context().run, run, func, args) for func, args in jobs]
+        return [future.result() for future in futures]
+
 @retry(tries=3, delay=1)
-def download_note(note_info, save_path, raw_data, csv_path=None):
+def download_note(note_info, save_path, raw_data, csv_path=None, expired_urls=None):
     """下载笔记中的图片和视频
     此函数源自：https://github.com/JoeanAmier/XHS-Downloader/blob/master/src/downloader/resources.py
     感谢原作者的贡献
@@ -838,6 +966,7 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
         save_path: 保存路径
         raw_data: 原始json数据
         csv_path: csv文件保存路径，用于记录下载状态
+        expired_urls: 传入列表时，地址已过期(403/404)的媒体URL追加到该列表，调用方据此重新获取笔记详细
     """
     # 如果原始文件为None，则设置为空字典
     raw_data = raw_data if raw_data else {}
@@ -862,7 +991,7 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
         note_type = note_info.get('note_type', '')
 
         # 首先检查是否已下载完成(csv中标记为完成)
-        is_already_complete = check_download_status(note_info, save_path, csv_path)
+        _, is_already_complete, _ = check_download_status(note_info, save_path, csv_path)
         if is_already_complete:
             logger.debug(f"笔记 {note_id} 已完整下载，跳过")
             # 仍然更新CSV状态确保标记为完成
@@ -877,6 +1006,7 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
         # 使用笔记类型决定下载行为
         start_time = time.time()
         success = True
+        file_count = 0  # 本次下载的文件数
 
         # 检查哪些文件已存在，只下载缺失的部分
         if note_type == '视频':
@@ -894,7 +1024,8 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
                 else:
                     logger.info(f"↓ 视频笔记 [{title}_{note_id}] (作者: {nickname}) 开始下载视频")
                 # 只下载视频
-                success = download_video(video_url, local_path)
+                success = download_media_jobs([(download_video, (video_url, local_path, "video.mp4", expired_urls))])[0]
+                file_count = 1
             elif video_url and video_exists:
                 logger.info(f"视频笔记 [{title}_{note_id}] 视频已存在，跳过下载")
                 success = True
@@ -913,6 +1044,9 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
                 # 检查目录是否已存在，用于判断是全新下载还是更新下载
                 is_new_download = not os.path.exists(local_path) or len(os.listdir(local_path)) <= 1  # 只有目录或只有info.json
                 
+                # 收集缺失的图片和视频，之后一起并发下载 [(下载函数, 参数, 视频序号和对应的图片索引)]
+                media_jobs = []
+                
                 # 收集缺失的图片索引
                 missing_images = []
                 for i in range(len(image_list)):
@@ -932,8 +1066,7 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
                         if i < len(image_list):  # 确保索引有效
                             img_url = image_list[i]
                             file_path = f"{local_path}/image_{i}.jpg"
-                            download_success = download_file(img_url, file_path, 'image')
-                            success = download_success and success
+                            media_jobs.append((download_file, (img_url, file_path, 'image', expired_urls), None))
                 else:
                     logger.info(f"{log_type}笔记 [{title}_{note_id}] 所有图片已存在，无需下载")
 
@@ -983,23 +1116,23 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
                             if not isinstance(video_url, str):
                                 logger.warning(f"跳过非字符串URL: {video_url}")
                                 continue
+                            video_filename = f"live_video_{img_idx}.mp4"
+                            media_jobs.append((download_video, (video_url, local_path, video_filename, expired_urls), (i, img_idx)))
                                 
-                            try:
-                                video_filename = f"live_video_{img_idx}.mp4"
-                                video_success = download_video(video_url, local_path, video_filename)
-                                success = video_success and success
-                                
-                                # 记录视频与图片的对应关系
-                                if video_success:
-                                    video_image_mapping[f"video_{i}"] = img_idx
-                            except Exception as video_error:
-                                logger.error(f"下载视频 {i} 时出错: {video_error}")
-                                success = False
-                                
-                        # 更新笔记信息中的视频映射关系
+                        # 更新笔记信息中的视频映射关系，下载成功的视频在下面记入
                         note_info['video_image_mapping'] = video_image_mapping
                     else:
                         logger.info(f"{log_type}笔记 [{title}_{note_id}] 所有视频已存在，无需下载")
+                
+                # 同一笔记缺失的图片和视频并发下载
+                results = download_media_jobs([(func, args) for func, args, _ in media_jobs])
+                for (_, _, video_index), job_success in zip(media_jobs, results):
+                    success = job_success and success
+                    # 记录视频与图片的对应关系
+                    if video_index is not None and job_success:
+                        i, img_idx = video_index
+                        video_image_mapping[f"video_{i}"] = img_idx
+                file_count = len(media_jobs)
             
             else:
                 logger.error(f"图集笔记 [{title}_{note_id}] 未找到图片列表")
@@ -1021,9 +1154,9 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
             
         # 下载完成提示
         if success:
-            logger.info(f"✓ {note_type}笔记 [{title}_{note_id}] (作者: {nickname}) 下载完成")
+            logger.info(f"✓ {note_type}笔记 [{title}_{note_id}] (作者: {nickname}) 下载完成，{file_count} 个文件，用时 {time_cost:.1f} 秒")
         else:
-            logger.error(f"✗ {note_type}笔记 [{title}_{note_id}] (作者: {nickname}) 下载失败")
+            logger.error(f"✗ {note_type}笔记 [{title}_{note_id}] (作者: {nickname}) 下载失败，{file_count} 个文件，用时 {time_cost:.1f} 秒")
         
         return local_path
     except Exception as e:
@@ -1031,6 +1164,7 @@ def download_note(note_info, save_path, raw_data, csv_path=None):
         logger.debug(f"错误详情: {traceback.format_exc()}")
         return None
 
+@with_record_lock
 def update_download_status(note_id, user_id, status, csv_path):
     """
     更新下载状态到CSV记录
@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# 当前截止时间（time.monotonic()），None表示不限制；asyncio任务会自动继承
+_deadline = ContextVar('xhs_request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    本轮的时间预算已用完
+    """
+    pass
+
+
+@contextmanager
+def request_deadline(seconds):
+    """
+    在with块内设置截止时间，块内发起的所有接口请求的超时都不会超过剩余时间
+    嵌套使用时取更早的截止时间
+    :param seconds: 时间预算（秒），None或不大于0表示不限制
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """
+    :return: 距截止时间的剩余秒数，没有截止时间时返回None
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_exceeded():
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def check_deadline():
+    """
+    已超过截止时间时抛出 DeadlineExceeded
+    """
+    if deadline_exceeded():
+        raise DeadlineExceeded('本轮时间预算已用完')
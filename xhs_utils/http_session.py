@@ -0,0 +1,94 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+
+
+class _NoCookiePolicy(DefaultCookiePolicy):
+    """
+    不保存响应中的Set-Cookie，cookies由每次请求显式传入，避免不同账号的cookies混在同一个会话里
+    """
+    def set_ok(self, cookie, request):
+        return False
+
+
+class PooledSession:
+    """
+    长连接HTTP会话
+    所有请求共用一个 requests.Session 和连接池，同一主机的请求复用已建立的TCP+TLS连接，
+    连接池是线程安全的，多个线程可以共用同一个会话
+    """
+    def __init__(self, pool_connections=None, pool_maxsize=None, proxies=None):
+        """
+        :param pool_connections: 缓存连接池的主机数量，为None时从环境变量HTTP_POOL_CONNECTIONS读取，默认10
+        :param pool_maxsize: 每个主机保持的最大连接数，为None时从环境变量HTTP_POOL_MAXSIZE读取，默认20
+        :param proxies: 会话默认使用的代理，请求时传入proxies会覆盖
+        """
+        self.pool_connections = pool_connections if pool_connections is not None else int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+        self.pool_maxsize = pool_maxsize if pool_maxsize is not None else int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+        self.session = requests.Session()
+        self.session.cookies.set_policy(_NoCookiePolicy())
+        self.adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        if proxies:
+            self.session.proxies.update(proxies)
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def proxies(self):
+        return dict(self.session.proxies)
+
+    def request(self, method, url, **kwargs):
+        # 显式传入 proxies=None 时使用会话绑定的代理
+        if kwargs.get('proxies') is None:
+            kwargs.pop('proxies', None)
+        with self._lock:
+            self.request_count += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _connection_pools(self):
+        managers = [self.adapter.poolmanager] + list(self.adapter.proxy_manager.copy().values())
+        pools = []
+        for manager in managers:
+            # 其他线程请求时会增删连接池，持有容器的锁取快照后再读计数
+            with manager.pools.lock:
+                pools.extend(manager.pools._container.values())
+        return pools
+
+    def stats(self):
+        """
+        连接复用统计
+        :return: 请求数、新建连接数和复用连接的请求数；被连接池淘汰的主机不再计入，读取连接池失败时连接数相关的值为None
+        """
+        stats = {
+            'requests': self.request_count,
+            'connections': None,
+            'reused': None,
+            'hosts': None,
+        }
+        try:
+            pools = self._connection_pools()
+            pool_requests = sum(pool.num_requests for pool in pools)
+            connections = sum(pool.num_connections for pool in pools)
+        except Exception as e:
+            logger.debug(f"读取HTTP连接池统计失败: {e}")
+            return stats
+        stats.update({
+            'connections': connections,
+            'reused': max(pool_requests - connections, 0),
+            'hosts': len(pools),
+        })
+        return stats
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from loguru import logger
+
+PROJECT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+_IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure_import_time(module):
+    """
+    在新的解释器中导入模块，用 -X importtime 统计每个模块的导入耗时
+    :param module: 模块名，如 main、apis.pc_apis
+    :return: [{'module', 'depth', 'self_ms', 'cumulative_ms'}]，按导入完成顺序排列
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_PATH,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'导入 {module} 失败: {result.stderr.strip().splitlines()[-1]}')
+    records = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        records.append({
+            'module': name,
+            'depth': (len(indent) - 1) // 2,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+        })
+    return records
+
+
+def import_report(module, top=20):
+    """
+    输出模块导入耗时报告
+    :param module: 模块名
+    :param top: 列出累计耗时最多的模块数量
+    :return: 导入该模块的总耗时（毫秒）
+    """
+    records = measure_import_time(module)
+    total = next((record['cumulative_ms'] for record in reversed(records) if record['module'] == module), 0)
+    lines = [f'导入 {module} 共耗时 {total:.1f}ms，累计耗时最多的模块:']
+    for record in sorted(records, key=lambda r: r['cumulative_ms'], reverse=True)[:top]:
+        lines.append(f"  {record['cumulative_ms']:8.1f}ms  (自身 {record['self_ms']:6.1f}ms)  {record['module']}")
+    logger.info('\n'.join(lines))
+    return total
+
+
+if __name__ == '__main__':
+    """
+        统计启动时的模块导入耗时
+        python -m xhs_utils.import_report main apis.pc_apis --top 20
+    """
+    parser = argparse.ArgumentParser(description='模块导入耗时报告')
+    parser.add_argument('modules', nargs='*', default=['main', 'apis.pc_apis'])
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+    for module in args.modules:
+        import_report(module, args.top)
@@ -0,0 +1,97 @@
+import contextvars
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from loguru import logger
+
+
+class MediaPipeline:
+    """
+    笔记媒体下载流水线
+    获取到笔记详细后把下载任务放入有界队列，由后台下载线程取出执行，
+    获取下一个笔记详细的同时下载上一个笔记的媒体；队列满时提交任务会等待，避免详细获取远远领先于下载
+    """
+    def __init__(self, workers=None, queue_size=None):
+        """
+        :param workers: 下载线程数，为None时从环境变量MEDIA_PIPELINE_WORKERS读取，默认2
+        :param queue_size: 等待下载的笔记数上限，为None时从环境变量MEDIA_QUEUE_SIZE读取，默认8
+        """
+        self.workers = max(1, workers if workers is not None else int(os.getenv('MEDIA_PIPELINE_WORKERS', '2')))
+        self.queue_size = max(1, queue_size if queue_size is not None else int(os.getenv('MEDIA_QUEUE_SIZE', '8')))
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.submitted_count = 0
+        self.blocked_count = 0
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'media-pipeline-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            future, context, fn, args, kwargs = self._queue.get()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(context.run(fn, *args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            except Exception as e:
+                logger.error(f"媒体下载任务出错: {e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        提交一个下载任务，队列已满时等待下载线程取走任务
+        :return: Future，完成后得到 fn 的返回值
+        """
+        self._ensure_workers()
+        future = Future()
+        item = (future, contextvars.copy_context(), fn, args, kwargs)
+        with self._lock:
+            self.submitted_count += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.blocked_count += 1
+            logger.debug(f"媒体下载队列已满({self.queue_size})，等待下载线程")
+            self._queue.put(item)
+        return future
+
+    def stats(self):
+        """
+        :return: 下载线程数、队列容量、排队中的任务数、累计提交数和因队列满而等待的次数
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queued': self._queue.qsize(),
+                'submitted': self.submitted_count,
+                'blocked': self.blocked_count,
+            }
+
+
+_media_pipeline = None
+_media_pipeline_lock = threading.Lock()
+
+
+def get_media_pipeline():
+    """
+    获取全局媒体下载流水线，首次调用时从环境变量读取配置
+    """
+    global _media_pipeline
+    if _media_pipeline is None:
+        with _media_pipeline_lock:
+            if _media_pipeline is None:
+                _media_pipeline = MediaPipeline()
+    return _media_pipeline
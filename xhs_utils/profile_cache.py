@@ -0,0 +1,73 @@
+import json
+import os
+import time
+from loguru import logger
+
+
+class ProfileCache:
+    """
+    用户资料缓存（昵称、头像、basic_info），保存在json文件中，程序重启后仍然有效
+    超过有效期的资料重新请求；笔记中出现的昵称与缓存不同时直接更新缓存
+    """
+    def __init__(self, path, ttl_hours=None):
+        """
+        :param path: 缓存文件路径
+        :param ttl_hours: 缓存有效期（小时），为None时从环境变量PROFILE_CACHE_TTL_HOURS读取，默认168，0表示不缓存
+        """
+        self.path = path
+        self.ttl_hours = ttl_hours if ttl_hours is not None else float(os.getenv('PROFILE_CACHE_TTL_HOURS', '168'))
+        self.profiles = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.profiles = json.load(f)
+            except Exception as e:
+                logger.warning(f"读取用户资料缓存 {path} 失败，将重新获取用户资料: {e}")
+
+    def get(self, user_id):
+        """
+        :return: 未过期的用户资料 {'nickname', 'avatar', 'basic_info', 'updated'}，没有缓存或已过期时返回None
+        """
+        if self.ttl_hours <= 0:
+            return None
+        profile = self.profiles.get(user_id)
+        if profile is None or time.time() - profile.get('updated', 0) >= self.ttl_hours * 3600:
+            return None
+        return profile
+
+    def put(self, user_id, basic_info):
+        """
+        保存接口返回的用户资料并写入文件
+        :param basic_info: 用户信息接口返回的 data['basic_info']
+        """
+        self.profiles[user_id] = {
+            'nickname': basic_info.get('nickname', ''),
+            'avatar': basic_info.get('imageb') or basic_info.get('images', ''),
+            'basic_info': basic_info,
+            'updated': time.time(),
+        }
+        self._save()
+
+    def refresh(self, user_id, nickname, avatar=None):
+        """
+        用笔记中的作者信息校对缓存，昵称变化时更新缓存的昵称和头像，不延长有效期
+        笔记中的头像地址与用户资料中的尺寸不同，只按昵称判断是否变化
+        :return: 昵称是否发生了变化
+        """
+        profile = self.profiles.get(user_id)
+        if profile is None or not nickname or nickname == profile.get('nickname'):
+            return False
+        logger.info(f"用户 {user_id} 昵称已变更: {profile.get('nickname')} -> {nickname}")
+        profile['nickname'] = nickname
+        profile.get('basic_info', {})['nickname'] = nickname
+        if avatar:
+            profile['avatar'] = avatar
+        self._save()
+        return True
+
+    def _save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.profiles, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"保存用户资料缓存 {self.path} 失败: {e}")
@@ -0,0 +1,250 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import requests
+from loguru import logger
+from xhs_utils.deadline import DeadlineExceeded, remaining_time
+
+
+class ProxyEndpoint:
+    """
+    代理池中的一个代理，记录滚动的延迟和失败率
+    """
+    def __init__(self, url, latency_alpha=0.3, failure_alpha=0.2):
+        self.url = url
+        self.latency_alpha = latency_alpha
+        self.failure_alpha = failure_alpha
+        self.latency = None
+        self.failure_rate = 0.0
+        self.consecutive_failures = 0
+        self.samples = 0
+        self.in_flight = 0
+        self.request_count = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probing = False
+
+    @property
+    def name(self):
+        # 日志中不显示代理的账号密码
+        return self.url.split('@')[-1]
+
+    @property
+    def proxies(self):
+        return {'http': self.url, 'https': self.url}
+
+    def score(self):
+        """
+        分数越低越优先：平均延迟按失败率加权，还没有请求过的代理优先尝试
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + 4 * self.failure_rate)
+
+    def record(self, latency, failed):
+        self.samples += 1
+        self.failure_rate += self.failure_alpha * ((1.0 if failed else 0.0) - self.failure_rate)
+        self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+        if latency is not None and not failed:
+            self.latency = latency if self.latency is None else self.latency + self.latency_alpha * (latency - self.latency)
+
+
+class ProxyLease:
+    """
+    一次请求占用的代理，响应返回后调用 record 记录延迟和是否失败
+    """
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start_time = time.monotonic()
+        self.latency = None
+        self.failed = None
+
+    @property
+    def proxies(self):
+        return self.endpoint.proxies
+
+    def record(self, latency=None, failed=False):
+        self.latency = latency if latency is not None else time.monotonic() - self.start_time
+        self.failed = failed
+
+
+class ProxyPool:
+    """
+    代理池
+    每次请求选择进行中请求数未达上限、分数最低的代理；失败率过高或连续失败的代理被剔除一段时间，
+    到期后只放行一个请求试探，成功则恢复，失败则加倍剔除时间
+    """
+    def __init__(self, proxy_urls=None, max_in_flight=None, eject_failure_rate=None, eject_seconds=None,
+                 eject_max_seconds=None, min_samples=None):
+        """
+        :param proxy_urls: 代理地址列表，为None时从环境变量PROXY_POOL读取，多个代理用分号分隔
+        :param max_in_flight: 每个代理同时进行的请求数上限，为None时从环境变量PROXY_MAX_IN_FLIGHT读取，默认4
+        :param eject_failure_rate: 滚动失败率达到该值时剔除代理，为None时从环境变量PROXY_EJECT_FAILURE_RATE读取，默认0.5
+        :param eject_seconds: 第一次剔除的时间（秒），为None时从环境变量PROXY_EJECT_SECONDS读取，默认60
+        :param eject_max_seconds: 剔除时间上限（秒），为None时从环境变量PROXY_EJECT_MAX_SECONDS读取，默认600
+        :param min_samples: 至少请求多少次后才按失败率剔除，为None时从环境变量PROXY_MIN_SAMPLES读取，默认5
+        """
+        if proxy_urls is None:
+            proxy_urls = [url.strip() for url in os.getenv('PROXY_POOL', '').split(';') if url.strip()]
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(os.getenv('PROXY_MAX_IN_FLIGHT', '4'))
+        self.eject_failure_rate = eject_failure_rate if eject_failure_rate is not None else float(os.getenv('PROXY_EJECT_FAILURE_RATE', '0.5'))
+        self.eject_seconds = eject_seconds if eject_seconds is not None else float(os.getenv('PROXY_EJECT_SECONDS', '60'))
+        self.eject_max_seconds = eject_max_seconds if eject_max_seconds is not None else float(os.getenv('PROXY_EJECT_MAX_SECONDS', '600'))
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv('PROXY_MIN_SAMPLES', '5'))
+        self.endpoints = [ProxyEndpoint(url) for url in dict.fromkeys(proxy_urls)]
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _candidates_locked(self, now):
+        candidates = []
+        for endpoint in self.endpoints:
+            if now < endpoint.ejected_until:
+                continue
+            if endpoint.ejected_until:
+                # 剔除到期，只放行一个试探请求
+                if endpoint.in_flight == 0:
+                    candidates.append(endpoint)
+            elif endpoint.in_flight < self.max_in_flight:
+                candidates.append(endpoint)
+        return candidates
+
+    def acquire(self):
+        """
+        选择代理并占用，所有可用代理都达到并发上限时等待；所有代理都被剔除时使用最早到期的代理
+        :return: ProxyEndpoint，代理池为空时返回None
+        """
+        if not self.endpoints:
+            return None
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                candidates = self._candidates_locked(now)
+                if candidates:
+                    endpoint = min(candidates, key=lambda item: (item.score(), item.in_flight, item.request_count))
+                    break
+                if all(now < endpoint.ejected_until for endpoint in self.endpoints):
+                    endpoint = min(self.endpoints, key=lambda item: item.ejected_until)
+                    break
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceeded('等待可用代理时超过本轮剩余时间')
+                self._condition.wait(timeout=remaining if remaining is not None else 1)
+            if endpoint.ejected_until and now >= endpoint.ejected_until:
+                endpoint.probing = True
+            endpoint.in_flight += 1
+            endpoint.request_count += 1
+            return endpoint
+
+    def release(self, lease):
+        """
+        归还代理并记录本次请求的结果，没有记录结果（非网络原因中断）时不计入统计
+        """
+        endpoint = lease.endpoint
+        ejected = restored = False
+        with self._condition:
+            endpoint.in_flight -= 1
+            if lease.failed is not None:
+                endpoint.record(lease.latency, lease.failed)
+                if endpoint.probing:
+                    endpoint.probing = False
+                    if lease.failed:
+                        self._eject_locked(endpoint)
+                        ejected = True
+                    else:
+                        endpoint.ejected_until = 0.0
+                        endpoint.failure_rate = 0.0
+                        restored = True
+                elif lease.failed and (endpoint.consecutive_failures >= 3 or
+                                       (endpoint.samples >= self.min_samples and endpoint.failure_rate >= self.eject_failure_rate)):
+                    self._eject_locked(endpoint)
+                    ejected = True
+            elif endpoint.probing:
+                # 试探请求没有结果，下次继续试探
+                endpoint.probing = False
+            self._condition.notify_all()
+        if ejected:
+            logger.warning(f"代理 {endpoint.name} 失败率 {endpoint.failure_rate:.2f}，"
+                           f"剔除 {endpoint.ejected_until - time.monotonic():.0f} 秒后重新试探")
+        elif restored:
+            logger.info(f"代理 {endpoint.name} 试探成功，恢复使用")
+
+    def _eject_locked(self, endpoint):
+        endpoint.ejections += 1
+        seconds = min(self.eject_max_seconds, self.eject_seconds * 2 ** (endpoint.ejections - 1))
+        endpoint.ejected_until = time.monotonic() + seconds
+
+    @contextmanager
+    def lease(self):
+        """
+        在with块内占用一个代理，块内的连接错误和超时记为失败
+        用法：
+            with proxy_pool.lease() as lease:
+                response = requests.get(url, proxies=lease.proxies if lease else None)
+                lease.record(failed=response.status_code >= 500)
+        代理池为空时返回None
+        """
+        endpoint = self.acquire()
+        if endpoint is None:
+            yield None
+            return
+        lease = ProxyLease(endpoint)
+        try:
+            yield lease
+        except (requests.ConnectionError, requests.Timeout):
+            if lease.failed is None:
+                lease.record(failed=True)
+            raise
+        finally:
+            self.release(lease)
+
+    @asynccontextmanager
+    async def alease(self):
+        """
+        lease的asyncio版本，在线程中等待可用代理，不阻塞事件循环；块内的请求结果由调用方调用record记录
+        代理池为空时返回None
+        """
+        if not self.endpoints:
+            yield None
+            return
+        endpoint = await asyncio.to_thread(self.acquire)
+        lease = ProxyLease(endpoint)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    def stats(self):
+        """
+        :return: 每个代理的请求数、进行中请求数、平均延迟、失败率和是否被剔除
+        """
+        now = time.monotonic()
+        with self._condition:
+            return [{
+                'proxy': endpoint.name,
+                'requests': endpoint.request_count,
+                'in_flight': endpoint.in_flight,
+                'latency': round(endpoint.latency, 3) if endpoint.latency is not None else None,
+                'failure_rate': round(endpoint.failure_rate, 3),
+                'ejected': now < endpoint.ejected_until,
+                'ejections': endpoint.ejections,
+            } for endpoint in self.endpoints]
+
+
+_proxy_pool = None
+_proxy_pool_lock = threading.Lock()
+
+
+def get_proxy_pool():
+    """
+    获取全局代理池，首次调用时从环境变量PROXY_POOL读取，接口请求和媒体下载共用
+    """
+    global _proxy_pool
+    if _proxy_pool is None:
+        with _proxy_pool_lock:
+            if _proxy_pool is None:
+                _proxy_pool = ProxyPool()
+    return _proxy_pool
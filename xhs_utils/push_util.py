@@ -5,10 +5,7 @@ from datetime import datetime
 from loguru import logger
 import re
 import os
-from xhs_utils.common_utils import load_env
-
-# 加载.env文件中的环境变量
-load_env()
+from xhs_utils.common_utils import LazyInstance, load_env
 
 class PushDeer:
     def __init__(self, pushkey=None):
@@ -191,5 +188,10 @@ class PushDeer:
         
         return self.send_message(title, content)
 
-# 初始化全局推送器实例，从环境变量获取密钥
-pusher = PushDeer() 
\ No newline at end of file
+def create_pusher():
+    # 加载.env文件中的环境变量
+    load_env()
+    return PushDeer()
+
+# 全局推送器实例，第一次使用时从环境变量获取密钥
+pusher = LazyInstance(create_pusher)
\ No newline at end of file
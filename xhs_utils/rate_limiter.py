@@ -0,0 +1,298 @@
+import json
+import os
+import threading
+import time
+from loguru import logger
+
+
+class TokenBucket:
+    """
+    令牌桶
+    以 rate 个/秒的速度补充令牌，最多积累 burst 个。采用预约方式：取令牌时直接扣减，
+    令牌不足时返回需要等待的秒数，同步和异步调用方各自按返回值等待
+    """
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: 每秒补充的令牌数，0为不限制
+        :param burst: 令牌桶容量，允许的突发请求数
+        """
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill_locked(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        """
+        预约一个令牌
+        :return: 需要等待的秒数，0表示可以立即请求
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate):
+        """
+        调整令牌补充速度，已积累的令牌保留
+        """
+        with self._lock:
+            self._refill_locked(time.monotonic())
+            self.rate = float(rate)
+
+
+def parse_endpoint_limits(value):
+    """
+    解析接口限速配置
+    :param value: 格式为 接口路径:每秒请求数[:突发数]，多个接口用分号分隔，
+                  如 /api/sns/web/v1/feed:1:3;/api/sns/web/v1/search/notes:0.5
+    :return: {接口路径: (每秒请求数, 突发数)}
+    """
+    limits = {}
+    for item in (value or '').split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            parts = item.split(':')
+            rate = float(parts[1])
+            burst = float(parts[2]) if len(parts) > 2 else 1
+            limits[parts[0].strip()] = (rate, burst)
+        except (IndexError, ValueError):
+            logger.warning(f'接口限速配置格式错误，已忽略: {item}')
+    return limits
+
+
+# 被限流时接口返回的错误码和提示
+THROTTLE_STATUS_CODES = {429, 461, 471}
+THROTTLE_CODES = {300012, 300013, 300015}
+THROTTLE_KEYWORDS = ('频繁', '频次', '稍后再试', '风险', '验证')
+
+
+def is_throttled(status_code, res_json):
+    """
+    判断接口响应是否是被限流
+    :param status_code: HTTP状态码
+    :param res_json: 解析后的响应，响应不是JSON时为None
+    """
+    if status_code in THROTTLE_STATUS_CODES:
+        return True
+    if not isinstance(res_json, dict):
+        return True
+    if res_json.get('success', True):
+        return False
+    if res_json.get('code') in THROTTLE_CODES:
+        return True
+    msg = str(res_json.get('msg') or '')
+    return any(keyword in msg for keyword in THROTTLE_KEYWORDS)
+
+
+class AdaptiveRate:
+    """
+    AIMD自适应请求速度
+    响应正常时每次加性提高速度，遇到限流或延迟突增时乘性降低，结果写入全局令牌桶
+    """
+    def __init__(self, bucket, enabled=None, initial_rate=None, min_rate=None, max_rate=None,
+                 increase=None, decrease=None, latency_spike=None, cooldown=None):
+        """
+        :param bucket: 所有接口共用的令牌桶
+        :param enabled: 为None时从环境变量ADAPTIVE_RATE读取，默认true
+        :param initial_rate: 初始每秒请求数，为None时从环境变量ADAPTIVE_RATE_INITIAL读取，默认2
+        :param min_rate: 最低每秒请求数，为None时从环境变量ADAPTIVE_RATE_MIN读取，默认0.2
+        :param max_rate: 最高每秒请求数，为None时从环境变量ADAPTIVE_RATE_MAX读取，默认10
+        :param increase: 每次正常响应提高的每秒请求数，为None时从环境变量ADAPTIVE_RATE_INCREASE读取，默认0.05
+        :param decrease: 限流时速度乘以的系数，为None时从环境变量ADAPTIVE_RATE_DECREASE读取，默认0.5
+        :param latency_spike: 延迟超过平均值的倍数视为突增，为None时从环境变量ADAPTIVE_RATE_LATENCY_SPIKE读取，默认3，0为不检测
+        :param cooldown: 两次降速的最小间隔（秒），避免同一波限流响应连续降速，为None时从环境变量ADAPTIVE_RATE_COOLDOWN读取，默认5
+        """
+        self.bucket = bucket
+        self.enabled = enabled if enabled is not None else os.getenv('ADAPTIVE_RATE', 'true').lower() == 'true'
+        self.min_rate = min_rate if min_rate is not None else float(os.getenv('ADAPTIVE_RATE_MIN', '0.2'))
+        self.max_rate = max_rate if max_rate is not None else float(os.getenv('ADAPTIVE_RATE_MAX', '10'))
+        initial_rate = initial_rate if initial_rate is not None else float(os.getenv('ADAPTIVE_RATE_INITIAL', '2'))
+        self.increase = increase if increase is not None else float(os.getenv('ADAPTIVE_RATE_INCREASE', '0.05'))
+        self.decrease = decrease if decrease is not None else float(os.getenv('ADAPTIVE_RATE_DECREASE', '0.5'))
+        self.latency_spike = latency_spike if latency_spike is not None else float(os.getenv('ADAPTIVE_RATE_LATENCY_SPIKE', '3'))
+        self.cooldown = cooldown if cooldown is not None else float(os.getenv('ADAPTIVE_RATE_COOLDOWN', '5'))
+        self.rate = min(max(initial_rate, self.min_rate), self.max_rate)
+        self.latency_avg = None
+        self.samples = 0
+        self.increase_count = 0
+        self.decrease_count = 0
+        self.throttle_count = 0
+        self.last_decrease_at = 0.0
+        self.last_decrease_reason = None
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.bucket.set_rate(self.rate)
+
+    def observe(self, latency, throttled=False):
+        """
+        记录一次请求结果
+        :param latency: 请求耗时（秒）
+        :param throttled: 是否被限流，请求异常也视为限流
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.samples += 1
+            spike = (self.latency_spike > 0 and self.latency_avg is not None and self.samples > 20
+                     and latency > self.latency_avg * self.latency_spike)
+            # 突增的延迟不计入平均值，避免平均值被拉高后检测失效
+            if not spike:
+                self.latency_avg = latency if self.latency_avg is None else self.latency_avg * 0.9 + latency * 0.1
+            if throttled:
+                self.throttle_count += 1
+                reason = '接口限流'
+            elif spike:
+                reason = f'延迟突增 {latency:.2f}秒 (平均 {self.latency_avg:.2f}秒)'
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.increase_count += 1
+                self.bucket.set_rate(self.rate)
+                return
+            now = time.monotonic()
+            if now - self.last_decrease_at < self.cooldown:
+                return
+            previous = self.rate
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.decrease_count += 1
+            self.last_decrease_at = now
+            self.last_decrease_reason = reason
+            self.bucket.set_rate(self.rate)
+        logger.warning(f'{reason}，请求速度从 {previous:.2f} 降至 {self.rate:.2f} 次/秒')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'rate': round(self.rate, 3),
+                'latency_avg': round(self.latency_avg, 3) if self.latency_avg is not None else None,
+                'increases': self.increase_count,
+                'decreases': self.decrease_count,
+                'throttled': self.throttle_count,
+                'last_decrease_reason': self.last_decrease_reason,
+            }
+
+
+class RateLimiter:
+    """
+    请求限速器，每个接口和每个账号各有一个令牌桶，请求需要同时拿到两者的令牌
+    """
+    def __init__(self, endpoint_rate=None, endpoint_burst=None, endpoint_limits=None, account_rate=None, account_burst=None):
+        """
+        :param endpoint_rate: 未单独配置的接口每秒请求数，为None时从环境变量RATE_LIMIT_ENDPOINT读取，默认0(不限制)
+        :param endpoint_burst: 未单独配置的接口突发数，为None时从环境变量RATE_LIMIT_ENDPOINT_BURST读取，默认1
+        :param endpoint_limits: 单独配置的接口 {接口路径: (每秒请求数, 突发数)}，为None时从环境变量RATE_LIMIT_ENDPOINTS读取
+        :param account_rate: 每个账号每秒请求数，为None时从环境变量RATE_LIMIT_ACCOUNT读取，默认0(不限制)
+        :param account_burst: 每个账号突发数，为None时从环境变量RATE_LIMIT_ACCOUNT_BURST读取，默认1
+        """
+        self.endpoint_rate = endpoint_rate if endpoint_rate is not None else float(os.getenv('RATE_LIMIT_ENDPOINT', '0'))
+        self.endpoint_burst = endpoint_burst if endpoint_burst is not None else float(os.getenv('RATE_LIMIT_ENDPOINT_BURST', '1'))
+        self.endpoint_limits = endpoint_limits if endpoint_limits is not None else parse_endpoint_limits(os.getenv('RATE_LIMIT_ENDPOINTS', ''))
+        self.account_rate = account_rate if account_rate is not None else float(os.getenv('RATE_LIMIT_ACCOUNT', '0'))
+        self.account_burst = account_burst if account_burst is not None else float(os.getenv('RATE_LIMIT_ACCOUNT_BURST', '1'))
+        self.endpoint_buckets = {}
+        self.account_buckets = {}
+        # 所有接口共用的令牌桶，速度由自适应控制器调整
+        self.global_bucket = TokenBucket(0, self.endpoint_burst)
+        self.adaptive = AdaptiveRate(self.global_bucket)
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _endpoint_bucket(self, endpoint):
+        bucket = self.endpoint_buckets.get(endpoint)
+        if bucket is None:
+            with self._lock:
+                bucket = self.endpoint_buckets.get(endpoint)
+                if bucket is None:
+                    rate, burst = self.endpoint_limits.get(endpoint, (self.endpoint_rate, self.endpoint_burst))
+                    bucket = self.endpoint_buckets[endpoint] = TokenBucket(rate, burst)
+        return bucket
+
+    def _account_bucket(self, account):
+        bucket = self.account_buckets.get(account)
+        if bucket is None:
+            with self._lock:
+                bucket = self.account_buckets.get(account)
+                if bucket is None:
+                    bucket = self.account_buckets[account] = TokenBucket(self.account_rate, self.account_burst)
+        return bucket
+
+    def reserve(self, endpoint, account=None):
+        """
+        为一次请求预约接口和账号的令牌
+        :param endpoint: 接口路径，不含查询参数
+        :param account: 账号标识（cookies中的a1），为None时只限制接口
+        :return: 需要等待的秒数
+        """
+        wait = max(self.global_bucket.reserve(), self._endpoint_bucket(endpoint).reserve())
+        if account is not None:
+            wait = max(wait, self._account_bucket(account).reserve())
+        if wait > 0:
+            with self._lock:
+                self.wait_count += 1
+                self.wait_seconds += wait
+        return wait
+
+    def acquire(self, endpoint, account=None):
+        """
+        阻塞等待直到可以发送请求
+        """
+        wait = self.reserve(endpoint, account)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def observe(self, latency, throttled=False):
+        """
+        把请求结果反馈给自适应控制器
+        """
+        self.adaptive.observe(latency, throttled)
+
+    def stats(self):
+        adaptive = self.adaptive.stats()
+        with self._lock:
+            return {
+                'adaptive': adaptive,
+                'endpoints': {endpoint: bucket.rate for endpoint, bucket in self.endpoint_buckets.items()},
+                'accounts': len(self.account_buckets),
+                'waits': self.wait_count,
+                'wait_seconds': round(self.wait_seconds, 3),
+            }
+
+
+def export_metrics(stats, path):
+    """
+    把限速统计追加写入JSON Lines文件
+    :param stats: RateLimiter.stats() 或 RequestExecutor.stats() 的结果
+    :param path: 输出文件路径
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(dict(stats, time=time.strftime('%Y-%m-%d %H:%M:%S')), ensure_ascii=False) + '\n')
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    获取全局请求限速器，同步和异步接口共用同一套限速
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
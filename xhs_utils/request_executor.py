@@ -0,0 +1,204 @@
+import os
+import random
+import time
+import urllib.parse
+from contextlib import nullcontext
+import requests
+from loguru import logger
+from xhs_utils.circuit_breaker import get_circuit_breaker
+from xhs_utils.cookie_pool import is_login_expired
+from xhs_utils.deadline import DeadlineExceeded, check_deadline, remaining_time
+from xhs_utils.proxy_pool import get_proxy_pool
+from xhs_utils.rate_limiter import get_rate_limiter, is_throttled
+
+# 服务端临时错误，幂等接口可以重试
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+# 只查询数据的POST接口，重复请求没有副作用
+IDEMPOTENT_POST_ENDPOINTS = {
+    '/api/sns/web/v1/feed',
+    '/api/sns/web/v1/homefeed',
+    '/api/sns/web/v1/search/notes',
+    '/api/sns/web/v1/search/usersearch',
+}
+
+
+def classify_failure(status_code, res_json, throttled):
+    """
+    判断响应是否计入熔断的连续失败
+    :return: (是否登录失效或被限流, 失败原因)
+    """
+    if isinstance(res_json, dict) and is_login_expired(res_json.get('msg'), res_json):
+        return True, f"登录失效: {res_json.get('msg')}"
+    if throttled:
+        msg = res_json.get('msg') if isinstance(res_json, dict) else None
+        return True, f"被限流: HTTP {status_code} {msg or ''}".strip()
+    return False, None
+
+
+class RetryPolicy:
+    """
+    接口请求的超时和重试策略
+    超时不会超过当前截止时间的剩余时间；幂等接口遇到网络错误或5xx时按指数退避加随机抖动重试
+    """
+    def __init__(self, connect_timeout=None, read_timeout=None, retries=None, backoff=None, backoff_max=None):
+        """
+        :param connect_timeout: 建立连接超时（秒），为None时从环境变量HTTP_CONNECT_TIMEOUT读取，默认5
+        :param read_timeout: 读取响应超时（秒），为None时从环境变量HTTP_TIMEOUT读取，默认15
+        :param retries: 幂等接口的最大重试次数，为None时从环境变量HTTP_RETRIES读取，默认2
+        :param backoff: 第一次重试前的退避上限（秒），之后每次翻倍，为None时从环境变量HTTP_RETRY_BACKOFF读取，默认0.5
+        :param backoff_max: 退避时间上限（秒），为None时从环境变量HTTP_RETRY_BACKOFF_MAX读取，默认8
+        """
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+        self.read_timeout = read_timeout if read_timeout is not None else float(os.getenv('HTTP_TIMEOUT', '15'))
+        self.retries = retries if retries is not None else int(os.getenv('HTTP_RETRIES', '2'))
+        self.backoff = backoff if backoff is not None else float(os.getenv('HTTP_RETRY_BACKOFF', '0.5'))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv('HTTP_RETRY_BACKOFF_MAX', '8'))
+
+    def attempts(self, method, endpoint):
+        """
+        :return: 最多请求次数，非幂等接口不重试
+        """
+        if method.upper() == 'GET' or endpoint in IDEMPOTENT_POST_ENDPOINTS:
+            return self.retries + 1
+        return 1
+
+    def timeout(self):
+        """
+        本次请求的 (连接超时, 读取超时)，不超过截止时间的剩余时间
+        """
+        check_deadline()
+        remaining = remaining_time()
+        if remaining is None:
+            return self.connect_timeout, self.read_timeout
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def backoff_delay(self, attempt):
+        """
+        第attempt次重试前的等待时间，在 [0, backoff * 2^attempt] 内随机（full jitter）
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+    def wait_before_retry(self, attempt):
+        """
+        计算重试前的等待时间
+        :return: 等待秒数，剩余时间不够时返回None表示放弃重试
+        """
+        delay = self.backoff_delay(attempt)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+
+class RequestExecutor:
+    """
+    接口请求的统一出口
+    每次请求先按接口和账号取令牌限速，再通过长连接会话发送，
+    响应的耗时和是否被限流反馈给自适应限速；幂等接口失败时按重试策略重试；
+    调用方和会话都没有指定代理时，每次请求从代理池中选择代理；
+    连续多次登录失效或被限流时由熔断器暂停所有请求
+    """
+    def __init__(self, session, limiter=None, retry_policy=None, proxy_pool=None, circuit_breaker=None):
+        """
+        :param session: PooledSession
+        :param limiter: RateLimiter，为None时使用全局限速器
+        :param retry_policy: RetryPolicy，为None时从环境变量读取配置
+        :param proxy_pool: ProxyPool，为None时使用全局代理池
+        :param circuit_breaker: CircuitBreaker，为None时使用全局熔断器
+        """
+        self.session = session
+        self.limiter = limiter or get_rate_limiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.proxy_pool = proxy_pool if proxy_pool is not None else get_proxy_pool()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.retry_count = 0
+
+    def request(self, method, url, cookies=None, **kwargs):
+        endpoint = urllib.parse.urlparse(url).path
+        account = cookies.get('a1') if cookies else None
+        attempts = self.retry_policy.attempts(method, endpoint)
+        use_proxy_pool = kwargs.get('proxies') is None and not self.session.proxies and len(self.proxy_pool) > 0
+        for attempt in range(attempts):
+            probe = self.circuit_breaker.check()
+            try:
+                wait = self.limiter.reserve(endpoint, account)
+                if wait > 0:
+                    remaining = remaining_time()
+                    if remaining is not None and wait >= remaining:
+                        raise DeadlineExceeded(f'等待限速 {wait:.1f} 秒会超过本轮剩余时间')
+                    time.sleep(wait)
+                kwargs['timeout'] = self.retry_policy.timeout()
+                retry_delay = None
+                # 重试前的等待放在with块外，等待期间不占用代理
+                with self.proxy_pool.lease() if use_proxy_pool else nullcontext() as lease:
+                    if lease is not None:
+                        kwargs['proxies'] = lease.proxies
+                    start_time = time.monotonic()
+                    try:
+                        response = self.session.request(method, url, cookies=cookies, **kwargs)
+                    except (requests.ConnectionError, requests.Timeout) as e:
+                        self.limiter.observe(time.monotonic() - start_time, throttled=True)
+                        if lease is not None:
+                            lease.record(failed=True)
+                        if probe:
+                            # 网络错误不计入熔断，但试探请求出错同样视为试探失败
+                            self.circuit_breaker.record(True, f'试探请求出错: {e!r}', probe=True)
+                        retry_delay = self._retry_delay(attempt, attempts, endpoint, repr(e))
+                        if retry_delay is None:
+                            raise
+                    except Exception:
+                        self.limiter.observe(time.monotonic() - start_time, throttled=True)
+                        raise
+                    else:
+                        latency = time.monotonic() - start_time
+                        try:
+                            res_json = response.json()
+                        except ValueError:
+                            res_json = None
+                        throttled = is_throttled(response.status_code, res_json)
+                        self.limiter.observe(latency, throttled)
+                        self.circuit_breaker.record(*classify_failure(response.status_code, res_json, throttled), probe=probe)
+                        if lease is not None:
+                            # 被限流通常是出口IP的请求过多，同样计入代理的失败率
+                            lease.record(latency, failed=throttled or response.status_code in RETRY_STATUS_CODES)
+                        if response.status_code in RETRY_STATUS_CODES:
+                            retry_delay = self._retry_delay(attempt, attempts, endpoint, f'HTTP {response.status_code}')
+                        if retry_delay is None:
+                            return response
+            except BaseException as e:
+                # 试探请求出错时记为试探失败，熔断器不会一直等待试探结果
+                if probe:
+                    self.circuit_breaker.record(True, f'试探请求出错: {e!r}', probe=True)
+                raise
+            time.sleep(retry_delay)
+
+    def _retry_delay(self, attempt, attempts, endpoint, reason):
+        """
+        :return: 重试前的等待秒数，不再重试时返回None
+        """
+        if attempt + 1 >= attempts:
+            return None
+        delay = self.retry_policy.wait_before_retry(attempt)
+        if delay is None:
+            return None
+        self.retry_count += 1
+        logger.warning(f'请求 {endpoint} 失败: {reason}，{delay:.1f} 秒后第 {attempt + 1} 次重试')
+        return delay
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """
+        :return: 连接复用统计、限速统计、重试次数、各代理的统计和熔断统计
+        """
+        return {
+            'session': self.session.stats(),
+            'rate_limit': self.limiter.stats(),
+            'retries': self.retry_count,
+            'proxies': self.proxy_pool.stats(),
+            'circuit_breaker': self.circuit_breaker.stats(),
+        }
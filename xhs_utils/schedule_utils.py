@@ -1,10 +1,7 @@
 import os
 from datetime import datetime, time
 from loguru import logger
-from xhs_utils.common_utils import load_env
-
-# 加载环境变量
-load_env()
+from xhs_utils.common_utils import LazyInstance, load_env
 
 class ScheduleController:
     """
@@ -115,5 +112,10 @@ class ScheduleController:
             # 如果当前不在任何禁止时间段内，则返回None
             return None
 
-# 创建全局实例
-schedule_controller = ScheduleController() 
\ No newline at end of file
+def create_schedule_controller():
+    # 加载环境变量
+    load_env()
+    return ScheduleController()
+
+# 全局实例，第一次使用时读取配置
+schedule_controller = LazyInstance(create_schedule_controller)
\ No newline at end of file
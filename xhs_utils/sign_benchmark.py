@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from loguru import logger
+from xhs_utils import xhs_util
+from xhs_utils.sign_worker import get_sign_pool
+
+BENCHMARK_BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../datas/benchmark_datas'))
+BENCHMARK_A1 = '1927f6098768njq4co9jqukn0qtc8irx7u3ixrnxs50000565146'
+BENCHMARK_COOKIES = f'a1={BENCHMARK_A1}; webId=benchmark; web_session=benchmark'
+
+# 与 apis/pc_apis.py 中实际请求相同形状的签名参数 (api, data)
+PAYLOADS = {
+    # GET接口，参数拼在url上，data为空
+    'user_note_query': (xhs_util.splice_str('/api/sns/web/v1/user_posted', {
+        'num': '30',
+        'cursor': '',
+        'user_id': '5ff0e6410000000001008400',
+        'image_formats': 'jpg,webp,avif',
+        'xsec_token': 'ABVeBVxWW0qDfjymJEFJmCnqRuqRn_yAuqgHBJp1Ub8oE=',
+        'xsec_source': 'pc_feed',
+    }), ''),
+    'note_feed': ('/api/sns/web/v1/feed', {
+        'source_note_id': '67d7c713000000000900e391',
+        'image_formats': ['jpg', 'webp', 'avif'],
+        'extra': {'need_body_topic': '1'},
+        'xsec_source': 'pc_search',
+        'xsec_token': 'ABVeBVxWW0qDfjymJEFJmCnqRuqRn_yAuqgHBJp1Ub8oE=',
+    }),
+    'search_note': ('/api/sns/web/v1/search/notes', {
+        'keyword': '榴莲',
+        'page': 1,
+        'page_size': 20,
+        'search_id': 'benchmark0search0id01',
+        'sort': 'general',
+        'note_type': 0,
+        'ext_flags': [],
+        'image_formats': ['jpg', 'webp', 'avif'],
+    }),
+    # 长关键词，观察请求体大小对签名耗时的影响
+    'search_note_large': ('/api/sns/web/v1/search/notes', {
+        'keyword': '榴莲千层蛋糕做法' * 64,
+        'page': 1,
+        'page_size': 20,
+        'search_id': 'benchmark0search0id01',
+        'sort': 'general',
+        'note_type': 0,
+        'ext_flags': [],
+        'image_formats': ['jpg', 'webp', 'avif'],
+    }),
+}
+
+TARGETS = {
+    'generate_xs_xs_common': lambda api, data: xhs_util.generate_xs_xs_common(BENCHMARK_A1, api, data),
+    'generate_xs': lambda api, data: xhs_util.generate_xs(BENCHMARK_A1, api, data),
+    # 直接测一次JS批量生成的耗时（即缓冲池补充一次的耗时），从缓冲池取用只是出队，测不出签名后端的差异
+    'generate_xray_traceid_batch': lambda api, data: xhs_util.generate_xray_traceid_batch(xhs_util.xray_pool.size),
+    'generate_request_params': lambda api, data: xhs_util.generate_request_params(BENCHMARK_COOKIES, api, data),
+}
+# 与请求参数无关的函数只测一种参数
+PAYLOAD_FREE_TARGETS = {'generate_xray_traceid_batch'}
+
+BACKENDS = ['execjs', 'worker']
+
+
+@contextmanager
+def sign_backend(backend):
+    """
+    临时切换签名后端，同时清空x-xray-traceid缓冲池，避免沿用另一个后端生成的traceId
+    """
+    previous = os.environ.get('SIGN_BACKEND')
+    os.environ['SIGN_BACKEND'] = backend
+    xhs_util.xray_pool.clear()
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('SIGN_BACKEND', None)
+        else:
+            os.environ['SIGN_BACKEND'] = previous
+        xhs_util.xray_pool.clear()
+
+
+def percentile(sorted_values, percent):
+    """
+    线性插值计算百分位数
+    :param sorted_values: 已排序的数值列表
+    :param percent: 0~100
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def run_case(target, payload, calls, concurrency):
+    """
+    在指定并发数下重复调用签名函数
+    :param target: TARGETS中的函数名
+    :param payload: PAYLOADS中的参数名
+    :param calls: 总调用次数
+    :param concurrency: 并发线程数
+    :return: 延迟百分位数（毫秒）和吞吐量
+    """
+    func = TARGETS[target]
+    api, data = PAYLOADS[payload]
+    # 预热：启动签名进程、填充traceId缓冲池，不计入结果
+    func(api, data)
+
+    def timed_call(_):
+        start_time = time.perf_counter()
+        try:
+            func(api, data)
+            return time.perf_counter() - start_time, None
+        except Exception as e:
+            return time.perf_counter() - start_time, repr(e)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_call, range(calls)))
+    wall_seconds = time.perf_counter() - start_time
+    latencies = sorted(latency * 1000 for latency, error in results if error is None)
+    errors = [error for _, error in results if error is not None]
+    return {
+        'target': target,
+        'payload': payload,
+        'payload_bytes': len(api) + len(json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')) if data else len(api),
+        'concurrency': concurrency,
+        'calls': calls,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'wall_seconds': round(wall_seconds, 4),
+        'throughput_per_second': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 3) if latencies else None,
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p90': round(percentile(latencies, 90), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None,
+        },
+    }
+
+
+def node_version():
+    try:
+        return subprocess.run(['node', '--version'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def run_benchmark(backends=None, targets=None, payloads=None, concurrency_levels=(1, 4, 16), calls=200, execjs_calls=10):
+    """
+    对不同签名后端、签名函数、请求参数和并发数组合进行基准测试
+    :param backends: 签名后端列表，默认 execjs 和 worker
+    :param targets: 签名函数列表，默认全部
+    :param payloads: 请求参数列表，默认全部
+    :param concurrency_levels: 并发数列表
+    :param calls: worker后端每组的调用次数
+    :param execjs_calls: execjs每次调用都要启动node进程，单独设置较少的调用次数
+    :return: 测试结果
+    """
+    backends = backends or BACKENDS
+    targets = targets or list(TARGETS)
+    payloads = payloads or list(PAYLOADS)
+    report = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'node': node_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sign_workers': get_sign_pool().size,
+            'sign_snapshot': get_sign_pool().snapshot_blob,
+        },
+        'results': [],
+    }
+    for backend in backends:
+        with sign_backend(backend):
+            backend_calls = execjs_calls if backend == 'execjs' else calls
+            for target in targets:
+                target_payloads = payloads[:1] if target in PAYLOAD_FREE_TARGETS else payloads
+                for payload in target_payloads:
+                    for concurrency in concurrency_levels:
+                        result = run_case(target, payload, backend_calls, concurrency)
+                        result['backend'] = backend
+                        if target == 'generate_xray_traceid_batch':
+                            result['batch_size'] = xhs_util.xray_pool.size
+                        report['results'].append(result)
+                        logger.info(f"[{backend}] {target} {payload} 并发{concurrency}: "
+                                    f"p50 {result['latency_ms']['p50']}ms, p99 {result['latency_ms']['p99']}ms, "
+                                    f"{result['throughput_per_second']}次/秒, 失败 {result['errors']}")
+    return report
+
+
+def save_report(report, output_path=None):
+    """
+    保存测试结果为JSON
+    :param output_path: 输出路径，默认 datas/benchmark_datas/sign_benchmark_时间.json
+    """
+    if output_path is None:
+        if not os.path.exists(BENCHMARK_BASE_PATH):
+            os.makedirs(BENCHMARK_BASE_PATH)
+        output_path = os.path.join(BENCHMARK_BASE_PATH, f"sign_benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f'签名基准测试结果已保存至 {output_path}')
+    return output_path
+
+
+if __name__ == '__main__':
+    """
+        签名基准测试
+        python -m xhs_utils.sign_benchmark --backends worker --concurrency 1 8 --calls 500
+    """
+    parser = argparse.ArgumentParser(description='签名基准测试')
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS)
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument('--payloads', nargs='+', choices=list(PAYLOADS), default=list(PAYLOADS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--calls', type=int, default=200, help='worker后端每组调用次数')
+    parser.add_argument('--execjs-calls', type=int, default=10, help='execjs后端每组调用次数')
+    parser.add_argument('--output', default=None, help='结果JSON路径')
+    args = parser.parse_args()
+    report = run_benchmark(args.backends, args.targets, args.payloads, args.concurrency, args.calls, args.execjs_calls)
+    save_report(report, args.output)
+    get_sign_pool().close()
+    failed = sum(result['errors'] for result in report['results'])
+    sys.exit(1 if failed else 0)
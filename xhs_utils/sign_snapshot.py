@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+from loguru import logger
+from xhs_utils.sign_worker import SIGNER_SCRIPT, SIGNER_SNAPSHOT, SignWorker
+
+SNAPSHOT_ENTRY = os.path.abspath(os.path.join(os.path.dirname(__file__), '../static/xhs_signer_snapshot.js'))
+
+
+def build_snapshot(blob_path=SIGNER_SNAPSHOT, node_bin='node'):
+    """
+    构建签名进程的V8启动快照
+    快照与构建时的node版本绑定，更换node版本后需要重新构建
+    :param blob_path: 快照输出路径
+    :param node_bin: node可执行文件
+    :return: 快照路径
+    """
+    start_time = time.time()
+    result = subprocess.run(
+        [node_bin, '--snapshot-blob', blob_path, '--build-snapshot', SNAPSHOT_ENTRY],
+        cwd=os.path.dirname(SNAPSHOT_ENTRY),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0 or not os.path.exists(blob_path):
+        raise RuntimeError(f'构建启动快照失败: {result.stderr.strip()}')
+    size_mb = os.path.getsize(blob_path) / 1024 / 1024
+    logger.info(f'启动快照已生成 {blob_path} ({size_mb:.1f}MB)，耗时 {time.time() - start_time:.2f} 秒')
+    return blob_path
+
+
+def measure_cold_start(snapshot_blob=None, rounds=3, node_bin='node'):
+    """
+    测量签名进程从启动到可以签名的耗时
+    :param snapshot_blob: 启动快照路径，为None时直接加载脚本
+    :param rounds: 测量次数
+    :return: 每次的耗时（秒）列表
+    """
+    durations = []
+    for _ in range(rounds):
+        worker = SignWorker(SIGNER_SCRIPT, node_bin, snapshot_blob=snapshot_blob)
+        try:
+            start_time = time.time()
+            worker.start()
+            # 快照启动失败时会退回脚本模式，这种结果不能计入快照耗时
+            if snapshot_blob and not worker.snapshot_blob:
+                raise RuntimeError('签名进程未能从启动快照启动')
+            worker.call('traceId')
+            durations.append(time.time() - start_time)
+        finally:
+            worker.close()
+    return durations
+
+
+def compare_cold_start(blob_path=SIGNER_SNAPSHOT, rounds=3, node_bin='node'):
+    """
+    对比直接加载脚本和从启动快照启动的冷启动耗时
+    :return: {'script': 平均耗时, 'snapshot': 平均耗时}
+    """
+    script_durations = measure_cold_start(None, rounds, node_bin)
+    snapshot_durations = measure_cold_start(blob_path, rounds, node_bin)
+    report = {
+        'script': sum(script_durations) / len(script_durations),
+        'snapshot': sum(snapshot_durations) / len(snapshot_durations),
+    }
+    logger.info(f"签名进程冷启动耗时（{rounds}次平均）: 直接加载脚本 {report['script']:.3f} 秒，"
+                f"启动快照 {report['snapshot']:.3f} 秒，节省 {(1 - report['snapshot'] / report['script']) * 100:.1f}%")
+    return report
+
+
+if __name__ == '__main__':
+    """
+        构建签名进程启动快照并输出冷启动耗时对比
+        python -m xhs_utils.sign_snapshot [快照输出路径]
+    """
+    blob_path = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else SIGNER_SNAPSHOT
+    build_snapshot(blob_path)
+    compare_cold_start(blob_path)
@@ -0,0 +1,499 @@
+import base64
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+from loguru import logger
+
+SIGNER_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../static/xhs_signer.js'))
+SIGNER_SNAPSHOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../static/xhs_signer.blob'))
+# 健康检查使用的固定签名请求，签名结果中带有时间戳，只能校验结构
+PROBE_REQUEST = ['/api/sns/web/v2/user/me', '', '1927f6098768njq4co9jqukn0qtc8irx7u3ixrnxs50000565146']
+_READY_ID = 0
+_PROBE_ID = -1
+
+
+def resolve_snapshot_blob():
+    """
+    根据环境变量SIGN_SNAPSHOT确定签名进程使用的启动快照
+    auto(默认): static/xhs_signer.blob 存在时使用；off: 不使用；其他值视为快照文件路径
+    """
+    value = os.getenv('SIGN_SNAPSHOT', 'auto').strip()
+    if value.lower() in ('', 'off', 'false', 'none'):
+        return None
+    if value.lower() == 'auto':
+        return SIGNER_SNAPSHOT if os.path.exists(SIGNER_SNAPSHOT) else None
+    return value
+
+
+class SignWorkerError(Exception):
+    """
+    签名进程调用失败
+    """
+    pass
+
+
+def check_probe_result(result):
+    """
+    校验健康检查请求的签名结果
+    :param result: sign_batch 对 PROBE_REQUEST 的返回值
+    :return: 不通过时返回原因，通过时返回None
+    """
+    try:
+        sign = result[0]
+        xs = sign['xs']
+        if not xs.startswith('XYW_'):
+            return f'x-s 前缀错误: {xs[:8]}'
+        encrypt_data = json.loads(base64.b64decode(xs[4:]))
+        if encrypt_data.get('signSvn') != '56' or not encrypt_data.get('payload'):
+            return f'x-s 内容错误: {encrypt_data}'
+        xt = int(sign['xt'])
+        if abs(xt / 1000 - time.time()) > 300:
+            return f'x-t 与当前时间相差过大: {xt}'
+        if not isinstance(sign['xs_common'], str) or not sign['xs_common']:
+            return 'x-s-common 为空'
+        if not re.fullmatch(r'[0-9a-f]{32}', sign['trace_id']):
+            return f"x-xray-traceid 格式错误: {sign['trace_id']}"
+    except Exception as e:
+        return f'签名结果无法解析: {e!r}'
+    return None
+
+
+def read_process_rss(pid):
+    """
+    从 /proc 读取进程常驻内存（字节），非Linux系统返回None
+    """
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class _PendingCall:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.crashed = False
+
+
+class SignWorker:
+    """
+    常驻的Node.js签名进程
+    启动时只加载一次签名脚本，之后通过stdin/stdout按行收发JSON请求，
+    避免execjs每次调用都写临时文件并启动新的node进程
+    """
+    def __init__(self, script_path=SIGNER_SCRIPT, node_bin='node', timeout=None, snapshot_blob=None):
+        """
+        :param script_path: 签名进程脚本路径
+        :param node_bin: node可执行文件
+        :param timeout: 单次调用超时时间（秒），为None时从环境变量SIGN_TIMEOUT读取，默认10秒
+        :param snapshot_blob: V8启动快照文件，由 xhs_utils/sign_snapshot.py 构建，为None时直接加载脚本
+        """
+        self.script_path = script_path
+        self.node_bin = node_bin
+        self.snapshot_blob = snapshot_blob
+        self.last_start_seconds = None
+        self.timeout = timeout if timeout is not None else float(os.getenv('SIGN_TIMEOUT', '10'))
+        self.process = None
+        self.start_count = 0
+        self.restart_count = 0
+        self.in_flight = 0
+        self.call_count = 0
+        self.error_count = 0
+        self.calls_since_start = 0
+        self._next_id = 1
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """
+        启动签名进程，并等待脚本加载完成
+        """
+        with self._lock:
+            if self.alive:
+                return
+            self._start_locked()
+
+    def _start_locked(self):
+        start_time = time.time()
+        self._fail_pending_locked('签名进程已重启')
+        ready = _PendingCall()
+        probe = _PendingCall()
+        if self.snapshot_blob:
+            command = [self.node_bin, '--snapshot-blob', self.snapshot_blob, os.path.dirname(self.script_path)]
+        else:
+            command = [self.node_bin, self.script_path]
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=os.path.dirname(self.script_path),
+            text=True,
+            encoding='utf-8',
+            bufsize=1,
+        )
+        reader = threading.Thread(target=self._read_loop, args=(self.process, {_READY_ID: ready, _PROBE_ID: probe}), daemon=True)
+        reader.start()
+        # 读取线程不需要锁即可通知就绪和健康检查结果，因此这里可以持锁等待
+        error = self._wait_startup_locked(ready, probe)
+        if error:
+            self._kill_locked()
+            if self.snapshot_blob:
+                # 快照与node版本绑定，升级node后旧快照无法使用，退回直接加载脚本
+                logger.warning(f'从启动快照 {self.snapshot_blob} 启动签名进程失败: {error}，改为直接加载脚本')
+                self.snapshot_blob = None
+                return self._start_locked()
+            raise SignWorkerError(f'签名进程启动失败: {error}')
+        self.start_count += 1
+        self.calls_since_start = 0
+        self.last_start_seconds = time.time() - start_time
+        mode = '启动快照' if self.snapshot_blob else '脚本'
+        logger.debug(f'签名进程已启动 pid={self.process.pid}，启动方式: {mode}，耗时 {self.last_start_seconds:.2f} 秒')
+
+    def _wait_startup_locked(self, ready, probe):
+        """
+        等待脚本加载完成，并用固定请求做一次健康检查，通过后才接收签名请求
+        :return: 失败原因，成功时返回None
+        """
+        if not ready.event.wait(self.timeout * 3):
+            return '启动超时'
+        if ready.error:
+            return ready.error
+        try:
+            self.process.stdin.write(json.dumps({'id': _PROBE_ID, 'method': 'sign_batch', 'params': [[PROBE_REQUEST]]}) + '\n')
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            return f'写入健康检查请求失败: {e}'
+        if not probe.event.wait(self.timeout):
+            return '健康检查超时'
+        if probe.error:
+            return f'健康检查失败: {probe.error}'
+        reason = check_probe_result(probe.result)
+        if reason:
+            return f'健康检查失败: {reason}'
+        return None
+
+    def _read_loop(self, process, startup):
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.debug(f'签名进程输出无法解析: {line.strip()}')
+                continue
+            if message.get('id') in startup:
+                waiter = startup[message.get('id')]
+                waiter.result = message.get('result')
+                waiter.error = message.get('error')
+                waiter.event.set()
+                continue
+            with self._lock:
+                pending = self._pending.pop(message.get('id'), None)
+            if pending is None:
+                continue
+            pending.result = message.get('result')
+            pending.error = message.get('error')
+            pending.event.set()
+        # 进程退出，唤醒所有等待中的调用
+        for waiter in startup.values():
+            if not waiter.event.is_set():
+                waiter.error = f'签名进程已退出 (code={process.wait()})'
+                waiter.event.set()
+        with self._lock:
+            if process is self.process:
+                self.process = None
+                self._fail_pending_locked(f'签名进程已退出 (code={process.wait()})')
+
+    def _fail_pending_locked(self, error):
+        for pending in self._pending.values():
+            pending.error = error
+            pending.crashed = True
+            pending.event.set()
+        self._pending = {}
+
+    def _kill_locked(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+            except Exception:
+                pass
+        self.process = None
+        self._fail_pending_locked('签名进程已终止')
+
+    def _send(self, method, params):
+        with self._lock:
+            if not self.alive:
+                if self.start_count > 0:
+                    self.restart_count += 1
+                    logger.warning(f'签名进程已退出，正在重启 (第{self.restart_count}次)')
+                self._start_locked()
+            call_id = self._next_id
+            self._next_id += 1
+            pending = _PendingCall()
+            self._pending[call_id] = pending
+            try:
+                self.process.stdin.write(json.dumps({'id': call_id, 'method': method, 'params': params}, ensure_ascii=False) + '\n')
+                self.process.stdin.flush()
+            except (OSError, ValueError) as e:
+                self._pending.pop(call_id, None)
+                self._kill_locked()
+                raise SignWorkerError(f'写入签名进程失败: {e}')
+        return call_id, pending
+
+    def call(self, method, *params):
+        """
+        调用签名进程中的方法
+        :param method: 方法名 get_request_headers_params / get_xs / traceId
+        :param params: 方法参数
+        :return: 方法返回值
+        """
+        with self._lock:
+            self.in_flight += 1
+            self.call_count += 1
+            self.calls_since_start += 1
+        try:
+            return self._call(method, params)
+        except SignWorkerError:
+            with self._lock:
+                self.error_count += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _call(self, method, params):
+        for attempt in range(2):
+            call_id, pending = self._send(method, list(params))
+            if not pending.event.wait(self.timeout):
+                with self._lock:
+                    self._pending.pop(call_id, None)
+                    self._kill_locked()
+                raise SignWorkerError(f'签名进程调用 {method} 超时')
+            if pending.error is None:
+                return pending.result
+            # 进程崩溃时重启后重试一次，脚本本身抛出的错误直接返回
+            if attempt == 0 and pending.crashed:
+                continue
+            raise SignWorkerError(pending.error)
+
+    def rss(self):
+        """
+        签名进程当前的常驻内存（字节），进程未启动时返回None
+        """
+        process = self.process
+        if process is None or process.poll() is not None:
+            return None
+        rss = read_process_rss(process.pid)
+        if rss is None:
+            # 无法读取 /proc 时由进程自己上报
+            try:
+                rss = self._call('memory', ())
+            except SignWorkerError:
+                return None
+        return rss
+
+    def stats(self):
+        return {
+            'pid': self.process.pid if self.alive else None,
+            'alive': self.alive,
+            'in_flight': self.in_flight,
+            'calls': self.call_count,
+            'errors': self.error_count,
+            'restarts': self.restart_count,
+            'calls_since_start': self.calls_since_start,
+        }
+
+    def close(self):
+        with self._lock:
+            if self.process is not None:
+                try:
+                    self.process.stdin.close()
+                    self.process.wait(timeout=3)
+                except Exception:
+                    pass
+            self._kill_locked()
+
+
+class SignWorkerPool:
+    """
+    签名进程池
+    单个node进程的事件循环会串行处理所有签名请求，进程池把并发的签名请求分发到多个进程上。
+    进程按需启动：已有进程都在忙且未达到上限时才启动新进程，分发时选择进行中请求最少的进程。
+    签名脚本依赖的jsdom会随调用次数不断占用内存，进程调用次数或内存超过阈值后在后台启动替换进程，
+    替换进程通过健康检查后接管分发，旧进程处理完进行中的请求再关闭
+    """
+    def __init__(self, size=None, script_path=SIGNER_SCRIPT, node_bin='node', timeout=None,
+                 max_calls=None, max_rss_mb=None, memory_check_interval=None):
+        """
+        :param size: 进程数量上限，为None时从环境变量SIGN_WORKERS读取，默认为CPU核数
+        :param max_calls: 单个进程处理的调用次数上限，为None时从环境变量SIGN_MAX_CALLS读取，默认20000，0为不限制
+        :param max_rss_mb: 单个进程的常驻内存上限（MB），为None时从环境变量SIGN_MAX_RSS_MB读取，默认512，0为不限制
+        :param memory_check_interval: 每处理多少次调用检查一次内存，为None时从环境变量SIGN_MEMORY_CHECK_INTERVAL读取，默认100
+        """
+        if size is None:
+            size = int(os.getenv('SIGN_WORKERS', '0')) or os.cpu_count() or 1
+        self.size = max(1, size)
+        self.max_calls = max_calls if max_calls is not None else int(os.getenv('SIGN_MAX_CALLS', '20000'))
+        self.max_rss_mb = max_rss_mb if max_rss_mb is not None else float(os.getenv('SIGN_MAX_RSS_MB', '512'))
+        self.memory_check_interval = memory_check_interval if memory_check_interval is not None \
+            else int(os.getenv('SIGN_MEMORY_CHECK_INTERVAL', '100'))
+        self.recycle_count = 0
+        self.snapshot_blob = resolve_snapshot_blob()
+        self.script_path = script_path
+        self.node_bin = node_bin
+        self.timeout = timeout
+        self.workers = []
+        self._assigned = {}
+        self._retiring = set()
+        self._lock = threading.Lock()
+
+    def _acquire_worker(self):
+        with self._lock:
+            idle = [worker for worker in self.workers if self._assigned[worker] == 0]
+            if idle:
+                worker = idle[0]
+            elif len(self.workers) < self.size:
+                worker = SignWorker(self.script_path, self.node_bin, self.timeout, self.snapshot_blob)
+                self.workers.append(worker)
+                self._assigned[worker] = 0
+                logger.debug(f'签名进程池扩容至 {len(self.workers)}/{self.size}')
+            else:
+                worker = min(self.workers, key=lambda w: self._assigned[w])
+            # 在锁内登记，避免并发请求都选中同一个空闲进程
+            self._assigned[worker] += 1
+        return worker
+
+    def _release_worker(self, worker):
+        with self._lock:
+            if worker not in self._assigned:
+                return
+            self._assigned[worker] -= 1
+            # 已被替换的旧进程在最后一个请求完成后关闭
+            drained = worker not in self.workers and self._assigned[worker] == 0
+            if drained:
+                self._assigned.pop(worker)
+                self._retiring.discard(worker)
+        if drained:
+            worker.close()
+            logger.debug('旧签名进程已处理完进行中的请求并关闭')
+
+    def call(self, method, *params):
+        """
+        把签名请求分发给进行中请求最少的签名进程
+        """
+        worker = self._acquire_worker()
+        try:
+            return worker.call(method, *params)
+        finally:
+            self._release_worker(worker)
+            self._check_recycle(worker)
+
+    def _recycle_reason(self, worker):
+        calls = worker.calls_since_start
+        if self.max_calls and calls >= self.max_calls:
+            return f'调用次数达到 {calls}'
+        if self.max_rss_mb and self.memory_check_interval and calls % self.memory_check_interval == 0:
+            rss = worker.rss()
+            if rss is not None and rss / 1024 / 1024 >= self.max_rss_mb:
+                return f'常驻内存达到 {rss / 1024 / 1024:.0f}MB'
+        return None
+
+    def _check_recycle(self, worker):
+        with self._lock:
+            if worker in self._retiring or worker not in self.workers:
+                return
+        reason = self._recycle_reason(worker)
+        if reason is None:
+            return
+        with self._lock:
+            if worker in self._retiring or worker not in self.workers:
+                return
+            self._retiring.add(worker)
+        logger.info(f'签名进程 {reason}，开始回收')
+        threading.Thread(target=self._replace_worker, args=(worker,), daemon=True).start()
+
+    def _replace_worker(self, old_worker):
+        """
+        启动并检查替换进程，成功后替换旧进程；旧进程在替换前仍正常接收请求
+        """
+        new_worker = SignWorker(self.script_path, self.node_bin, self.timeout, self.snapshot_blob)
+        try:
+            new_worker.start()
+        except SignWorkerError as e:
+            # 替换失败时保留旧进程，下次检查时再尝试
+            logger.warning(f'签名进程替换失败，继续使用旧进程: {e}')
+            with self._lock:
+                self._retiring.discard(old_worker)
+            return
+        with self._lock:
+            if old_worker not in self.workers:
+                replaced = False
+            else:
+                self.workers[self.workers.index(old_worker)] = new_worker
+                self._assigned[new_worker] = 0
+                replaced = True
+                self.recycle_count += 1
+                drained = self._assigned[old_worker] == 0
+                if drained:
+                    self._assigned.pop(old_worker)
+                    self._retiring.discard(old_worker)
+        if not replaced:
+            # 进程池已关闭
+            new_worker.close()
+            return
+        logger.info(f'签名进程已回收替换 (第{self.recycle_count}次)')
+        if drained:
+            old_worker.close()
+
+    def stats(self):
+        """
+        进程池统计信息
+        :return: 进程池配置、汇总数据以及每个进程的统计
+        """
+        with self._lock:
+            workers = [worker.stats() for worker in self.workers]
+        return {
+            'size': self.size,
+            'started': len(workers),
+            'in_flight': sum(worker['in_flight'] for worker in workers),
+            'calls': sum(worker['calls'] for worker in workers),
+            'errors': sum(worker['errors'] for worker in workers),
+            'restarts': sum(worker['restarts'] for worker in workers),
+            'recycles': self.recycle_count,
+            'workers': workers,
+        }
+
+    def close(self):
+        with self._lock:
+            workers = list(self._assigned)
+            self.workers = []
+            self._assigned = {}
+            self._retiring = set()
+        for worker in workers:
+            worker.close()
+
+
+_sign_pool = None
+_sign_pool_lock = threading.Lock()
+
+
+def get_sign_pool():
+    """
+    获取全局签名进程池，首次调用时创建
+    """
+    global _sign_pool
+    if _sign_pool is None:
+        with _sign_pool_lock:
+            if _sign_pool is None:
+                _sign_pool = SignWorkerPool()
+    return _sign_pool
@@ -0,0 +1,90 @@
+import copy
+import threading
+
+
+class _Call:
+    """
+    一次正在进行的调用，其他线程等待它完成后共用结果
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        # 调用方可能会修改返回的数据，共用结果时返回副本
+        return copy.deepcopy(self.result)
+
+
+class SingleFlight:
+    """
+    相同key的并发调用只执行一次
+    第一个调用负责执行，执行期间到达的相同key的调用等待并共用它的结果；调用完成后不缓存结果
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.request_count = 0
+        self.coalesced_count = 0
+
+    def begin(self, key):
+        """
+        登记一次调用
+        :return: (call, leader)，leader为True时调用方负责执行并调用finish，否则调用call.wait()等待结果
+        """
+        with self._lock:
+            self.request_count += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced_count += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """
+        执行完成，唤醒等待的调用
+        等待方共用的是结果的私有副本，执行方之后修改返回的数据不会与等待方的复制同时进行
+        """
+        if error is None:
+            try:
+                result = copy.deepcopy(result)
+            except Exception as e:
+                error = e
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行 fn(*args, **kwargs)，相同key正在执行时等待并共用其结果
+        """
+        call, leader = self.begin(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result
+
+    def stats(self):
+        """
+        :return: 调用次数、与其他调用合并的次数和实际执行次数
+        """
+        with self._lock:
+            return {
+                'requests': self.request_count,
+                'coalesced': self.coalesced_count,
+                'executed': self.request_count - self.coalesced_count,
+                'in_flight': len(self._calls),
+            }
@@ -0,0 +1,45 @@
+import json
+import os
+import time
+from loguru import logger
+
+
+class SyncState:
+    """
+    记录每个用户上次全量同步的时间，保存在json文件中，程序重启后仍然有效
+    """
+    def __init__(self, path):
+        """
+        :param path: 状态文件路径
+        """
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except Exception as e:
+                logger.warning(f"读取同步状态文件 {path} 失败，将重新全量同步: {e}")
+
+    def needs_full_sync(self, user_id, interval_hours):
+        """
+        :param interval_hours: 全量同步间隔（小时），不大于0表示只在首次同步时全量
+        :return: 距上次全量同步是否已超过间隔
+        """
+        last_full_sync = self.state.get(user_id, {}).get('last_full_sync')
+        if last_full_sync is None:
+            return True
+        if interval_hours <= 0:
+            return False
+        return time.time() - last_full_sync >= interval_hours * 3600
+
+    def mark_full_sync(self, user_id):
+        """
+        记录用户完成了一次全量同步并写入文件
+        """
+        self.state.setdefault(user_id, {})['last_full_sync'] = time.time()
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"保存同步状态文件 {self.path} 失败: {e}")
@@ -1,18 +1,31 @@
 import json
 import math
+import os
 import random
-import execjs
+import threading
 from xhs_utils.cookie_util import trans_cookies
+from xhs_utils.sign_worker import get_sign_pool
+from xhs_utils.xray_pool import XrayTraceIdPool
 
-try:
-    js = execjs.compile(open(r'../static/xhs_xs_xsc_56.js', 'r', encoding='utf-8').read())
-except:
-    js = execjs.compile(open(r'static/xhs_xs_xsc_56.js', 'r', encoding='utf-8').read())
+STATIC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../static'))
+_js_runtimes = {}
+_js_runtimes_lock = threading.Lock()
 
-try:
-    xray_js = execjs.compile(open(r'../static/xhs_xray.js', 'r', encoding='utf-8').read())
-except:
-    xray_js = execjs.compile(open(r'static/xhs_xray.js', 'r', encoding='utf-8').read())
+def get_js_runtime(file_name):
+    """
+    获取execjs编译后的签名脚本，第一次使用时才读取并编译，默认的worker后端不会用到
+    :param file_name: static目录下的脚本文件名
+    """
+    runtime = _js_runtimes.get(file_name)
+    if runtime is None:
+        with _js_runtimes_lock:
+            runtime = _js_runtimes.get(file_name)
+            if runtime is None:
+                import execjs
+                with open(os.path.join(STATIC_PATH, file_name), 'r', encoding='utf-8') as f:
+                    runtime = execjs.compile(f.read())
+                _js_runtimes[file_name] = runtime
+    return runtime
 
 def generate_x_b3_traceid(len=16):
     x_b3_traceid = ""
@@ -20,18 +33,60 @@ def generate_x_b3_traceid(len=16):
         x_b3_traceid += "abcdef0123456789"[math.floor(16 * random.random())]
     return x_b3_traceid
 
+def use_sign_worker():
+    """
+    签名后端，SIGN_BACKEND=worker(默认)使用常驻node签名进程，execjs 则每次调用启动新的node进程
+    """
+    return os.getenv('SIGN_BACKEND', 'worker').strip().lower() != 'execjs'
+
 def generate_xs_xs_common(a1, api, data=''):
-    ret = js.call('get_request_headers_params', api, data, a1)
+    if use_sign_worker():
+        ret = get_sign_pool().call('get_request_headers_params', api, data, a1)
+    else:
+        ret = get_js_runtime('xhs_xs_xsc_56.js').call('get_request_headers_params', api, data, a1)
     xs, xt, xs_common = ret['xs'], ret['xt'], ret['xs_common']
     return xs, xt, xs_common
 
 def generate_xs(a1, api, data=''):
-    ret = js.call('get_xs', api, data, a1)
+    if use_sign_worker():
+        ret = get_sign_pool().call('get_xs', api, data, a1)
+    else:
+        ret = get_js_runtime('xhs_xs_xsc_56.js').call('get_xs', api, data, a1)
     xs, xt = ret['X-s'], ret['X-t']
     return xs, xt
 
+def generate_xray_traceid_batch(count):
+    """
+    一次JS调用批量生成x-xray-traceid
+    :param count: 数量
+    :return: traceId列表
+    """
+    if use_sign_worker():
+        return get_sign_pool().call('traceId_batch', count)
+    return get_js_runtime('xhs_xray.js').call('(function(n){var r=[];for(var i=0;i<n;i++){r.push(traceId())}return r})', count)
+
+xray_pool = XrayTraceIdPool(generate_xray_traceid_batch)
+
 def generate_xray_traceid():
-    return xray_js.call('traceId')
+    return xray_pool.get()
+
+def generate_xs_xs_common_batch(requests):
+    """
+    一次调用批量生成多个请求的签名
+    :param requests: (api, data, a1) 元组列表
+    :return: (xs, xt, xs_common, xray_traceid) 元组列表，顺序与requests一致
+    """
+    items = [[api, data, a1] for api, data, a1 in requests]
+    if not items:
+        return []
+    if use_sign_worker():
+        rets = get_sign_pool().call('sign_batch', items)
+    else:
+        # execjs 的 call 会把标识符原样拼进脚本，这里传入匿名函数，使整批签名只启动一次node进程
+        signs = get_js_runtime('xhs_xs_xsc_56.js').call('(function(items){return items.map(function(i){return get_request_headers_params(i[0], i[1], i[2])})})', items)
+        trace_ids = generate_xray_traceid_batch(len(items))
+        rets = [dict(sign, trace_id=trace_id) for sign, trace_id in zip(signs, trace_ids)]
+    return [(ret['xs'], ret['xt'], ret['xs_common'], ret['trace_id']) for ret in rets]
 def get_common_headers():
     return {
         "authority": "www.xiaohongshu.com",
@@ -50,7 +105,7 @@ def get_common_headers():
         "upgrade-insecure-requests": "1",
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
     }
-def get_request_headers_template():
+def get_request_headers_template(xray_traceid=None):
     return {
         "authority": "edith.xiaohongshu.com",
         "accept": "application/json, text/plain, */*",
@@ -71,7 +126,7 @@ def get_request_headers_template():
         "x-s": "",
         "x-s-common": "",
         "x-t": "",
-        "x-xray-traceid": generate_xray_traceid()
+        "x-xray-traceid": xray_traceid if xray_traceid else generate_xray_traceid()
     }
 
 def generate_headers(a1, api, data=''):
@@ -86,12 +141,43 @@ def generate_headers(a1, api, data=''):
         data = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
     return headers, data
 
+def generate_headers_batch(requests):
+    """
+    批量生成请求头，签名在一次JS调用中完成
+    :param requests: (api, data, a1) 元组列表
+    :return: (headers, data) 元组列表，顺序与requests一致
+    """
+    results = []
+    signs = generate_xs_xs_common_batch(requests)
+    for (api, data, a1), (xs, xt, xs_common, xray_traceid) in zip(requests, signs):
+        headers = get_request_headers_template(xray_traceid)
+        headers['x-s'] = xs
+        headers['x-t'] = str(xt)
+        headers['x-s-common'] = xs_common
+        headers['x-b3-traceid'] = generate_x_b3_traceid()
+        if data:
+            data = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+        results.append((headers, data))
+    return results
+
 def generate_request_params(cookies_str, api, data=''):
     cookies = trans_cookies(cookies_str)
     a1 = cookies['a1']
     headers, data = generate_headers(a1, api, data)
     return headers, cookies, data
 
+def generate_request_params_batch(cookies_str, requests):
+    """
+    同一个cookies下批量生成请求参数
+    :param cookies_str: 你的cookies
+    :param requests: (api, data) 元组列表
+    :return: (headers, cookies, data) 元组列表，顺序与requests一致
+    """
+    cookies = trans_cookies(cookies_str)
+    a1 = cookies['a1']
+    results = generate_headers_batch([(api, data, a1) for api, data in requests])
+    return [(headers, cookies, data) for headers, data in results]
+
 def splice_str(api, params):
     url = api + '?'
     for key, value in params.items():
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import deque
+from loguru import logger
+
+
+class XrayTraceIdPool:
+    """
+    x-xray-traceid 缓冲池
+    一次JS调用批量生成一批traceId放入缓冲区，取用时O(1)出队，
+    剩余数量低于水位线时在后台线程中异步补充
+    """
+    def __init__(self, generator, size=None, low_watermark=None, max_age=None):
+        """
+        :param generator: 批量生成函数，参数为数量，返回traceId列表
+        :param size: 每次补充后的缓冲区容量，为None时从环境变量XRAY_POOL_SIZE读取，默认200，最小为1
+        :param low_watermark: 低于该数量时触发后台补充，为None时从环境变量XRAY_POOL_LOW读取，默认50，不超过size
+        :param max_age: traceId中带有生成时间，超过该秒数的旧值会被丢弃，为None时从环境变量XRAY_POOL_MAX_AGE读取，默认300
+        """
+        self.generator = generator
+        # 容量至少为1，否则缓冲区永远为空，取用时会一直补充；水位线不超过容量，否则每次取用都会触发补充
+        self.size = max(1, size if size is not None else int(os.getenv('XRAY_POOL_SIZE', '200')))
+        self.low_watermark = min(self.size, low_watermark if low_watermark is not None else int(os.getenv('XRAY_POOL_LOW', '50')))
+        self.max_age = max_age if max_age is not None else float(os.getenv('XRAY_POOL_MAX_AGE', '300'))
+        self.refill_count = 0
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._refilling = False
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def get(self):
+        """
+        取出一个traceId，缓冲区为空时同步补充
+        """
+        while True:
+            try:
+                created_at, trace_id = self._buffer.popleft()
+            except IndexError:
+                # 按本次生成的数量判断，补充后的traceId可能已被其他线程取走，此时继续循环重新补充
+                if self.refill() == 0:
+                    raise RuntimeError('x-xray-traceid 生成结果为空')
+                continue
+            if time.time() - created_at > self.max_age:
+                continue
+            if len(self._buffer) < self.low_watermark:
+                self._refill_async()
+            return trace_id
+
+    def refill(self):
+        """
+        同步补充缓冲区至容量上限
+        :return: 本次生成的traceId数量，缓冲区已满不需要补充时返回None
+        """
+        with self._refill_lock:
+            missing = self.size - len(self._buffer)
+            if missing <= 0:
+                return None
+            start_time = time.time()
+            trace_ids = self.generator(missing)
+            created_at = time.time()
+            self._buffer.extend((created_at, trace_id) for trace_id in trace_ids)
+            self.refill_count += 1
+            logger.debug(f'x-xray-traceid 缓冲池补充 {len(trace_ids)} 个，耗时 {created_at - start_time:.3f} 秒')
+            return len(trace_ids)
+
+    def clear(self):
+        """
+        清空缓冲区，下次取用时重新生成
+        """
+        with self._refill_lock:
+            self._buffer.clear()
+
+    def _refill_async(self):
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill_worker, daemon=True).start()
+
+    def _refill_worker(self):
+        try:
+            self.refill()
+        except Exception as e:
+            logger.warning(f'x-xray-traceid 缓冲池后台补充失败: {e}')
+        finally:
+            with self._lock:
+                self._refilling = False